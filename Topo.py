@@ -4,32 +4,29 @@ from mininet.node import Controller, RemoteController, OVSKernelSwitch, \
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 from mininet.link import Link, TCLink
-import threading, random, time
+import threading, random, time, os, sys
 from utils import *
+import topogen
+import scenario
+
+# default fabric, see topogen.from_spec for the other ones (fat-tree:4, ...)
+FABRIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topologies', 'topo.fab')
+
+# without a scenario file, every T_CHBW seconds each link gets one of the
+# BANDWIDTH values at random, for SCENARIO_SECONDS
+SCENARIO_SECONDS = 24 * 3600
+
+# where the bandwidth changes really applied and the loads' throughput are recorded
+TRUTH_LOG = 'truth.jsonl'
 
-e_random_bw = None
-t_random_bw = None
-end = False
 link = None
-lock = threading.Lock()
 
-def create_topo():
-    global link, e_random_bw, end, lock
+def create_topo(fabric, events):
+    global link
     net = Mininet(controller=RemoteController, link=TCLink, switch=OVSSwitch)
 
-    # Creating hosts
-    host = {}
-    for i in range(1, 8):
-        host[i] = net.addHost(
-            name='h%s'%(i), 
-            mac='00:00:00:00:00:0%s'%(i),
-            ip='10.0.0.%s'%(i)
-        )
-    
-    # Creating Switches    
-    switch = {}
-    for i in range(1, 5):
-        switch[i] = net.addSwitch( name='s%s'%(i))
+    # Creating the switches, hosts and links of the fabric
+    switch, links = topogen.build_mininet(net, fabric, BANDWIDTH[0], TCLink)
 
     controller = net.addController(
         name='controller',
@@ -38,16 +35,7 @@ def create_topo():
         port=PORT_CONTROLLER,
     )
 
-    # Establishing connection via links
-    connections = [
-        (switch[1], host[1]), (switch[1], switch[3]), (switch[1], switch[2]),
-        (switch[2], host[2]), (switch[2], switch[3]), (switch[2], switch[4]),
-        (switch[3], host[3]), (switch[3], host[4]), (switch[3], switch[4]),
-        (switch[4], host[5]), (switch[4], host[6]), (switch[4], host[7]),
-    ]
-    link = {}
-    for i, item in enumerate(connections):
-        link[i] = net.addLink(item[0], item[1], cls=TCLink, bw=BANDWIDTH[0], loss=0)
+    link = dict(enumerate(links))
 
 
     net.build()
@@ -55,42 +43,29 @@ def create_topo():
     for _, item in switch.items():
         item.start([controller])
 
+    # playing the link bandwidth and traffic load scenario
+    truth = scenario.GroundTruth(TRUTH_LOG)
+    # the controller gets the links' real capacity, initial and changed ones
+    feed = scenario.CapacityFeed('http://%s:%d' % (IP_CONTROLLER, PORT_REST))
+    feed.send([(name, BANDWIDTH[0]) for name in topogen.link_names(fabric)])
+    driver = scenario.MininetDriver(net, fabric, links, truth, feed)
+    driver.start_servers()
+    player = scenario.ScenarioPlayer(events, driver.set_bandwidth, driver.start_load, truth)
+    player.start()
+
     CLI(net)
-    end = True
-    e_random_bw.set()
-    with lock:
-        print "net is done..."
-        net.stop()
-    
-def random_bandwidth():
-    global e_random_bw, lock, end, link
-    while True:
-        lock.acquire()
-        e_random_bw.wait(T_CHBW)
-        if end:
-            lock.release()
-            break
-        # TODO: randomly changing the Bandwidth of all Links.
-        for _, item in link.items():
-            # try:
-            #     cmd1, _ = item.intf1.bwCmds(bw=1)
-            #     cmd2, _ = item.intf2.bwCmds(bw=1)
-            #     outs = [item.intf1.tc(cmd1), item.intf2.tc(cmd2)]
-            #     for out in outs:
-            #         if out != '':
-            #             print " ********************* ERROR: %s"%out
-            # except Exception, e:
-            #     # lock.release()
-            #     print "hhhhhhooooooooshhhaaaaaaaaa ", e
-            rnd = random.randint(0, 1)
-            item.intf1.config(bw=BANDWIDTH[rnd])
-            item.intf2.config(bw=BANDWIDTH[rnd])
-        lock.release()
-    print "end of random bandwidth..."
+    player.stop()
+    driver.stop()
+    truth.close()
+    print("net is done...")
+    net.stop()
 
 if __name__ == '__main__':
     setLogLevel('info')
-    e_random_bw = threading.Event()
-    t_random_bw = threading.Thread(target=random_bandwidth)
-    t_random_bw.start()
-    create_topo()
\ No newline at end of file
+    fabric = topogen.from_spec(sys.argv[1] if len(sys.argv) > 1 else FABRIC)
+    if len(sys.argv) > 2:
+        events = scenario.load(sys.argv[2])
+    else:
+        events = scenario.random_flips(topogen.link_names(fabric), BANDWIDTH, T_CHBW,
+                                       SCENARIO_SECONDS, random.Random())
+    create_topo(fabric, events)
\ No newline at end of file
@@ -0,0 +1,41 @@
+from ryu.lib.packet import packet, ethernet, arp, ether_types
+
+
+# Proxy-ARP responder.
+# It learns ip -> mac from the senders of all ARP packets it sees, and
+# answers ARP requests for known hosts itself, so they don't have to be
+# flooded. This is where packet-in data is fully parsed, for ARP only.
+class ArpProxy(object):
+
+    def __init__(self):
+        # ip_to_mac[ip] -> mac
+        self.ip_to_mac = {}
+        self.replies = 0
+
+    # handles an ARP packet-in. 'known' is a function telling whether a mac
+    # belongs to a host the controller knows about. Returns the data of the
+    # ARP reply to send back to the requester, or None if the request has to
+    # be flooded (or the packet isn't a request).
+    def handle(self, data, known):
+        pkt = packet.Packet(data)
+        arp_pkt = pkt.get_protocol(arp.arp)
+        if arp_pkt is None:
+            return None
+        if arp_pkt.src_ip != '0.0.0.0':
+            self.ip_to_mac[arp_pkt.src_ip] = arp_pkt.src_mac
+        # gratuitous ARPs just announce the sender, there's nothing to answer
+        if arp_pkt.opcode != arp.ARP_REQUEST or arp_pkt.dst_ip == arp_pkt.src_ip:
+            return None
+        mac = self.ip_to_mac.get(arp_pkt.dst_ip)
+        if mac is None or not known(mac):
+            return None
+
+        reply = packet.Packet()
+        reply.add_protocol(ethernet.ethernet(
+            ethertype=ether_types.ETH_TYPE_ARP, dst=arp_pkt.src_mac, src=mac))
+        reply.add_protocol(arp.arp(
+            opcode=arp.ARP_REPLY, src_mac=mac, src_ip=arp_pkt.dst_ip,
+            dst_mac=arp_pkt.src_mac, dst_ip=arp_pkt.src_ip))
+        reply.serialize()
+        self.replies += 1
+        return reply.data
@@ -0,0 +1,193 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import routing
+import topogen
+from harness import AppHarness
+from topology import Topology
+
+
+# Offline benchmarks of the routing code and of the controllers' packet-in
+# handling, on generated topologies (see topogen.py).
+#
+# The 'routing' benchmark builds the path table and looks paths up the way
+# get_path does. The controller benchmarks ('new_controller', 'controller')
+# need ryu to be installed (without it, they're reported as SKIPPED, or fail
+# if they were asked for with --bench): they instantiate the app through
+# harness.py, feed it the switches and links of the topology as events,
+# then replay a packet-in trace through it, with fake datapaths which count
+# the messages sent to them and answer the barrier requests once the
+# handler has returned.
+#
+# Results can be saved as JSON and compared with a previous run:
+#   python bench.py --topo fat-tree:4 --topo leaf-spine:16x4 --save new.json --compare old.json
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_stats(latencies, elapsed):
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_us': percentile(latencies, 0.5) * 1e6,
+        'p90_us': percentile(latencies, 0.9) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        'max_us': max(latencies) * 1e6 if latencies else 0.0,
+    }
+
+
+# random (src host, dst host) pairs of the fabric
+def host_pairs(fabric, count, seed=0):
+    rand = random.Random(seed)
+    hosts = fabric.hosts
+    pairs = []
+    while len(pairs) < count and len(hosts) > 1:
+        src, dst = rand.sample(hosts, 2)
+        pairs.append((src, dst))
+    return pairs
+
+
+def bench_routing(fabric, pairs):
+    tracemalloc.start()
+    start = time.time()
+    topology = Topology()
+    for s1, p1, s2, p2 in fabric.links:
+        topology.add_link(s1, s2, p1)
+        topology.add_link(s2, s1, p2)
+    path_table = routing.PathTable(topology.neighbors)
+    path_table.rebuild(topology.switches())
+    build = time.time() - start
+    path_cache = routing.PathCache(1024)
+
+    latencies = []
+    start = time.time()
+    for (_, _, src_sw, src_port), (_, _, dst_sw, dst_port) in pairs:
+        t = time.time()
+        r = path_cache.get(src_sw, dst_sw)
+        if r is None:
+            path = path_table.path(src_sw, dst_sw)
+            r = routing.add_ports(path, topology.port, None, None) if path else []
+            path_cache.put(src_sw, dst_sw, r)
+        if r:
+            routing.set_host_ports(r, src_port, dst_port)
+        latencies.append(time.time() - t)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = latency_stats(latencies, elapsed)
+    result.update({'build_s': build, 'peak_kb': peak / 1024.0, 'cache': path_cache.stats()})
+    return result
+
+
+def bench_controller(name, fabric, pairs, workers=0):
+    harness = AppHarness(name, fabric, workers)
+    tracemalloc.start()
+    harness.connect()
+    harness.learn_hosts()
+    sent = harness.sent
+    setup = dict(sent)
+    sent.clear()
+
+    latencies = []
+    start = time.time()
+    for src, dst in pairs:
+        t = time.time()
+        harness.packet(src, dst)
+        latencies.append(time.time() - t)
+        harness.reply_barriers()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    harness.close()
+
+    result = latency_stats(latencies, elapsed)
+    result.update({
+        'peak_kb': peak / 1024.0,
+        'messages': sent,
+        'flowmods': sent.get('OFPFlowMod', 0),
+        'flowmods_per_packet_in': sent.get('OFPFlowMod', 0) / float(len(pairs) or 1),
+        'setup_messages': setup,
+    })
+    return result
+
+
+# prints the ops/sec and p99 latency changes of the cases found in both runs
+def compare(results, baseline):
+    for case, result in sorted(results.items()):
+        old = baseline.get(case)
+        if old is None or 'ops_per_sec' not in old or 'ops_per_sec' not in result:
+            continue
+        speedup = result['ops_per_sec'] / old['ops_per_sec'] if old['ops_per_sec'] else 0.0
+        print('%-50s ops/sec x%.2f  p99 %.1fus -> %.1fus' % (
+            case, speedup, old['p99_us'], result['p99_us']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='routing and packet-in benchmarks')
+    parser.add_argument('--topo', action='append',
+                        help='topology spec or file, see topogen.from_spec (repeatable)')
+    parser.add_argument('--bench', action='append',
+                        choices=['routing', 'new_controller', 'controller'],
+                        help='benchmarks to run (repeatable, all by default)')
+    parser.add_argument('--pairs', type=int, default=10000, help='packet-ins/lookups per case')
+    parser.add_argument('--workers', type=int, default=0, help='ROUTE_WORKERS of the controllers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='file to save the results to, as JSON')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    topos = args.topo or ['fat-tree:4', 'leaf-spine:16x4', 'random:100', 'jellyfish:100', 'torus:8x8',
+                          'fat-tree:16', 'random:1000']
+    benches = args.bench or ['routing', 'new_controller', 'controller']
+    results = {}
+    skipped = 0
+    for spec in topos:
+        fabric = topogen.from_spec(spec)
+        pairs = host_pairs(fabric, args.pairs, args.seed)
+        for bench in benches:
+            case = '%s/%s' % (fabric.name, bench)
+            gc.collect()
+            try:
+                if bench == 'routing':
+                    result = bench_routing(fabric, pairs)
+                else:
+                    result = bench_controller(bench, fabric, pairs, args.workers)
+            except ImportError as e:
+                # a benchmark which was asked for and can't run is an error,
+                # the default ones are skipped, but loudly
+                if args.bench:
+                    sys.stderr.write('%s: cannot run, %s\n' % (case, e))
+                    return 1
+                sys.stderr.write('%-50s SKIPPED (%s)\n' % (case, e))
+                results[case] = {'skipped': str(e)}
+                skipped += 1
+                continue
+            result.update({'switches': len(fabric.switches), 'links': len(fabric.links),
+                           'hosts': len(fabric.hosts)})
+            results[case] = result
+            print('%-50s %10.0f ops/s  p50 %8.1fus  p99 %8.1fus  peak %8.0fKB' % (
+                case, result['ops_per_sec'], result['p50_us'], result['p99_us'], result['peak_kb']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if skipped:
+        sys.stderr.write('%d benchmarks SKIPPED, see above\n' % skipped)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import routing
+from flows import delete_by_cookie, make_cookie, COOKIE_FLOOD
+
+# group used for flooding on every switch
+FLOOD_GROUP_ID = 0xffff0000
+# cookie of the broadcast flow entries, so they can be replaced all at once
+FLOOD_COOKIE = make_cookie(COOKIE_FLOOD)
+BROADCAST_MAC = 'ff:ff:ff:ff:ff:ff'
+# port numbers above this one are reserved (CONTROLLER, LOCAL, ...)
+OFPP_MAX = 0xffffff00
+
+
+# Broadcasts over a spanning tree of the topology instead of OFPP_FLOOD.
+# Every switch gets an OFPGT_ALL group whose buckets are its host ports plus
+# its spanning tree ports, and flow entries sending broadcasts coming from
+# tree ports to that group (and dropping those coming from other switch
+# links), so broadcasts travel the tree in the data plane and can't loop.
+# Broadcasts from hosts still reach the controller (table-miss), which can
+# answer ARP requests itself or flood them through the group.
+class BroadcastTree(object):
+
+    def __init__(self, topology):
+        self.topology = topology
+        # ports[dpid] -> set of the switch port numbers
+        self.ports = {}
+        # tree_ports[dpid] -> set of the switch ports on the spanning tree
+        self.tree_ports = {}
+        # installed[dpid] -> (flood ports, tree ports, other link ports) on the switch
+        self.installed = {}
+        self.epoch = None
+        self.dirty = True
+        # switches which are new, connected again or whose ports changed since
+        # the last sync, the only ones to check while the tree stays the same
+        self.changed = set()
+
+    def set_ports(self, dpid, ports):
+        self.ports[dpid] = set(p for p in ports if p <= OFPP_MAX)
+        self.changed.add(dpid)
+
+    def add_port(self, dpid, port):
+        if port <= OFPP_MAX:
+            self.ports.setdefault(dpid, set()).add(port)
+            self.changed.add(dpid)
+
+    def remove_port(self, dpid, port):
+        self.ports.get(dpid, set()).discard(port)
+        self.changed.add(dpid)
+
+    def remove_switch(self, dpid):
+        self.ports.pop(dpid, None)
+        self.installed.pop(dpid, None)
+        self.dirty = True
+
+    # to be called when a switch connects, its group and entries are gone
+    def reset_switch(self, dpid):
+        self.installed.pop(dpid, None)
+        self.changed.add(dpid)
+
+    # recomputes the spanning tree if the topology has changed since last time
+    def update(self, epoch):
+        if epoch == self.epoch and not self.dirty:
+            return
+        self.epoch = epoch
+        self.dirty = False
+        self.tree_ports = {}
+        port = self.topology.port
+        for u, v in routing.spanning_tree(self.topology.switches(), self.topology.neighbors):
+            self.tree_ports.setdefault(u, set()).add(port(u, v))
+            if port(v, u) is not None:
+                self.tree_ports.setdefault(v, set()).add(port(v, u))
+
+    # ports a broadcast has to be sent to on the given switch
+    def flood_ports(self, dpid):
+        link_ports = set(self.topology.port(dpid, v) for v, _ in self.topology.neighbors(dpid))
+        return (self.ports.get(dpid, set()) - link_ports) | self.tree_ports.get(dpid, set())
+
+    # Brings the groups and flow entries of the switches up to date. This is
+    # done on every flood, so unless the topology has changed, only the
+    # switches which have changed themselves are looked at.
+    # 'datapaths' is the DatapathRegistry of the connected switches.
+    def sync(self, datapaths, epoch):
+        if epoch == self.epoch and not self.dirty:
+            if not self.changed:
+                return
+            changed, self.changed = self.changed, set()
+            datapaths = [datapaths.get(dpid) for dpid in changed if dpid in datapaths]
+        else:
+            self.changed = set()
+            self.update(epoch)
+        for datapath in datapaths:
+            dpid = datapath.id
+            if dpid not in self.ports:
+                continue
+            tree_ports = self.tree_ports.get(dpid, set())
+            link_ports = set(self.topology.port(dpid, v) for v, _ in self.topology.neighbors(dpid))
+            state = (frozenset(self.flood_ports(dpid)), frozenset(tree_ports),
+                     frozenset(link_ports - tree_ports))
+            if self.installed.get(dpid) != state:
+                self._install(datapath, state, dpid in self.installed)
+                self.installed[dpid] = state
+
+    # actions to flood a packet-out on the given switch
+    def actions(self, datapath):
+        parser = datapath.ofproto_parser
+        if datapath.id not in self.installed:
+            # the switch ports aren't known yet, falling back to plain flooding
+            return [parser.OFPActionOutput(datapath.ofproto.OFPP_FLOOD)]
+        return [parser.OFPActionGroup(FLOOD_GROUP_ID)]
+
+    def _install(self, datapath, state, replace):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        flood_ports, tree_ports, other_ports = state
+
+        buckets = [parser.OFPBucket(actions=[parser.OFPActionOutput(port)])
+                   for port in sorted(flood_ports)]
+        command = ofproto.OFPGC_MODIFY if replace else ofproto.OFPGC_ADD
+        datapath.send_msg(parser.OFPGroupMod(datapath, command, ofproto.OFPGT_ALL,
+                                             FLOOD_GROUP_ID, buckets))
+
+        # removing the old broadcast entries, then adding the new ones
+        if replace:
+            datapath.send_msg(delete_by_cookie(datapath, FLOOD_COOKIE))
+        for port in sorted(tree_ports):
+            match = parser.OFPMatch(in_port=port, eth_dst=BROADCAST_MAC)
+            actions = [parser.OFPActionGroup(FLOOD_GROUP_ID)]
+            inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+            datapath.send_msg(parser.OFPFlowMod(
+                datapath=datapath, cookie=FLOOD_COOKIE, match=match,
+                priority=1, instructions=inst))
+        # broadcasts coming from links which are not on the tree are dropped
+        for port in sorted(other_ports):
+            match = parser.OFPMatch(in_port=port, eth_dst=BROADCAST_MAC)
+            datapath.send_msg(parser.OFPFlowMod(
+                datapath=datapath, cookie=FLOOD_COOKIE, match=match,
+                priority=1, instructions=[]))
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+
+import emulator
+import topogen
+from utils import CONTROLLERS, IP_CONTROLLER, PORT_CONTROLLER
+
+
+# cbench-style measurement of the flow setup rate and latency of the controllers.
+# The switches of the emulator (see emulator.py) connect to the controllers and
+# the hosts get learned, then every edge switch sends packet-ins of new flows,
+# as if a frame from a new source mac (to a known host) had missed its table.
+# Each packet-in is timestamped, and so are the messages sent in response:
+# the FlowMods matching the flow's macs, on any switch, and the PacketOut
+# carrying the frame back (found by the sequence number in its payload).
+# The flow setup latency is the time from the packet-in to the last of them.
+#
+# Two load profiles, as in cbench:
+#   latency     one packet-in in flight per switch, the next one is sent once
+#               the PacketOut of the previous one came back
+#   throughput  'window' packet-ins in flight per switch
+#
+# The throughput is reported as responses (FlowMods and PacketOuts) and flows
+# set up per second over each of the 'loops' intervals. Packet-outs are not
+# forwarded during the measurement, so the responses don't cause more
+# packet-ins (LLDP probes still are, so the links stay up).
+#
+#   ryu-manager --observe-links new_controller.py
+#   python3 cbench.py --mode throughput --topo leaf-spine:32x4 --loops 10
+
+
+class Cbench(object):
+
+    def __init__(self, emu, mode='throughput', window=64, macs=1000, timeout=1.0):
+        self.emu = emu
+        self.mode = mode
+        self.window = window if mode == 'throughput' else 1
+        # source macs used by each switch, in turn
+        self.macs = max(macs, self.window)
+        self.timeout = timeout
+        emu.on_message = self.message
+        # edges[dpid] -> (switch, host ports) of the switches with hosts
+        self.edges = {}
+        for switch in emu.switches.values():
+            ports = [port.number for port in switch.ports.values()
+                     if isinstance(port.peer, emulator.EmulatedHost)]
+            if ports:
+                self.edges[switch.dpid] = (switch, ports)
+        # flows[seq] -> [dpid, time sent, time of the PacketOut, time of the last FlowMod]
+        self.flows = {}
+        # the flows still waiting for their PacketOut, by seq
+        self.waiting = {}
+        # by_pair[(src mac, dst mac)] -> seq of the last flow between them
+        self.by_pair = {}
+        # packet-ins in flight per switch, by dpid
+        self.in_flight = {}
+        # number of packet-ins sent by each switch, to pick the next source mac
+        self.sent = {}
+        self.next_seq = 1
+        self.flow_mods = 0
+        self.packet_outs = 0
+        self.completed = 0
+        self.lost = 0
+        self.running = False
+        # (responses per second, flows per second) of each loop
+        self.intervals = []
+
+    def source(self, switch):
+        i = self.sent.get(switch.dpid, 0)
+        self.sent[switch.dpid] = i + 1
+        k = i % self.macs
+        dpid = switch.dpid & 0xffffff
+        mac = b'\x0e' + struct.pack('!I', dpid)[1:] + struct.pack('!H', k)
+        ip = struct.pack('!BBBB', 11, (dpid >> 8) & 0xff, dpid & 0xff, k & 0xff)
+        return mac, ip
+
+    def send(self, switch, ports):
+        rand = self.emu.rand
+        src_mac, src_ip = self.source(switch)
+        # a known host behind another switch, if there's one
+        dst = rand.choice(self.emu.hosts)
+        for _ in range(8):
+            if dst.switch is not switch:
+                break
+            dst = rand.choice(self.emu.hosts)
+        seq = self.next_seq
+        self.next_seq += 1
+        now = time.time()
+        self.flows[seq] = self.waiting[seq] = [switch.dpid, now, None, None]
+        self.by_pair[(src_mac, dst.mac)] = seq
+        self.in_flight[switch.dpid] = self.in_flight.get(switch.dpid, 0) + 1
+        data = emulator.udp_frame(src_mac, src_ip, dst.mac, dst.ip, seq, now)
+        switch.packet_in(rand.choice(ports), data, emulator.OFPR_NO_MATCH, 0)
+
+    def fill(self, switch, ports):
+        while self.running and self.in_flight.get(switch.dpid, 0) < self.window:
+            self.send(switch, ports)
+
+    def message(self, switch, msg_type, body):
+        now = time.time()
+        if msg_type == emulator.OFPT_FLOW_MOD:
+            match = emulator.parse_match(body, emulator._flow_mod.size)[0]
+            src, dst = match.get(emulator.OXM_ETH_SRC), match.get(emulator.OXM_ETH_DST)
+            if src is None or dst is None:
+                return
+            seq = self.by_pair.get((src[0], dst[0]))
+            if seq is not None:
+                self.flow_mods += 1
+                self.flows[seq][3] = now
+        elif msg_type == emulator.OFPT_PACKET_OUT:
+            actions_len = emulator._packet_out.unpack_from(body)[2]
+            data = body[emulator._packet_out.size + actions_len:]
+            if len(data) < 42 + emulator._payload.size or data[12:14] != emulator.ETH_TYPE_IP:
+                return
+            flow = self.waiting.pop(emulator._payload.unpack_from(data, 42)[0], None)
+            if flow is None:
+                return
+            self.packet_outs += 1
+            flow[2] = now
+            self.completed += 1
+            self.done(flow[0])
+
+    # a packet-in of the switch got its response (or timed out)
+    def done(self, dpid):
+        self.in_flight[dpid] -= 1
+        # the next one is sent later in the event loop, not from within the message handler
+        self.emu.loop.call_soon(self.fill, *self.edges[dpid])
+
+    async def expire(self):
+        while self.running:
+            await asyncio.sleep(self.timeout / 4)
+            now = time.time()
+            for seq in [seq for seq, flow in self.waiting.items() if now - flow[1] > self.timeout]:
+                self.lost += 1
+                self.done(self.waiting.pop(seq)[0])
+
+    async def run(self, loops=10, interval=1.0):
+        self.emu.forwarding = False
+        self.running = True
+        expiry = asyncio.ensure_future(self.expire())
+        for switch, ports in self.edges.values():
+            self.fill(switch, ports)
+        for _ in range(loops):
+            responses, completed, start = self.flow_mods + self.packet_outs, self.completed, time.time()
+            await asyncio.sleep(interval)
+            elapsed = time.time() - start
+            self.intervals.append(((self.flow_mods + self.packet_outs - responses) / elapsed,
+                                   (self.completed - completed) / elapsed))
+        self.running = False
+        # the late FlowMods of the last flows
+        await asyncio.sleep(self.timeout)
+        expiry.cancel()
+
+    def report(self, controller_pid=None):
+        packet_out = [flow[2] - flow[1] for flow in self.flows.values() if flow[2] is not None]
+        last = [max(flow[2], flow[3] or 0) - flow[1] for flow in self.flows.values()
+                if flow[2] is not None]
+        responses = [r for r, _ in self.intervals]
+        flows = [f for _, f in self.intervals]
+        result = {
+            'mode': self.mode,
+            'topology': self.emu.fabric.name,
+            'switches': len(self.edges),
+            'window': self.window,
+            'packet_ins': len(self.flows),
+            'completed': self.completed,
+            'lost': self.lost,
+            'flow_mods': self.flow_mods,
+            'packet_outs': self.packet_outs,
+            'responses_per_sec': responses,
+            'responses_per_sec_min': min(responses) if responses else 0.0,
+            'responses_per_sec_max': max(responses) if responses else 0.0,
+            'responses_per_sec_avg': sum(responses) / len(responses) if responses else 0.0,
+            'flows_per_sec_avg': sum(flows) / len(flows) if flows else 0.0,
+            'packet_out_p50_ms': emulator.percentile(packet_out, 0.5) * 1e3,
+            'packet_out_p99_ms': emulator.percentile(packet_out, 0.99) * 1e3,
+            'flow_setup_p50_ms': emulator.percentile(last, 0.5) * 1e3,
+            'flow_setup_p90_ms': emulator.percentile(last, 0.9) * 1e3,
+            'flow_setup_p99_ms': emulator.percentile(last, 0.99) * 1e3,
+        }
+        if controller_pid:
+            result['controller_rss_kb'] = emulator.rss_kb(controller_pid)
+        return result
+
+
+async def measure(emu, bench, warmup, loops, interval):
+    await emu.setup(warmup)
+    try:
+        await bench.run(loops, interval)
+    finally:
+        emu.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cbench-style flow setup measurement')
+    parser.add_argument('--mode', choices=['latency', 'throughput'], default='throughput')
+    parser.add_argument('--topo', default='leaf-spine:16x2', help='topology spec or file, see topogen.from_spec')
+    parser.add_argument('--controller', action='append', type=emulator.parse_address,
+                        help='HOST:PORT of a controller (repeatable), by default the '
+                             'CONTROLLERS instances of utils.py')
+    parser.add_argument('--window', type=int, default=64, help='packet-ins in flight per switch (throughput)')
+    parser.add_argument('--macs', type=int, default=1000, help='source macs per switch')
+    parser.add_argument('--loops', type=int, default=10)
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds per loop')
+    parser.add_argument('--warmup', type=float, default=30.0,
+                        help='max seconds to wait for the links to be discovered')
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds before a packet-in is lost')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--controller-pid', type=int, help='pid of ryu-manager, to report its memory')
+    parser.add_argument('--save', help='file to save the report to, as JSON')
+    args = parser.parse_args(argv)
+
+    controllers = args.controller or [(IP_CONTROLLER, PORT_CONTROLLER + i) for i in range(CONTROLLERS)]
+    emu = emulator.Emulator(topogen.from_spec(args.topo), controllers, rate=0, seed=args.seed)
+    bench = Cbench(emu, args.mode, args.window, args.macs, args.timeout)
+    asyncio.run(measure(emu, bench, args.warmup, args.loops, args.interval))
+    result = bench.report(args.controller_pid)
+    result['setup'] = emu.report()
+    print(json.dumps(result, indent=2, sort_keys=True))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
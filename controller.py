@@ -1,97 +1,259 @@
 
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
+from ryu.lib import hub
 from ryu.topology import event
-from ryu.topology.api import get_all_link, get_all_switch
-from ryu.lib.packet import ethernet, ether_types
-import copy
-
-
-switches = []
-links = []
-sw_topo = []
+from ryu.app.wsgi import WSGIApplication
+import routing
+import fastpath
+from topology import Topology
+from datapaths import DatapathRegistry
+from flows import PathInstaller, FlowRegistry
+import flows
+from pending import PendingInstalls, RateLimiter
+from arp import ArpProxy
+from monitor import PortMonitor
+from network import Network
+from workers import RouteWorkers
+from hosts import HostTracker
+from metrics import Metrics, Profiler
+from rest import MetricsController, LinkController
+from utils import ADAPTIVE_WEIGHTS, LINK_CAPACITY, WEIGHT_LOG
+
+
+# switches[dpid] -> ryu Switch object
+switches = {}
+# links[(src_dpid, dst_dpid)] -> link dict
+links = {}
+# switches and links graph, with the link weights
+topology = Topology()
+
+# all-pairs shortest path table, repaired whenever the topology is updated
+path_table = routing.PathTable(topology.neighbors)
+
+# cache of paths between hot switch pairs, invalidated on topology updates
+path_cache = routing.PathCache(1024)
+
+# counters and histograms, served at /metrics
+metrics = Metrics()
+
+# 'path' installs exact-match rules along the path of each (src, dst) pair,
+# 'ecmp' installs (src, dst) rules spreading flows over all the equal-cost paths,
+# 'destination' installs one rule per destination host on every switch
+ROUTING_MODE = 'path'
+
+# seconds after which unused path/destination/ecmp flow entries expire, 0 for never
+IDLE_TIMEOUT = 30
+
+# in 'destination' mode, also install backup next hops in fast-failover groups,
+# so the switches themselves reroute around a failed link
+FAST_FAILOVER = True
+
+# worker processes computing the path table's trees off the event loop, 0 for none
+ROUTE_WORKERS = 2
+
+# fraction of the packet-ins run under the profiler, served at /metrics/profile
+PROFILE_RATE = 0.0
+
+
+# applies the queued topology changes to the path table, timing the dijkstra runs
+def flush_paths():
+    start = time.time()
+    if path_table.flush(topology.switches):
+        metrics.observe('dijkstra_seconds', time.time() - start)
 
 
 class Controller(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
-    sw_update_events = [event.EventSwitchEnter, event.EventSwitchLeave]
-    links_update_events = [event.EventLinkAdd, event.EventLinkDelete]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(Controller, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
+        self.hosts = HostTracker(topology.is_link_port, on_move=self._host_moved)
+        self.datapaths = DatapathRegistry()
+        self.installer = PathInstaller(metrics)
+        self.pending = PendingInstalls()
+        self.limiter = RateLimiter()
+        self.arp = ArpProxy()
+        self.flows = FlowRegistry()
+        self.monitor = PortMonitor(topology, self.set_link_weight, capacity=LINK_CAPACITY,
+                                   weight_log=WEIGHT_LOG)
+        # topology updates, flood tree and 'destination' and 'ecmp' modes
+        self.network = Network(topology, path_table, path_cache, flush_paths, self.hosts,
+                               self.datapaths, self.installer, self.pending, self.limiter,
+                               self.monitor, metrics, ROUTING_MODE, IDLE_TIMEOUT, FAST_FAILOVER)
+        self.hosts.on_forget = self.network.host_forgotten
+        self.monitor_thread = hub.spawn(self._monitor)
+        path_table.workers = RouteWorkers(topology, ROUTE_WORKERS, hub.sleep)
+        self.profiler = Profiler(PROFILE_RATE)
+        metrics.add_source('path_cache', path_cache.stats)
+        metrics.add_source('installer', self.installer.stats)
+        metrics.add_source('controller', lambda: {
+            'switches': len(topology),
+            'links': topology.num_links(),
+            'hosts': len(self.hosts),
+            'flows': len(self.flows.flows),
+            'coalesced': self.pending.coalesced,
+            'rate_limited': self.limiter.dropped,
+            'profiled': self.profiler.samples,
+        })
+        kwargs['wsgi'].register(MetricsController, {'metrics': metrics, 'profiler': self.profiler})
+        kwargs['wsgi'].register(LinkController, {'set_capacity': self.set_link_capacity})
+
+    def close(self):
+        path_table.workers.close()
+        self.monitor.close()
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def _switch_features_handler(self, ev):
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
-                                             actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=0, command=ofproto.OFPFC_ADD,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
-
-
-    def update_topology(self):
-        global sw_topo, switches, links
-
-        sw_cnt = len(switches)
-        tmp_sw_topo = [ [None for i in range(sw_cnt)] for j in range(sw_cnt) ]
-        for link in links:
-            tmp_sw_topo[link['src_dpid']-1][link['dst_dpid']-1] = link['src_port_no']
-            tmp_sw_topo[link['dst_dpid']-1][link['src_dpid']-1] = link['dst_port_no']
-        sw_topo = copy.deepcopy(tmp_sw_topo)
-        # print(sw_topo)
+        # entries and groups left from a previous connection are deleted,
+        # and the table-miss entry is added
+        self.network.reset_switch(ev.msg.datapath)
+
+
+    # The topology handlers below apply only the change carried by each event.
+    # Path table repairs are queued and applied on the next path lookup, so
+    # a storm of discovered links costs a single update.
+    @set_ev_cls(event.EventSwitchEnter)
+    def _switch_enter_handler(self, ev):
+        sw = ev.switch
+        self.logger.info("switch entered: %s", sw.dp.id)
+        metrics.inc('switch_enter')
+        switches[sw.dp.id] = sw
+        self.datapaths.register(sw.dp)
+        self.network.add_switch(sw.dp.id, [port.port_no for port in sw.ports])
+
+
+    # ryu reports a new connection of a switch it already knows with this
+    # event, and sends no leave for the old connection, whose datapath has
+    # to be replaced here
+    @set_ev_cls(event.EventSwitchReconnected)
+    def _switch_reconnected_handler(self, ev):
+        sw = ev.switch
+        self.logger.info("switch reconnected: %s", sw.dp.id)
+        metrics.inc('switch_reconnect')
+        switches[sw.dp.id] = sw
+        # the barrier replies of the old connection will never come
+        self.installer.abandon(sw.dp.id)
+        self.datapaths.register(sw.dp)
+        self.network.flood.set_ports(sw.dp.id, [port.port_no for port in sw.ports])
+        # the entries of the switch were deleted when it connected again,
+        # the destination trees have to be installed again
+        path_cache.bump_epoch()
+
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def _switch_leave_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self.logger.info("switch left: %s", dpid)
+        metrics.inc('switch_leave')
+        self.datapaths.unregister(ev.switch.dp)
+        # a stale leave event must not remove a reconnected switch
+        if dpid in self.datapaths:
+            return
+        for cookie, path in self.flows.remove_switch(dpid):
+            self.flows.delete_rules(self.datapaths, path, cookie)
+        switches.pop(dpid, None)
+        for key in [key for key in links if dpid in key]:
+            del links[key]
+        self.network.remove_switch(dpid)
+
+
+    @set_ev_cls(event.EventPortAdd)
+    def _port_add_handler(self, ev):
+        metrics.inc('port_events')
+        self.network.flood.add_port(ev.port.dpid, ev.port.port_no)
+
+
+    @set_ev_cls(event.EventPortDelete)
+    def _port_delete_handler(self, ev):
+        metrics.inc('port_events')
+        self.network.flood.remove_port(ev.port.dpid, ev.port.port_no)
+        self._remove_hosts(ev.port.dpid, ev.port.port_no)
+
+
+    @set_ev_cls(event.EventPortModify)
+    def _port_modify_handler(self, ev):
+        metrics.inc('port_events')
+        if ev.port.is_down():
+            self._remove_hosts(ev.port.dpid, ev.port.port_no)
+
+
+    @set_ev_cls(event.EventLinkAdd)
+    def _link_add_handler(self, ev):
+        link = ev.link
+        l = {
+                'src_dpid': link.src.dpid,
+                'dst_dpid': link.dst.dpid,
+                'src_port_no': link.src.port_no,
+                'dst_port_no': link.dst.port_no,
+                'weight' : 1 # updated by the monitor from the port stats
+            }
+        self.logger.debug("link added: %s", l)
+        metrics.inc('link_add')
+        # a link seen again keeps its weight
+        old = links.get((l['src_dpid'], l['dst_dpid']))
+        if old is not None and old['src_port_no'] == l['src_port_no']:
+            l['weight'] = old['weight']
+        links[(l['src_dpid'], l['dst_dpid'])] = l
+        self.network.add_link(l['src_dpid'], l['dst_dpid'], l['src_port_no'], l['dst_port_no'])
+
+
+    @set_ev_cls(event.EventLinkDelete)
+    def _link_delete_handler(self, ev):
+        src_dpid, dst_dpid = ev.link.src.dpid, ev.link.dst.dpid
+        self.logger.debug("link deleted: %s -> %s", src_dpid, dst_dpid)
+        metrics.inc('link_delete')
+        links.pop((src_dpid, dst_dpid), None)
+        self.network.remove_link(src_dpid, dst_dpid)
+        # the flows using the link have to be moved off it right away
+        if ROUTING_MODE == 'path':
+            self.reroute(src_dpid, dst_dpid)
+
+
+    # polls the port stats of all switches, a batch at a time
+    def _monitor(self):
+        while True:
+            for _ in self.monitor.poll(self.datapaths):
+                hub.sleep(0)
+            self.hosts.expire()
+            hub.sleep(self.monitor.interval)
 
-    
-    @set_ev_cls(sw_update_events)
-    def _get_all_switches(self, ev):
-        global switches
-        print( "getting all switches ...")
 
-        switches = get_all_switch(self)
-        sw_ids = []
-        for sw in switches:
-            sw_ids.append(sw.dp.id)
-        print( "Switches: " , sw_ids)
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        self.monitor.port_stats(ev.msg.datapath.id, ev.msg.body)
 
-        self.update_topology()
 
-    
-    @set_ev_cls(links_update_events)
-    def _get_all_links(self, ev):
-        global links
-        print( "getting all links ...")
-
-        tmp = get_all_link(self)
-        tmp_links = [
-                        {
-                            'src_dpid': link.src.dpid,
-                            'dst_dpid': link.dst.dpid,
-                            'src_port_no': link.src.port_no,
-                            'dst_port_no': link.dst.port_no,
-                            'weight' : 1 # don't forget to change this!
-                        }
-                        for link in tmp
-                    ]
-        links = copy.deepcopy(tmp_links)
-        print( "Links: ")
-        for link in links:
-            print(link)
-
-        self.update_topology()
+    # sets the capacity of the link src->dst, from the REST API
+    def set_link_capacity(self, src_dpid, dst_dpid, mbps):
+        self.monitor.set_capacity(src_dpid, dst_dpid, mbps)
+
+
+    # called by the monitor when the available bandwidth of a link changes enough
+    def set_link_weight(self, src_dpid, dst_dpid, weight):
+        if not ADAPTIVE_WEIGHTS:
+            return
+        if (src_dpid, dst_dpid) in links:
+            links[(src_dpid, dst_dpid)]['weight'] = weight
+        self.network.set_weight(src_dpid, dst_dpid, weight)
+        if ROUTING_MODE == 'path':
+            self.reroute(src_dpid, dst_dpid)
 
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        start = time.time()
+        self.profiler.run(self._handle_packet_in, ev)
+        metrics.observe('packet_in_seconds', time.time() - start)
+
+
+    def _handle_packet_in(self, ev):
         if ev.msg.msg_len < ev.msg.total_len:
             self.logger.debug("packet truncated: only %s of %s bytes",
                               ev.msg.msg_len, ev.msg.total_len)
@@ -101,139 +263,223 @@ class Controller(app_manager.RyuApp):
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+        # only the ethernet header is read, so ignored frames cost almost nothing
+        eth_type = fastpath.ethertype(msg.data)
+        if eth_type is None or eth_type in fastpath.IGNORED_ETHERTYPES:
             # ignore lldp packet
             return
 
-        dst = eth.dst
-        src = eth.src
+        dst, src = fastpath.eth_addresses(msg.data)
 
         dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
-
-        stored_src = False
-        src_sw_dpid = None
-        for sw in switches:
-            if sw.dp.id in self.mac_to_port:
-                if src in self.mac_to_port[sw.dp.id]:
-                    stored_src = True
-                    src_sw_dpid = sw.dp.id
-                    break
-        if not stored_src:
-            self.mac_to_port[dpid][src] = in_port
-            src_sw_dpid = dpid
-        
-        stored_dst = False
-        dst_sw_dpid = None
-        for sw in switches:
-            if sw.dp.id in self.mac_to_port:
-                if dst in self.mac_to_port[sw.dp.id]:
-                    stored_dst = True
-                    dst_sw_dpid = sw.dp.id
-                    break
-
-        if stored_dst:
-            path = self.get_dijkstra_path(src, src_sw_dpid, dst, dst_sw_dpid)
-            out_port = path[0][2]
-            self.install_path(src, dst, path, datapath, 1)
+        # hosts are only learned on edge ports, and move when seen on another one
+        self.hosts.learn(src, dpid, in_port)
+        src_loc = self.hosts.get(src)
+        dst_loc = self.hosts.get(dst)
+
+        # ARP requests for known hosts are answered here rather than flooded
+        if eth_type == fastpath.ETH_TYPE_ARP:
+            reply = self.arp.handle(msg.data, lambda mac: mac in self.hosts)
+            if reply is not None:
+                out = parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                          in_port=ofproto.OFPP_CONTROLLER,
+                                          actions=[parser.OFPActionOutput(in_port)], data=reply)
+                datapath.send_msg(out)
+                return
+
+        src_sw_dpid = src_loc[0] if src_loc is not None else None
+        dst_sw_dpid = dst_loc[0] if dst_loc is not None else None
+
+        path = None
+        install = None
+        actions = None
+        if src_loc is None or dst_loc is None:
+            # flooding, limited like path computations
+            if not self.limiter.allow(src):
+                return
+        elif ROUTING_MODE in ('destination', 'ecmp'):
+            # one tree per destination host, or rules spreading the flows of
+            # the pair over all the equal-cost paths
+            routed = self.network.route(datapath, src, dst, src_loc, dst_loc)
+            if routed is None:
+                return
+            install, actions = routed
         else:
-            out_port = ofproto.OFPP_FLOOD
-
-        # Now tell the switch to send the packet
-        actions = [parser.OFPActionOutput(out_port)]
+            # duplicates of a packet whose path is being installed reuse that path
+            pending = self.pending.get(src, dst, path_cache.epoch)
+            if pending is not None:
+                path, install = pending
+            else:
+                if not self.limiter.allow(src):
+                    return
+                path = self.get_dijkstra_path(src, src_sw_dpid, dst, dst_sw_dpid)
+                if path:
+                    install = self.install_flow(src, dst, path)
+                    self.pending.add(src, dst, path_cache.epoch, path, install)
+
+        out_port = ofproto.OFPP_FLOOD
+        # output port of the switch which sent the packet, if it's on the path
+        for hop_in_port, sw, hop_out_port in path or []:
+            if sw == dpid:
+                out_port = hop_out_port
+
+        # Now tell the switch to send the packet, floods go over a spanning tree
+        if actions is None and out_port == ofproto.OFPP_FLOOD:
+            actions = self.network.flood_actions(datapath)
+        elif actions is None:
+            actions = [parser.OFPActionOutput(out_port)]
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
            data = msg.data
 
         out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                 in_port=in_port, actions=actions, data=data)
-        datapath.send_msg(out)
+        # the packet is released once the switches on its path have confirmed their rules
+        if install is None:
+            datapath.send_msg(out)
+        else:
+            install.add_done_callback(lambda install: datapath.send_msg(out))
+
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        self.installer.barrier_reply(ev.msg)
+
+
+    # forgets the entries which expired, deletions are done by the controller itself
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        if msg.reason not in (ofproto.OFPRR_IDLE_TIMEOUT, ofproto.OFPRR_HARD_TIMEOUT):
+            return
+        if flows.cookie_kind(msg.cookie) == flows.COOKIE_PATH:
+            removed = self.flows.flow_removed(msg.cookie)
+            if removed is not None:
+                src, dst, path = removed
+                self.flows.delete_rules(self.datapaths, path, msg.cookie)
+        else:
+            self.network.flow_removed(msg)
 
 
     def get_dijkstra_path(self, src, src_sw_dpid, dst, dst_sw_dpid):
-        global switches, sw_topo
+        global switches, topology
         
         # note that these ports are the ones direclty connected to the hosts:
-        src_port = self.mac_to_port[src_sw_dpid][src]
-        dst_port = self.mac_to_port[dst_sw_dpid][dst]
+        src_port = self.hosts.get(src)[1]
+        dst_port = self.hosts.get(dst)[1]
         
-        print( "Finding dijkstra's shortest path for: \n")
-        print( "src: ", src, " src_port: ", src_port, " dst: ", dst, " dst_port: ", dst_port)
-
-        Q = []
-        dist = {}
-        prev = {}
-
-        for sw in switches:
-            Q.append(sw.dp.id)
-            dist[sw.dp.id] = float('Inf')
-            prev[sw.dp.id] = None
-        dist[src] = 0
-
-        while len(Q) > 0:
-            u = self.min_distance(dist, Q)
-            for sw in switches:
-                if sw_topo[u - 1][sw.dp.id - 1] != None:
-                    l = self.get_link(u, sw.dp.id)
-                    weight = l['weight']
-                    if dist[u] + weight < dist[sw.dp.id]:
-                        dist[sw.dp.id] = dist[u] + weight
-                        prev[sw.dp.id] = u
-
-        reversed_path = []
-        reversed_path.append(dst_sw_dpid)
-        while True:
-            if reversed_path[-1] == src_sw_dpid:
-                break
-            reversed_path.append(prev[reversed_path[-1]])
-        
-        reversed_path.reverse()
-        path = copy.deepcopy(reversed_path)
-        path_with_ports = []
-        in_port = src_port
-        for s1, s2 in zip( path[:-1], path[1:] ):
-            out_port = sw_topo[s1][s2]
-            path_with_ports.append( (in_port, s1, out_port) )
-            in_port = sw_topo[s2][s1]
-        path_with_ports.append( (in_port, dst, dst_port) )
+        self.logger.debug("finding the path of src: %s src_port: %s dst: %s dst_port: %s",
+                          src, src_port, dst, dst_port)
+
+        # the shortest paths are precomputed in path_table on topology updates,
+        # and the hot ones are cached without their host ports
+        path_with_ports = path_cache.get(src_sw_dpid, dst_sw_dpid)
+        if path_with_ports is None:
+            # applying the topology changes queued since the last lookup
+            flush_paths()
+            path_with_ports = []
+            path = path_table.path(src_sw_dpid, dst_sw_dpid)
+            if path is not None:
+                in_port = None
+                for s1, s2 in zip( path[:-1], path[1:] ):
+                    out_port = topology.port(s1, s2)
+                    path_with_ports.append( (in_port, s1, out_port) )
+                    in_port = topology.port(s2, s1)
+                path_with_ports.append( (in_port, dst_sw_dpid, None) )
+            path_cache.put(src_sw_dpid, dst_sw_dpid, path_with_ports)
+        if not path_with_ports:
+            return []
+
+        path_with_ports = list(path_with_ports)
+        _, sw, out_port = path_with_ports[0]
+        path_with_ports[0] = (src_port, sw, out_port)
+        in_port, sw, _ = path_with_ports[-1]
+        path_with_ports[-1] = (in_port, sw, dst_port)
         return path_with_ports
 
         # path format should be: list of (in_port, sw, out_port) tuples
 
 
-    def min_distance(self, dist, Q):
-        min = float('Inf')
-        sw = 1
-        for each in Q:
-            if dist[each] < min:
-                min = dist[each]
-                sw = each
-        return sw
-
-
     def get_link(self, src_dpid, dst_dpid):
         global links
-        for link in links:
-            if link['src_dpid'] == src_dpid and link['dst_dpid'] == dst_dpid:
-                return link
-        return "NotFound"
+        return links.get((src_dpid, dst_dpid), "NotFound")
     
 
-    def install_path(self, src, dst, path, datapath, priority):
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        print("installing a path from " + str(src), " to " + str(dst))
+    # sends the path's FlowMods egress switch first, with a barrier request after
+    # each switch's batch, and returns a PathInstall which is done once they're confirmed
+    def install_path(self, src, dst, path, priority, cookie=0):
+        self.logger.debug("installing a path from %s to %s: %s", src, dst, path)
+        batches = []
         for in_port, sw, out_port in path:
-            print("in_port: " + str(in_port) + " , switch: " + str(sw) + " , out_port: " + str(out_port))
+            datapath = self.datapaths.get(sw)
+            if datapath is None:
+                continue
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
             match = parser.OFPMatch(in_port=in_port, eth_src=src, eth_dst=dst)
             actions = [parser.OFPActionOutput(out_port)]
-            datapath = sw.dp
             inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS , actions)]
-            mod = parser.OFPFlowMod(datapath=datapath, match=match,
+            flags = ofproto.OFPFF_SEND_FLOW_REM if IDLE_TIMEOUT else 0
+            mod = parser.OFPFlowMod(datapath=datapath, match=match, cookie=cookie,
+                                    idle_timeout=IDLE_TIMEOUT, flags=flags,
                                     priority=priority, instructions=inst)
-            datapath.send_msg(mod)
-
-    
\ No newline at end of file
+            batches.append((datapath, [mod]))
+        return self.installer.install(batches)
+
+
+    # installs the path of (src, dst) with its own cookie, replacing (make-before-break)
+    # the pair's previous path if there's one: its entries are deleted once the new
+    # ones are confirmed
+    def install_flow(self, src, dst, path):
+        cookie = self.flows.new_cookie(path_cache.epoch)
+        install = self.install_path(src, dst, path, 1, cookie)
+        old = self.flows.add(src, dst, [sw for _, sw, _ in path], cookie)
+        if old is not None:
+            old_cookie, old_path = old
+            install.add_done_callback(
+                lambda install: self.flows.delete_rules(self.datapaths, old_path, old_cookie))
+        return install
+
+
+    # path of (src, dst) with the hosts' current locations, empty if one is unknown
+    def host_path(self, src, dst):
+        src_loc, dst_loc = self.hosts.get(src), self.hosts.get(dst)
+        if src_loc is None or dst_loc is None:
+            return []
+        return self.get_dijkstra_path(src, src_loc[0], dst, dst_loc[0])
+
+
+    # installs the paths from and to a host which has moved again
+    def _host_moved(self, mac, old, new):
+        self.network.host_moved(mac, new)
+        for src, dst in self.flows.of_host(mac):
+            self.pending.remove(src, dst)
+            path = self.host_path(src, dst)
+            if path:
+                self.install_flow(src, dst, path)
+            else:
+                cookie, old_path = self.flows.remove(src, dst)
+                self.flows.delete_rules(self.datapaths, old_path, cookie)
+
+
+    # forgets the hosts behind the port and deletes the paths towards them
+    def _remove_hosts(self, dpid, port):
+        for mac in self.hosts.remove_port(dpid, port):
+            for src, dst in self.flows.of_host(mac):
+                cookie, old_path = self.flows.remove(src, dst)
+                self.flows.delete_rules(self.datapaths, old_path, cookie)
+
+
+    # moves the flows going through the link src_dpid-dst_dpid to their new shortest paths
+    def reroute(self, src_dpid, dst_dpid):
+        flush_paths()
+        for src, dst in self.flows.using(src_dpid, dst_dpid):
+            cookie, old_path = self.flows.get(src, dst)
+            path = self.host_path(src, dst)
+            if not path:
+                # the old entries would only black-hole the traffic
+                self.flows.remove(src, dst)
+                self.flows.delete_rules(self.datapaths, old_path, cookie)
+            elif [sw for _, sw, _ in path] != old_path:
+                self.install_flow(src, dst, path)
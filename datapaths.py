@@ -0,0 +1,31 @@
+# A registry of the connected switches' datapath objects, indexed by dpid.
+# It's kept up to date by the switch enter/reconnected/leave handlers, so finding the
+# datapath of a switch on a path is a dict lookup.
+class DatapathRegistry(object):
+
+    def __init__(self):
+        # datapaths[dpid] -> ryu Datapath object
+        self.datapaths = {}
+
+    # registers (or replaces, when a switch reconnects) the datapath of a switch
+    def register(self, datapath):
+        self.datapaths[datapath.id] = datapath
+
+    # unregisters the datapath of a switch. If the switch has already
+    # reconnected with a new datapath, the new one is kept.
+    def unregister(self, datapath):
+        if self.datapaths.get(datapath.id) is datapath:
+            del self.datapaths[datapath.id]
+
+    # datapath of the switch with the given dpid, or None if it's not connected
+    def get(self, dpid):
+        return self.datapaths.get(dpid)
+
+    def __contains__(self, dpid):
+        return dpid in self.datapaths
+
+    def __len__(self):
+        return len(self.datapaths)
+
+    def __iter__(self):
+        return iter(list(self.datapaths.values()))
@@ -0,0 +1,120 @@
+from flows import delete_group, forward_actions, forward_mods, make_cookie, COOKIE_DEST
+
+# cookie of the destination based flow entries
+DEST_COOKIE = make_cookie(COOKIE_DEST)
+
+
+# Destination based routing.
+# Instead of one exact-match (in_port, eth_src, eth_dst) rule per hop and
+# host pair, every switch gets a single eth_dst rule per host, forwarding
+# towards it along the shortest path tree of the host's switch. Where a switch
+# has several equal-cost next hops, the rule points to an OFPGT_SELECT group
+# with one bucket per next hop. That's O(hosts x switches) rules overall, and
+# a host can be reached from anywhere once its tree is installed.
+# Only the rules which differ from what's already on a switch are sent.
+# With failover, every switch also gets a backup port towards each host
+# (see PathTable.backup_next_hop) in an OFPGT_FF group, so a link failure is
+# handled by the switches right away and the trees are only moved to the new
+# shortest paths afterwards, by refresh().
+# The tree of a host which is forgotten (or moves) is deleted with its groups,
+# whose ids are freed for other hosts.
+class DestinationRouting(object):
+
+    def __init__(self, topology, path_table, installer, groups, idle_timeout=0,
+                 failover=False):
+        self.topology = topology
+        self.path_table = path_table
+        self.installer = installer
+        # group ids, shared with the other users of groups
+        self.groups = groups
+        # seconds after which unused entries expire, 0 for never
+        self.idle_timeout = idle_timeout
+        self.failover = failover
+        # trees[dst mac] -> (epoch, dst switch, dst port)
+        self.trees = {}
+        # installed[(dpid, dst mac)] -> (tuple of output ports, backup port or None) on that switch
+        self.installed = {}
+
+    # output ports towards the host on the given switch, empty if it's unreachable
+    def out_ports(self, dpid, dst_sw, dst_port):
+        if dpid == dst_sw:
+            return (dst_port,)
+        port = self.topology.port
+        return tuple(sorted(port(dpid, v) for v in self.path_table.next_hops(dpid, dst_sw)))
+
+    # port to fail over to on the given switch, None if there's none (or failover is off)
+    def backup_port(self, dpid, dst_sw):
+        if not self.failover or dpid == dst_sw:
+            return None
+        v = self.path_table.backup_next_hop(dpid, dst_sw)
+        return None if v is None else self.topology.port(dpid, v)
+
+    # whether the tree of dst is installed and up to date
+    def is_installed(self, dst, dst_sw, dst_port, epoch):
+        return self.trees.get(dst) == (epoch, dst_sw, dst_port)
+
+    # installs (or updates) the tree towards host dst, returns a PathInstall
+    def install(self, dst, dst_sw, dst_port, datapaths, epoch):
+        self.trees[dst] = (epoch, dst_sw, dst_port)
+        batches = []
+        for datapath in datapaths:
+            key = (datapath.id, dst)
+            ports = self.out_ports(datapath.id, dst_sw, dst_port)
+            backup = self.backup_port(datapath.id, dst_sw) if ports else None
+            if (ports, backup) == self.installed.get(key, ((), None)):
+                continue
+            match = datapath.ofproto_parser.OFPMatch(eth_dst=dst)
+            mods = forward_mods(datapath, match, ports, self.groups, ('dst', dst), DEST_COOKIE,
+                                idle_timeout=self.idle_timeout, backup=backup)
+            batches.append((self.path_table.get_distance(datapath.id, dst_sw), datapath, mods))
+            if ports:
+                self.installed[key] = (ports, backup)
+            else:
+                self.installed.pop(key, None)
+        # farthest switches first, the installer sends them in the reverse order
+        batches.sort(key=lambda batch: -batch[0])
+        return self.installer.install([(datapath, mods) for _, datapath, mods in batches])
+
+    # reinstalls the trees which are not up to date with the topology
+    def refresh(self, datapaths, epoch):
+        for dst, (tree_epoch, dst_sw, dst_port) in list(self.trees.items()):
+            if tree_epoch != epoch:
+                self.install(dst, dst_sw, dst_port, datapaths, epoch)
+
+    # actions for a packet-out to dst on the given switch, None if dst is unreachable from it
+    def actions(self, datapath, dst):
+        installed = self.installed.get((datapath.id, dst))
+        if installed is None:
+            return None
+        ports, backup = installed
+        return forward_actions(datapath.ofproto_parser, ports, self.groups, ('dst', dst), backup)
+
+    # to be called when the entry towards dst has expired on a switch, the tree
+    # is reinstalled (on that switch only) the next time dst is looked up
+    def flow_removed(self, dpid, dst):
+        if self.installed.pop((dpid, dst), None) is not None:
+            self.trees.pop(dst, None)
+
+    # deletes the tree towards dst from the switches, and its groups
+    def remove(self, dst, datapaths):
+        self.trees.pop(dst, None)
+        for key in [key for key in self.installed if key[1] == dst]:
+            del self.installed[key]
+            datapath = datapaths.get(key[0])
+            if datapath is None:
+                continue
+            match = datapath.ofproto_parser.OFPMatch(eth_dst=dst)
+            for mod in forward_mods(datapath, match, (), self.groups, None, DEST_COOKIE):
+                datapath.send_msg(mod)
+        # the fast-failover groups point to the select groups, so they go first
+        for key in (('failover', ('dst', dst)), ('dst', dst)):
+            for dpid in self.groups.switches(key):
+                datapath = datapaths.get(dpid)
+                if datapath is not None:
+                    datapath.send_msg(delete_group(datapath, self.groups.get(key)))
+            self.groups.release(key)
+
+    # to be called when a switch leaves, its flow table can't be trusted anymore
+    def remove_switch(self, dpid):
+        for key in [key for key in self.installed if key[0] == dpid]:
+            del self.installed[key]
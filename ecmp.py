@@ -0,0 +1,170 @@
+from flows import delete_group, forward_actions, forward_mods, make_cookie, COOKIE_ECMP
+
+# cookie of the ECMP flow entries
+ECMP_COOKIE = make_cookie(COOKIE_ECMP)
+
+
+# Equal-cost multipath routing between two hosts.
+# Every switch on any of the equal-cost shortest paths between the hosts'
+# switches (see PathTable.dag) gets an (eth_src, eth_dst) rule. A switch with
+# several next hops points it to an OFPGT_SELECT group, which hashes each
+# packet's header fields to pick a bucket, so the flows between the two hosts
+# are spread over all the parallel links (spines) while each single flow
+# keeps its order on one of them.
+# The select groups only depend on their ports, so there's one per set of
+# next hop ports, shared by all the pairs (and switches) using it: the groups
+# are bounded by the switch ports, not by the number of host pairs. A group
+# no pair uses anymore on a switch (its paths are gone) is deleted from it,
+# and its id is freed once it's on no switch.
+# Only the rules which differ from what's already on a switch are sent, and
+# the switches which are not on the paths anymore get their rule deleted
+# once the new ones are confirmed.
+class EcmpRouting(object):
+
+    def __init__(self, topology, path_table, installer, groups, idle_timeout=0):
+        self.topology = topology
+        self.path_table = path_table
+        self.installer = installer
+        # group ids, shared with the other users of groups
+        self.groups = groups
+        # seconds after which unused entries expire, 0 for never
+        self.idle_timeout = idle_timeout
+        # installed[(dpid, src mac, dst mac)] -> tuple of output ports on that switch
+        self.installed = {}
+        # paths[(src mac, dst mac)] -> (src switch, dst switch, dst port, set of the
+        # switches with a rule of the pair)
+        self.paths = {}
+        # users[(dpid, ports)] -> number of pairs using the group of ports on that switch
+        self.users = {}
+
+    # installs the rules from host src (at src_sw) to host dst (at dst_sw,
+    # dst_port) on the switches of the given registry, returns a PathInstall
+    def install(self, src, dst, src_sw, dst_sw, dst_port, datapaths):
+        port = self.topology.port
+        hops = dict((sw, tuple(sorted(port(sw, v) for v in next_hops)))
+                    for sw, next_hops in self.path_table.dag(src_sw, dst_sw).items())
+        if src_sw == dst_sw or hops:
+            hops[dst_sw] = (dst_port,)
+        old = self.paths.get((src, dst), (None, None, None, set()))[3]
+
+        batches = []
+        replaced = []
+        for sw, ports in hops.items():
+            datapath = datapaths.get(sw)
+            old_ports = self.installed.get((sw, src, dst))
+            if datapath is None or not ports or old_ports == ports:
+                continue
+            match = datapath.ofproto_parser.OFPMatch(eth_src=src, eth_dst=dst)
+            mods = forward_mods(datapath, match, ports, self.groups, ('ecmp', ports), ECMP_COOKIE,
+                                idle_timeout=self.idle_timeout, shared=True)
+            batches.append((self.path_table.get_distance(src_sw, sw), datapath, mods))
+            self._pop((sw, src, dst))
+            self._add((sw, src, dst), ports)
+            if old_ports is not None:
+                replaced.append((datapath, old_ports))
+        # nearest switches to src first, the installer sends them in the reverse order
+        batches.sort(key=lambda batch: batch[0])
+        install = self.installer.install([(datapath, mods) for _, datapath, mods in batches])
+        # the rules using the old groups have just been replaced
+        for datapath, ports in replaced:
+            self._release(datapath, ports)
+
+        switches = set(sw for sw in hops if (sw, src, dst) in self.installed)
+        stale = [(sw, self._pop((sw, src, dst))) for sw in old if sw not in switches]
+        if stale:
+            install.add_done_callback(lambda install: self._delete(src, dst, stale, datapaths))
+        if switches:
+            self.paths[(src, dst)] = (src_sw, dst_sw, dst_port, switches)
+        else:
+            self.paths.pop((src, dst), None)
+        return install
+
+    # deletes the rules of the pair from the switches, given as (dpid, ports
+    # of the deleted rule)
+    def _delete(self, src, dst, switches, datapaths):
+        for sw, ports in switches:
+            datapath = datapaths.get(sw)
+            # the switch may be back on the paths since
+            if datapath is None or (sw, src, dst) in self.installed:
+                continue
+            match = datapath.ofproto_parser.OFPMatch(eth_src=src, eth_dst=dst)
+            for mod in forward_mods(datapath, match, (), self.groups, None, ECMP_COOKIE):
+                datapath.send_msg(mod)
+            if ports is not None:
+                self._release(datapath, ports)
+
+    # deletes the group of ports from the switch if no pair uses it there anymore
+    def _release(self, datapath, ports):
+        key = ('ecmp', ports)
+        if self.users.get((datapath.id, ports)) or datapath.id not in self.groups.switches(key):
+            return
+        datapath.send_msg(delete_group(datapath, self.groups.get(key)))
+        self.groups.remove(datapath.id, key)
+        if not self.groups.switches(key):
+            self.groups.release(key)
+
+    def _add(self, key, ports):
+        self.installed[key] = ports
+        if len(ports) > 1:
+            self.users[(key[0], ports)] = self.users.get((key[0], ports), 0) + 1
+
+    # forgets the rule of (dpid, src, dst), returns its ports (None if there's none)
+    def _pop(self, key):
+        ports = self.installed.pop(key, None)
+        if ports is not None and len(ports) > 1:
+            users = self.users[(key[0], ports)] - 1
+            if users:
+                self.users[(key[0], ports)] = users
+            else:
+                del self.users[(key[0], ports)]
+        return ports
+
+    # installs again the pairs whose paths may go through the link s1-s2 (those
+    # with a rule on both switches), to be called once the path table knows
+    # the link is down or its weight has changed. Returns their PathInstalls.
+    def reroute(self, s1, s2, datapaths):
+        return [self.install(src, dst, src_sw, dst_sw, dst_port, datapaths)
+                for (src, dst), (src_sw, dst_sw, dst_port, switches) in list(self.paths.items())
+                if s1 in switches and s2 in switches]
+
+    # actions for a packet-out from src to dst on the given switch, None if it's not on the paths
+    def actions(self, datapath, src, dst):
+        ports = self.installed.get((datapath.id, src, dst))
+        if not ports:
+            return None
+        return forward_actions(datapath.ofproto_parser, ports, self.groups, ('ecmp', ports))
+
+    # (src, dst) of the installed pairs from or to the host
+    def pairs(self, mac):
+        return [(src, dst) for src, dst in self.paths if mac in (src, dst)]
+
+    # to be called when the (src, dst) entry has expired on a switch
+    def flow_removed(self, dpid, src, dst, datapaths):
+        ports = self._pop((dpid, src, dst))
+        if ports is not None:
+            self._forget(dpid, (src, dst))
+            datapath = datapaths.get(dpid)
+            if datapath is not None:
+                self._release(datapath, ports)
+
+    # deletes the pairs from or to the host from the switches
+    def remove_host(self, mac, datapaths):
+        for src, dst in self.pairs(mac):
+            switches = self.paths.pop((src, dst))[3]
+            self._delete(src, dst, [(sw, self._pop((sw, src, dst))) for sw in switches], datapaths)
+
+    # to be called when a switch leaves, its flow table can't be trusted anymore
+    def remove_switch(self, dpid):
+        for key in [key for key in self.installed if key[0] == dpid]:
+            ports = self._pop(key)
+            self._forget(dpid, key[1:])
+            # the switch's groups are gone, the ids only used there are freed
+            if len(ports) > 1 and all(sw == dpid for sw in self.groups.switches(('ecmp', ports))):
+                self.groups.release(('ecmp', ports))
+
+    def _forget(self, dpid, pair):
+        path = self.paths.get(pair)
+        if path is not None:
+            path[3].discard(dpid)
+            if not path[3]:
+                del self.paths[pair]
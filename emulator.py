@@ -0,0 +1,1012 @@
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import struct
+import sys
+import time
+import urllib.request
+
+import topogen
+from utils import BANDWIDTH, CONTROLLERS, IP_CONTROLLER, PORT_CONTROLLER, PORT_REST
+
+
+# In-process OpenFlow 1.3 switch emulator, to load test the controllers
+# without Mininet (and root).
+# Every switch of a fabric (see topogen.py) connects over TCP to the
+# controllers (ryu-manager), and keeps its flow table and groups in memory.
+# Frames are passed between the switches' ports in the event loop: LLDP
+# probes of the topology discovery go through the links like any frame, and
+# the hosts answer ARP requests and send UDP frames to random hosts at the
+# given rate, which are delivered to the destination host (or not) by the
+# flow entries the controller installed.
+# The hosts announce themselves once the controllers have seen all the links
+# (their link_add counter, from the REST API of rest.py), so they aren't
+# learned on ports the controllers don't know yet to be links.
+# Reports the connection and topology convergence times, the flow setup
+# latency (first packet sent to first packet delivered, per host pair), the
+# messages exchanged with the controllers and the controller's memory.
+#
+#   ryu-manager --observe-links new_controller.py
+#   python3 emulator.py --topo fat-tree:8 --rate 1000 --duration 30 --controller-pid PID
+#
+# Only a subset of OpenFlow is emulated: table 0, apply/write actions
+# (output and group; set-field and the others are ignored), matches on the
+# ethernet, IPv4 and ARP fields, and all the group types. Thousands of
+# switches need as many file descriptors (ulimit -n).
+
+OFP_VERSION = 4
+
+OFPT_HELLO = 0
+OFPT_ERROR = 1
+OFPT_ECHO_REQUEST = 2
+OFPT_ECHO_REPLY = 3
+OFPT_FEATURES_REQUEST = 5
+OFPT_FEATURES_REPLY = 6
+OFPT_GET_CONFIG_REQUEST = 7
+OFPT_GET_CONFIG_REPLY = 8
+OFPT_PACKET_IN = 10
+OFPT_FLOW_REMOVED = 11
+OFPT_PORT_STATUS = 12
+OFPT_PACKET_OUT = 13
+OFPT_FLOW_MOD = 14
+OFPT_GROUP_MOD = 15
+OFPT_MULTIPART_REQUEST = 18
+OFPT_MULTIPART_REPLY = 19
+OFPT_BARRIER_REQUEST = 20
+OFPT_BARRIER_REPLY = 21
+OFPT_ROLE_REQUEST = 24
+OFPT_ROLE_REPLY = 25
+
+# names of the message types, for the counters
+MESSAGE_NAMES = {
+    OFPT_HELLO: 'hello', OFPT_ERROR: 'error', OFPT_ECHO_REQUEST: 'echo_request',
+    OFPT_FEATURES_REQUEST: 'features_request', OFPT_GET_CONFIG_REQUEST: 'get_config_request',
+    9: 'set_config', OFPT_PACKET_OUT: 'packet_out', OFPT_FLOW_MOD: 'flow_mod',
+    OFPT_GROUP_MOD: 'group_mod', 16: 'port_mod', OFPT_MULTIPART_REQUEST: 'multipart_request',
+    OFPT_BARRIER_REQUEST: 'barrier_request', OFPT_ROLE_REQUEST: 'role_request', 28: 'set_async',
+}
+
+OFPP_IN_PORT = 0xfffffff8
+OFPP_TABLE = 0xfffffff9
+OFPP_FLOOD = 0xfffffffb
+OFPP_ALL = 0xfffffffc
+OFPP_CONTROLLER = 0xfffffffd
+OFPP_ANY = 0xffffffff
+OFPG_ALL = 0xfffffffc
+OFPG_ANY = 0xffffffff
+OFP_NO_BUFFER = 0xffffffff
+OFPTT_ALL = 0xff
+
+OFPFC_ADD = 0
+OFPFC_MODIFY = 1
+OFPFC_MODIFY_STRICT = 2
+OFPFC_DELETE = 3
+OFPFC_DELETE_STRICT = 4
+OFPFF_SEND_FLOW_REM = 1
+OFPFF_RESET_COUNTS = 4
+
+OFPGC_ADD = 0
+OFPGC_MODIFY = 1
+OFPGC_DELETE = 2
+OFPGT_ALL = 0
+OFPGT_SELECT = 1
+OFPGT_INDIRECT = 2
+OFPGT_FF = 3
+
+OFPR_NO_MATCH = 0
+OFPR_ACTION = 1
+OFPRR_IDLE_TIMEOUT = 0
+OFPRR_HARD_TIMEOUT = 1
+OFPRR_DELETE = 2
+OFPPR_MODIFY = 2
+OFPPC_PORT_DOWN = 1
+OFPPS_LINK_DOWN = 1
+
+OFPMP_DESC = 0
+OFPMP_PORT_STATS = 4
+OFPMP_PORT_DESC = 13
+OFPMPF_REPLY_MORE = 1
+
+OFPCR_ROLE_NOCHANGE = 0
+OFPCR_ROLE_MASTER = 2
+OFPCR_ROLE_SLAVE = 3
+
+OFPIT_WRITE_ACTIONS = 3
+OFPIT_APPLY_ACTIONS = 4
+OFPAT_OUTPUT = 0
+OFPAT_GROUP = 22
+
+OFPXMC_OPENFLOW_BASIC = 0x8000
+OXM_IN_PORT = 0
+OXM_ETH_DST = 3
+OXM_ETH_SRC = 4
+OXM_ETH_TYPE = 5
+OXM_IP_PROTO = 10
+OXM_IPV4_SRC = 11
+OXM_IPV4_DST = 12
+OXM_ARP_OP = 21
+OXM_ARP_SPA = 22
+OXM_ARP_TPA = 23
+
+ETH_TYPE_IP = b'\x08\x00'
+ETH_TYPE_ARP = b'\x08\x06'
+ETH_TYPE_LLDP = b'\x88\xcc'
+BROADCAST = b'\xff' * 6
+UDP_PORT = 5001
+MAX_MESSAGE = 0xffff
+
+_header = struct.Struct('!BBHI')
+_features = struct.Struct('!QIBB2xII')
+_config = struct.Struct('!HH')
+_packet_in = struct.Struct('!IHBBQ')
+_flow_removed = struct.Struct('!QHBBIIHHQQ')
+_packet_out = struct.Struct('!IIH6x')
+_flow_mod = struct.Struct('!QQBBHHHIIIH2x')
+_group_mod = struct.Struct('!HBxI')
+_bucket = struct.Struct('!HHII4x')
+_multipart = struct.Struct('!HH4x')
+_port = struct.Struct('!I4x6s2x16sIIIIIIII')
+_port_stats = struct.Struct('!I4x12QII')
+_role = struct.Struct('!I4xQ')
+_oxm = struct.Struct('!HBB')
+_tlv = struct.Struct('!HH')
+_output = struct.Struct('!HHIH6x')
+_arp = struct.Struct('!HHBBH6s4s6s4s')
+_ipv4 = struct.Struct('!BBHHHBBH4s4s')
+_udp = struct.Struct('!HHHH')
+_payload = struct.Struct('!Id')
+
+
+def message(msg_type, xid, body=b''):
+    return _header.pack(OFP_VERSION, msg_type, _header.size + len(body), xid) + body
+
+
+def _pad8(length):
+    return (length + 7) // 8 * 8
+
+
+# parses the ofp_match at 'offset', returns ({field: (value, mask or None)}, offset after it).
+# Fields of other OXM classes are keyed by (class, field), so they never match.
+def parse_match(data, offset):
+    length = _tlv.unpack_from(data, offset)[1]
+    end = offset + length
+    pos = offset + _tlv.size
+    fields = {}
+    while pos + _oxm.size <= end:
+        oxm_class, field, size = _oxm.unpack_from(data, pos)
+        value = data[pos + _oxm.size:pos + _oxm.size + size]
+        key = field >> 1 if oxm_class == OFPXMC_OPENFLOW_BASIC else (oxm_class, field >> 1)
+        if field & 1:
+            fields[key] = (value[:size // 2], value[size // 2:])
+        else:
+            fields[key] = (value, None)
+        pos += _oxm.size + size
+    return fields, offset + _pad8(length)
+
+
+def encode_match(fields):
+    oxm = b''
+    for field, (value, mask) in sorted(fields.items()):
+        size = len(value) + (len(mask) if mask else 0)
+        oxm += _oxm.pack(OFPXMC_OPENFLOW_BASIC, field << 1 | (1 if mask else 0), size)
+        oxm += value + (mask or b'')
+    length = _tlv.size + len(oxm)
+    return _tlv.pack(1, length) + oxm + b'\x00' * (_pad8(length) - length)
+
+
+# the output and group actions of an action list, as ('output', port) and ('group', id)
+def parse_actions(data, offset, end):
+    actions = []
+    while offset + _tlv.size <= end:
+        action_type, length = _tlv.unpack_from(data, offset)
+        if length < _tlv.size:
+            break
+        if action_type == OFPAT_OUTPUT:
+            actions.append(('output', _output.unpack_from(data, offset)[2]))
+        elif action_type == OFPAT_GROUP:
+            actions.append(('group', struct.unpack_from('!I', data, offset + 4)[0]))
+        offset += length
+    return actions
+
+
+# the actions of the apply-actions and write-actions instructions
+def parse_instructions(data, offset, end):
+    actions = []
+    while offset + _tlv.size <= end:
+        instruction_type, length = _tlv.unpack_from(data, offset)
+        if length < _tlv.size:
+            break
+        if instruction_type in (OFPIT_APPLY_ACTIONS, OFPIT_WRITE_ACTIONS):
+            actions.extend(parse_actions(data, offset + 8, offset + length))
+        offset += length
+    return actions
+
+
+# the match fields of a frame received on in_port, as {field: value}
+def packet_fields(in_port, data):
+    eth_type = data[12:14]
+    fields = {
+        OXM_IN_PORT: struct.pack('!I', in_port),
+        OXM_ETH_DST: data[0:6],
+        OXM_ETH_SRC: data[6:12],
+        OXM_ETH_TYPE: eth_type,
+    }
+    if eth_type == ETH_TYPE_IP and len(data) >= 34:
+        fields[OXM_IP_PROTO] = data[23:24]
+        fields[OXM_IPV4_SRC] = data[26:30]
+        fields[OXM_IPV4_DST] = data[30:34]
+    elif eth_type == ETH_TYPE_ARP and len(data) >= 42:
+        fields[OXM_ARP_OP] = data[20:22]
+        fields[OXM_ARP_SPA] = data[28:32]
+        fields[OXM_ARP_TPA] = data[38:42]
+    return fields
+
+
+def mac_bytes(mac):
+    return bytes(bytearray(int(b, 16) for b in mac.split(':')))
+
+
+def ip_bytes(ip):
+    return bytes(bytearray(int(b) for b in ip.split('.')))
+
+
+def arp_frame(op, src_mac, src_ip, dst_mac, dst_ip):
+    eth = (BROADCAST if op == 1 else dst_mac) + src_mac + ETH_TYPE_ARP
+    arp = _arp.pack(1, 0x0800, 6, 4, op, src_mac, src_ip,
+                    dst_mac if op == 2 else b'\x00' * 6, dst_ip)
+    return (eth + arp).ljust(60, b'\x00')
+
+
+# UDP frame carrying the flow (host pair) number and the time it was sent
+def udp_frame(src_mac, src_ip, dst_mac, dst_ip, flow, sent):
+    payload = _payload.pack(flow, sent).ljust(18, b'\x00')
+    udp = _udp.pack(UDP_PORT, UDP_PORT, _udp.size + len(payload), 0) + payload
+    ip = _ipv4.pack(0x45, 0, _ipv4.size + len(udp), 0, 0, 64, 17, 0, src_ip, dst_ip)
+    return dst_mac + src_mac + ETH_TYPE_IP + ip + udp
+
+
+def _masked(value, mask):
+    return bytes(bytearray(a & m for a, m in zip(bytearray(value), bytearray(mask))))
+
+
+class FlowEntry(object):
+
+    def __init__(self, priority, match, cookie, actions, idle_timeout, hard_timeout, flags, now):
+        self.priority = priority
+        # {field: (value, mask or None)}
+        self.match = match
+        self.cookie = cookie
+        self.actions = actions
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.flags = flags
+        self.created = now
+        self.last_used = now
+        self.packets = 0
+        self.bytes = 0
+
+    def matches(self, fields):
+        for field, (value, mask) in self.match.items():
+            v = fields.get(field)
+            if v is None:
+                return False
+            if mask is None:
+                if v != value:
+                    return False
+            elif _masked(v, mask) != _masked(value, mask):
+                return False
+        return True
+
+    # the table-miss entry sends packet-ins with the no-match reason
+    def is_table_miss(self):
+        return self.priority == 0 and not self.match
+
+
+# Flow table, the entries sorted by decreasing priority.
+# The entry matching each frame 'key' is cached until the table changes.
+class FlowTable(object):
+
+    def __init__(self, cache_size=4096):
+        self.entries = []
+        # -priority of each entry, for bisect
+        self.keys = []
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self.entries)
+
+    # adds the entry, or replaces the one with the same priority and match
+    def add(self, entry):
+        self.cache = {}
+        i = bisect.bisect_left(self.keys, -entry.priority)
+        j = bisect.bisect_right(self.keys, -entry.priority)
+        for k in range(i, j):
+            if self.entries[k].match == entry.match:
+                old = self.entries[k]
+                if not entry.flags & OFPFF_RESET_COUNTS:
+                    entry.packets, entry.bytes = old.packets, old.bytes
+                self.entries[k] = entry
+                return
+        self.entries.insert(j, entry)
+        self.keys.insert(j, -entry.priority)
+
+    def lookup(self, key, fields):
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+        for entry in self.entries:
+            if entry.matches(fields):
+                if len(self.cache) >= self.cache_size:
+                    self.cache = {}
+                self.cache[key] = entry
+                return entry
+        return None
+
+    # removes the entries for which select(entry) is true, returns them
+    def remove(self, select):
+        removed = [entry for entry in self.entries if select(entry)]
+        if removed:
+            self.cache = {}
+            self.entries = [entry for entry in self.entries if not select(entry)]
+            self.keys = [-entry.priority for entry in self.entries]
+        return removed
+
+    # removes the timed out entries, returns them as (entry, reason)
+    def expire(self, now):
+        expired = []
+        for entry in self.entries:
+            if entry.hard_timeout and now - entry.created >= entry.hard_timeout:
+                expired.append((entry, OFPRR_HARD_TIMEOUT))
+            elif entry.idle_timeout and now - entry.last_used >= entry.idle_timeout:
+                expired.append((entry, OFPRR_IDLE_TIMEOUT))
+        if expired:
+            gone = set(id(entry) for entry, _ in expired)
+            self.remove(lambda entry: id(entry) in gone)
+        return expired
+
+
+# selects the entries affected by a modify or delete flow mod
+def flow_selector(match, priority, strict, cookie, cookie_mask, out_port):
+    def select(entry):
+        if cookie_mask and entry.cookie & cookie_mask != cookie & cookie_mask:
+            return False
+        if strict:
+            if entry.priority != priority or entry.match != match:
+                return False
+        else:
+            for field, value in match.items():
+                if entry.match.get(field) != value:
+                    return False
+        if out_port != OFPP_ANY and ('output', out_port) not in entry.actions:
+            return False
+        return True
+    return select
+
+
+class Port(object):
+
+    def __init__(self, number, now):
+        self.number = number
+        # switch or host at the other end, and its port
+        self.peer = None
+        self.peer_port = 0
+        self.up = True
+        self.created = now
+        self.rx_packets = 0
+        self.tx_packets = 0
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.tx_dropped = 0
+
+
+# A connection of a switch to one of the controllers
+class Connection(object):
+
+    def __init__(self, switch, reader, writer):
+        self.switch = switch
+        self.reader = reader
+        self.writer = writer
+        self.role = 1
+        self.xid = 0
+
+    def send(self, msg_type, body=b'', xid=None):
+        if xid is None:
+            self.xid = (self.xid + 1) & 0xffffffff
+            xid = self.xid
+        self.writer.write(message(msg_type, xid, body))
+
+    async def run(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(_header.size)
+                _, msg_type, length, xid = _header.unpack(header)
+                body = await self.reader.readexactly(length - _header.size)
+                self.switch.handle(self, msg_type, xid, body)
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.switch.disconnected(self)
+
+
+class EmulatedSwitch(object):
+
+    def __init__(self, emulator, dpid, ports, speed):
+        self.emulator = emulator
+        self.dpid = dpid
+        now = time.time()
+        self.ports = dict((number, Port(number, now)) for number in ports)
+        # current speed of the ports, in kbps
+        self.speed = speed
+        self.table = FlowTable()
+        # groups[id] -> (type, [(watch port, watch group, actions)])
+        self.groups = {}
+        self.connections = []
+
+    async def connect(self, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = Connection(self, reader, writer)
+        self.connections.append(connection)
+        connection.send(OFPT_HELLO)
+        return asyncio.ensure_future(connection.run())
+
+    def disconnected(self, connection):
+        if connection in self.connections:
+            self.connections.remove(connection)
+            self.emulator.count('disconnects')
+        connection.writer.close()
+
+    # sends an asynchronous message to the controllers, except the slaves
+    def notify(self, msg_type, body):
+        for connection in self.connections:
+            if connection.role != OFPCR_ROLE_SLAVE:
+                connection.send(msg_type, body)
+
+    def port_desc(self, port):
+        hw_addr = b'\x02' + struct.pack('!IB', self.dpid & 0xffffffff, port.number & 0xff)
+        name = ('sw%d-eth%d' % (self.dpid, port.number)).encode()[:15]
+        return _port.pack(port.number, hw_addr, name, 0 if port.up else OFPPC_PORT_DOWN,
+                          0 if port.up else OFPPS_LINK_DOWN, 0, 0, 0, 0, self.speed, self.speed)
+
+    def port_stats(self, port, now):
+        duration = now - port.created
+        return _port_stats.pack(port.number, port.rx_packets, port.tx_packets, port.rx_bytes,
+                                port.tx_bytes, 0, port.tx_dropped, 0, 0, 0, 0, 0, 0,
+                                int(duration), int(duration % 1 * 1e9))
+
+    def set_port(self, number, up):
+        port = self.ports[number]
+        if port.up != up:
+            port.up = up
+            self.notify(OFPT_PORT_STATUS, struct.pack('!B7x', OFPPR_MODIFY) + self.port_desc(port))
+
+    # control channel
+
+    def handle(self, connection, msg_type, xid, body):
+        self.emulator.count(MESSAGE_NAMES.get(msg_type, 'type_%d' % msg_type))
+        if self.emulator.on_message is not None:
+            self.emulator.on_message(self, msg_type, body)
+        if msg_type == OFPT_ECHO_REQUEST:
+            connection.send(OFPT_ECHO_REPLY, body, xid)
+        elif msg_type == OFPT_FEATURES_REQUEST:
+            connection.send(OFPT_FEATURES_REPLY, _features.pack(self.dpid, 0, 1, 0, 0x4f, 0), xid)
+            self.emulator.features_replied(self)
+        elif msg_type == OFPT_GET_CONFIG_REQUEST:
+            connection.send(OFPT_GET_CONFIG_REPLY, _config.pack(0, 128), xid)
+        elif msg_type == OFPT_BARRIER_REQUEST:
+            connection.send(OFPT_BARRIER_REPLY, b'', xid)
+        elif msg_type == OFPT_ROLE_REQUEST:
+            self.role_request(connection, xid, body)
+        elif msg_type == OFPT_FLOW_MOD:
+            self.flow_mod(body)
+        elif msg_type == OFPT_GROUP_MOD:
+            self.group_mod(body)
+        elif msg_type == OFPT_PACKET_OUT:
+            self.packet_out(body)
+        elif msg_type == OFPT_MULTIPART_REQUEST:
+            self.multipart_request(connection, xid, body)
+
+    def role_request(self, connection, xid, body):
+        role, generation = _role.unpack_from(body)
+        if role != OFPCR_ROLE_NOCHANGE:
+            if role == OFPCR_ROLE_MASTER:
+                for other in self.connections:
+                    if other.role == OFPCR_ROLE_MASTER:
+                        other.role = OFPCR_ROLE_SLAVE
+            connection.role = role
+        connection.send(OFPT_ROLE_REPLY, _role.pack(connection.role, generation), xid)
+
+    def flow_mod(self, body):
+        (cookie, cookie_mask, table_id, command, idle_timeout, hard_timeout, priority,
+         _, out_port, _, flags) = _flow_mod.unpack_from(body)
+        if table_id not in (0, OFPTT_ALL):
+            return
+        match, offset = parse_match(body, _flow_mod.size)
+        actions = parse_instructions(body, offset, len(body))
+        now = time.time()
+        if command == OFPFC_ADD:
+            self.table.add(FlowEntry(priority, match, cookie, actions, idle_timeout,
+                                     hard_timeout, flags, now))
+        elif command in (OFPFC_MODIFY, OFPFC_MODIFY_STRICT):
+            select = flow_selector(match, priority, command == OFPFC_MODIFY_STRICT,
+                                   cookie, cookie_mask, OFPP_ANY)
+            for entry in self.table.entries:
+                if select(entry):
+                    entry.actions = actions
+            self.table.cache = {}
+        elif command in (OFPFC_DELETE, OFPFC_DELETE_STRICT):
+            select = flow_selector(match, priority, command == OFPFC_DELETE_STRICT,
+                                   cookie, cookie_mask, out_port)
+            for entry in self.table.remove(select):
+                self.flow_removed(entry, OFPRR_DELETE, now)
+
+    def flow_removed(self, entry, reason, now):
+        if not entry.flags & OFPFF_SEND_FLOW_REM:
+            return
+        duration = now - entry.created
+        body = _flow_removed.pack(entry.cookie, entry.priority, reason, 0, int(duration),
+                                  int(duration % 1 * 1e9), entry.idle_timeout,
+                                  entry.hard_timeout, entry.packets, entry.bytes)
+        self.notify(OFPT_FLOW_REMOVED, body + encode_match(entry.match))
+        self.emulator.count('flow_removed')
+
+    def expire(self, now):
+        for entry, reason in self.table.expire(now):
+            self.flow_removed(entry, reason, now)
+
+    def group_mod(self, body):
+        command, group_type, group_id = _group_mod.unpack_from(body)
+        if command == OFPGC_DELETE:
+            if group_id == OFPG_ALL:
+                self.groups = {}
+            else:
+                self.groups.pop(group_id, None)
+            return
+        buckets = []
+        offset = _group_mod.size
+        while offset + _bucket.size <= len(body):
+            length, _, watch_port, watch_group = _bucket.unpack_from(body, offset)
+            if length < _bucket.size:
+                break
+            actions = parse_actions(body, offset + _bucket.size, offset + length)
+            buckets.append((watch_port, watch_group, actions))
+            offset += length
+        self.groups[group_id] = (group_type, buckets)
+
+    def packet_out(self, body):
+        _, in_port, actions_len = _packet_out.unpack_from(body)
+        offset = _packet_out.size
+        actions = parse_actions(body, offset, offset + actions_len)
+        data = body[offset + actions_len:]
+        # LLDP probes always get through, so the links stay discovered
+        if data and (self.emulator.forwarding or data[12:14] == ETH_TYPE_LLDP):
+            self.apply(actions, in_port, data, 0, OFPR_ACTION, 0)
+
+    def multipart_request(self, connection, xid, body):
+        mp_type = _multipart.unpack_from(body)[0]
+        now = time.time()
+        if mp_type == OFPMP_DESC:
+            entries = [struct.pack('!256s256s256s32s256s', b'emulator', b'emulated switch',
+                                   b'emulator.py', b'%d' % self.dpid, b'sw%d' % self.dpid)]
+        elif mp_type == OFPMP_PORT_DESC:
+            entries = [self.port_desc(port) for _, port in sorted(self.ports.items())]
+        elif mp_type == OFPMP_PORT_STATS:
+            number = struct.unpack_from('!I', body, _multipart.size)[0]
+            entries = [self.port_stats(port, now) for _, port in sorted(self.ports.items())
+                       if number in (OFPP_ANY, port.number)]
+        else:
+            entries = []
+        # split into messages of at most MAX_MESSAGE bytes
+        chunk = []
+        size = _header.size + _multipart.size
+        for entry in entries:
+            if chunk and size + len(entry) > MAX_MESSAGE:
+                connection.send(OFPT_MULTIPART_REPLY,
+                                _multipart.pack(mp_type, OFPMPF_REPLY_MORE) + b''.join(chunk), xid)
+                chunk = []
+                size = _header.size + _multipart.size
+            chunk.append(entry)
+            size += len(entry)
+        connection.send(OFPT_MULTIPART_REPLY, _multipart.pack(mp_type, 0) + b''.join(chunk), xid)
+
+    # data plane
+
+    def receive(self, in_port, data, hops):
+        port = self.ports.get(in_port)
+        if port is None or not port.up:
+            return
+        port.rx_packets += 1
+        port.rx_bytes += len(data)
+        fields = packet_fields(in_port, data)
+        entry = self.table.lookup((in_port, data[0:14], data[20:42]), fields)
+        if entry is None:
+            self.emulator.count('table_miss_drops')
+            return
+        entry.packets += 1
+        entry.bytes += len(data)
+        entry.last_used = time.time()
+        reason = OFPR_NO_MATCH if entry.is_table_miss() else OFPR_ACTION
+        self.apply(entry.actions, in_port, data, hops, reason, entry.cookie)
+
+    def apply(self, actions, in_port, data, hops, reason, cookie):
+        for kind, arg in actions:
+            if kind == 'output':
+                self.output(arg, in_port, data, hops, reason, cookie)
+            else:
+                self.group(arg, in_port, data, hops, reason, cookie)
+
+    # as on a real switch, a frame is never sent back through its ingress
+    # port, unless it's explicitly output to OFPP_IN_PORT. This applies to
+    # the group buckets too, which output through here.
+    def output(self, number, in_port, data, hops, reason, cookie):
+        if number == OFPP_CONTROLLER:
+            self.packet_in(in_port, data, reason, cookie)
+        elif number in (OFPP_FLOOD, OFPP_ALL):
+            for port in self.ports.values():
+                if port.number != in_port:
+                    self.transmit(port, data, hops)
+        elif number == OFPP_IN_PORT:
+            if in_port in self.ports:
+                self.transmit(self.ports[in_port], data, hops)
+        elif number == OFPP_TABLE:
+            self.receive(in_port, data, hops)
+        elif number in self.ports and number != in_port:
+            self.transmit(self.ports[number], data, hops)
+
+    def live(self, watch_port, watch_group, depth=0):
+        if watch_port != OFPP_ANY and not (watch_port in self.ports and self.ports[watch_port].up):
+            return False
+        if watch_group != OFPG_ANY:
+            group = self.groups.get(watch_group)
+            if group is None or depth > 8:
+                return False
+            return any(self.live(port, g, depth + 1) for port, g, _ in group[1])
+        return True
+
+    def group(self, group_id, in_port, data, hops, reason, cookie):
+        group = self.groups.get(group_id)
+        if group is None:
+            return
+        group_type, buckets = group
+        if group_type == OFPGT_ALL:
+            chosen = buckets
+        elif group_type == OFPGT_INDIRECT:
+            chosen = buckets[:1]
+        else:
+            live = [bucket for bucket in buckets if self.live(bucket[0], bucket[1])]
+            if group_type == OFPGT_FF:
+                chosen = live[:1]
+            else:
+                # the same bucket for all the frames of a flow
+                chosen = [live[hash(data[0:12]) % len(live)]] if live else []
+        for _, _, actions in chosen:
+            self.apply(actions, in_port, data, hops, reason, cookie)
+
+    def transmit(self, port, data, hops):
+        if not port.up or port.peer is None:
+            port.tx_dropped += 1
+            return
+        port.tx_packets += 1
+        port.tx_bytes += len(data)
+        if hops >= self.emulator.max_hops:
+            self.emulator.count('hop_limit_drops')
+            return
+        self.emulator.loop.call_soon(port.peer.receive, port.peer_port, data, hops + 1)
+
+    def packet_in(self, in_port, data, reason, cookie):
+        if data[12:14] == ETH_TYPE_LLDP:
+            self.emulator.lldp_received(self.dpid, in_port)
+        body = _packet_in.pack(OFP_NO_BUFFER, len(data), reason, 0, cookie)
+        self.notify(OFPT_PACKET_IN, body + encode_match(
+            {OXM_IN_PORT: (struct.pack('!I', in_port), None)}) + b'\x00\x00' + data)
+        self.emulator.count('packet_in')
+
+
+class EmulatedHost(object):
+
+    def __init__(self, emulator, index, mac, ip):
+        self.emulator = emulator
+        self.index = index
+        self.mac = mac_bytes(mac)
+        self.ip = ip_bytes(ip)
+        self.switch = None
+        self.port = 0
+
+    def send(self, data):
+        self.emulator.count('host_sent')
+        self.emulator.loop.call_soon(self.switch.receive, self.port, data, 0)
+
+    def receive(self, port, data, hops):
+        dst = data[0:6]
+        if dst != self.mac and dst != BROADCAST:
+            self.emulator.count('host_misdelivered')
+            return
+        eth_type = data[12:14]
+        if eth_type == ETH_TYPE_ARP:
+            op, src_mac, src_ip, target_ip = (struct.unpack_from('!H', data, 20)[0], data[22:28],
+                                              data[28:32], data[38:42])
+            if op == 1 and target_ip == self.ip:
+                self.send(arp_frame(2, self.mac, self.ip, src_mac, src_ip))
+        elif eth_type == ETH_TYPE_IP and len(data) >= 42 + _payload.size:
+            flow, sent = _payload.unpack_from(data, 42)
+            self.emulator.delivered(flow, sent, time.time())
+
+    # ARP request for another host, so the controller learns this one
+    def announce(self, other):
+        self.send(arp_frame(1, self.mac, self.ip, other.mac, other.ip))
+
+    def send_udp(self, other, flow):
+        self.send(udp_frame(self.mac, self.ip, other.mac, other.ip, flow, time.time()))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# resident memory of a process in KB, from /proc
+def rss_kb(pid):
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+class Emulator(object):
+
+    def __init__(self, fabric, controllers, rate=100.0, max_hops=32, speed=None, seed=0, rest=None):
+        self.fabric = fabric
+        # [(host, port)] of the controllers every switch connects to
+        self.controllers = controllers
+        # base URLs of the controllers' REST APIs, to wait for them to see the
+        # links before the hosts announce themselves (not waited for if empty)
+        self.rest = list(rest or [])
+        # UDP frames sent per second by the hosts, in total
+        self.rate = rate
+        self.max_hops = max_hops
+        self.rand = random.Random(seed)
+        self.loop = None
+        # if False, the packet-outs are not forwarded (except LLDP probes)
+        self.forwarding = True
+        # on_message(switch, message type, body) is called for every message
+        # received from a controller, before it's handled
+        self.on_message = None
+        self.tasks = []
+        speed = speed if speed is not None else BANDWIDTH[0] * 1000
+        ports = fabric.ports()
+        self.switches = dict((dpid, EmulatedSwitch(self, dpid, ports[dpid], speed))
+                             for dpid in fabric.switches)
+        for s1, p1, s2, p2 in fabric.links:
+            self._wire(self.switches[s1], p1, self.switches[s2], p2)
+        self.hosts = []
+        for i, (mac, ip, dpid, port) in enumerate(fabric.hosts):
+            host = EmulatedHost(self, i, mac, ip)
+            host.switch, host.port = self.switches[dpid], port
+            self.switches[dpid].ports[port].peer = host
+            self.hosts.append(host)
+
+        self.counters = {}
+        self.start = None
+        self.connected = None
+        self.converged = None
+        self.controllers_converged = None
+        self.replied = set()
+        # directed links (dpid, port) an LLDP probe came in through
+        self.lldp_seen = set()
+        # flows (host pairs) by number, the time their first packet was sent,
+        # and their flow setup latency once a packet got through
+        self.flows = {}
+        self.first_sent = {}
+        self.setup_latency = {}
+        self.latencies = []
+        self.traffic_seconds = 0.0
+
+    def _wire(self, sw1, p1, sw2, p2):
+        sw1.ports[p1].peer, sw1.ports[p1].peer_port = sw2, p2
+        sw2.ports[p2].peer, sw2.ports[p2].peer_port = sw1, p1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def features_replied(self, switch):
+        self.replied.add(switch.dpid)
+        if self.connected is None and len(self.replied) == len(self.switches):
+            self.connected = time.time()
+
+    def lldp_received(self, dpid, port):
+        if self.converged is not None or (dpid, port) in self.lldp_seen:
+            return
+        peer = self.switches[dpid].ports.get(port)
+        if peer is None or not isinstance(peer.peer, EmulatedSwitch):
+            return
+        self.lldp_seen.add((dpid, port))
+        if len(self.lldp_seen) == 2 * len(self.fabric.links):
+            self.converged = time.time()
+
+    # brings the link between two switches down (or up), as seen by both ends
+    def set_link(self, s1, s2, up):
+        for a, pa, b, pb in self.fabric.links:
+            if (a, b) in ((s1, s2), (s2, s1)):
+                self.switches[a].set_port(pa, up)
+                self.switches[b].set_port(pb, up)
+
+    def delivered(self, flow, sent, now):
+        self.count('host_received')
+        self.latencies.append(now - sent)
+        if flow not in self.setup_latency and flow in self.first_sent:
+            self.setup_latency[flow] = now - self.first_sent[flow]
+
+    def send_flow(self, src, dst):
+        key = (src.index, dst.index)
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = len(self.flows)
+            self.first_sent[flow] = time.time()
+        src.send_udp(dst, flow)
+
+    async def connect(self, concurrency=256):
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def connect(switch, address):
+            async with semaphore:
+                tasks.append(await switch.connect(*address))
+
+        await asyncio.gather(*[connect(switch, address) for switch in self.switches.values()
+                               for address in self.controllers])
+        return tasks
+
+    async def expire_flows(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for switch in self.switches.values():
+                switch.expire(now)
+
+    async def traffic(self, duration, tick=0.01):
+        end = time.time() + duration
+        budget = 0.0
+        last = time.time()
+        while time.time() < end:
+            await asyncio.sleep(tick)
+            now = time.time()
+            budget += (now - last) * self.rate
+            last = now
+            while budget >= 1 and len(self.hosts) > 1:
+                budget -= 1
+                src, dst = self.rand.sample(self.hosts, 2)
+                self.send_flow(src, dst)
+
+    # links added by the controllers, the sum of their link_add counters (each
+    # directed link is discovered by the master of its destination switch).
+    # None if the metrics of a controller can't be read.
+    def controller_links(self):
+        links = 0
+        for url in self.rest:
+            try:
+                with urllib.request.urlopen(url.rstrip('/') + '/metrics', timeout=2.0) as f:
+                    links += json.loads(f.read().decode())['counters'].get('link_add', 0)
+            except (IOError, OSError, ValueError, KeyError) as e:
+                sys.stderr.write('cannot get the metrics of %s: %s\n' % (url, e))
+                return None
+        return links
+
+    # connects the switches, waits for the links to be discovered by the
+    # switches and then by the controllers (for at most 'warmup' seconds in
+    # all), then gets the hosts learned
+    async def setup(self, warmup=10.0, drain=1.0):
+        self.loop = asyncio.get_running_loop()
+        self.start = time.time()
+        self.tasks = await self.connect()
+        self.tasks.append(asyncio.ensure_future(self.expire_flows()))
+        deadline = time.time() + warmup
+        while time.time() < deadline and (self.connected is None or
+                                          (self.fabric.links and self.converged is None)):
+            await asyncio.sleep(0.05)
+        while time.time() < deadline and self.rest and self.fabric.links:
+            links = await self.loop.run_in_executor(None, self.controller_links)
+            if links is None:
+                sys.stderr.write('not waiting for the controllers to see the links\n')
+                break
+            if links >= 2 * len(self.fabric.links):
+                self.controllers_converged = time.time()
+                break
+            await asyncio.sleep(0.05)
+        for i, host in enumerate(self.hosts):
+            if len(self.hosts) > 1:
+                host.announce(self.hosts[(i + 1) % len(self.hosts)])
+        await asyncio.sleep(drain)
+
+    def close(self):
+        for switch in self.switches.values():
+            for connection in list(switch.connections):
+                connection.writer.close()
+        for task in self.tasks:
+            task.cancel()
+
+    async def run(self, duration=10.0, warmup=10.0, drain=1.0):
+        await self.setup(warmup, drain)
+        traffic_start = time.time()
+        await self.traffic(duration)
+        await asyncio.sleep(drain)
+        self.traffic_seconds = time.time() - traffic_start
+        self.close()
+
+    def report(self, controller_pid=None):
+        setup = list(self.setup_latency.values())
+        result = {
+            'topology': self.fabric.name,
+            'switches': len(self.switches),
+            'links': len(self.fabric.links),
+            'hosts': len(self.hosts),
+            'connect_s': self.connected - self.start if self.connected else None,
+            'converge_s': self.converged - self.start if self.converged else None,
+            'controllers_converge_s': (self.controllers_converged - self.start
+                                       if self.controllers_converged else None),
+            'links_discovered': len(self.lldp_seen) // 2,
+            'flows': len(self.flows),
+            'flows_set_up': len(setup),
+            'flow_setup_rate': len(setup) / self.traffic_seconds if self.traffic_seconds else 0.0,
+            'flow_setup_p50_ms': percentile(setup, 0.5) * 1e3,
+            'flow_setup_p99_ms': percentile(setup, 0.99) * 1e3,
+            'delivery_p50_ms': percentile(self.latencies, 0.5) * 1e3,
+            'delivery_p99_ms': percentile(self.latencies, 0.99) * 1e3,
+            'flow_entries': sum(len(switch.table) for switch in self.switches.values()),
+            'groups': sum(len(switch.groups) for switch in self.switches.values()),
+            'messages': self.counters,
+        }
+        if controller_pid:
+            result['controller_rss_kb'] = rss_kb(controller_pid)
+        return result
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or IP_CONTROLLER, int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='OpenFlow 1.3 switch emulator')
+    parser.add_argument('--topo', default='fat-tree:4', help='topology spec or file, see topogen.from_spec')
+    parser.add_argument('--controller', action='append', type=parse_address,
+                        help='HOST:PORT of a controller (repeatable), by default the '
+                             'CONTROLLERS instances of utils.py')
+    parser.add_argument('--rate', type=float, default=100.0, help='UDP frames per second sent by the hosts')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of traffic')
+    parser.add_argument('--warmup', type=float, default=30.0,
+                        help='max seconds to wait for the links to be discovered')
+    parser.add_argument('--rest', action='append',
+                        help='base URL of the REST API of a controller (repeatable), by default '
+                             'port PORT_REST + i of the CONTROLLERS instances of utils.py')
+    parser.add_argument('--no-rest', action='store_true',
+                        help="don't wait for the controllers to see the links before the hosts "
+                             "announce themselves")
+    parser.add_argument('--max-hops', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--controller-pid', type=int, help='pid of ryu-manager, to report its memory')
+    parser.add_argument('--save', help='file to save the report to, as JSON')
+    args = parser.parse_args(argv)
+
+    controllers = args.controller or [(IP_CONTROLLER, PORT_CONTROLLER + i) for i in range(CONTROLLERS)]
+    rest = args.rest or ['http://%s:%d' % (IP_CONTROLLER, PORT_REST + i) for i in range(CONTROLLERS)]
+    emulator = Emulator(topogen.from_spec(args.topo), controllers, args.rate, args.max_hops,
+                        seed=args.seed, rest=[] if args.no_rest else rest)
+    asyncio.run(emulator.run(args.duration, args.warmup))
+    result = emulator.report(args.controller_pid)
+    print(json.dumps(result, indent=2, sort_keys=True))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import struct
+
+# Fast-path parsing of packet-in data.
+# Only the 14-byte Ethernet header (plus an 802.1Q tag if there is one) is
+# read, straight from the raw bytes, so the frames the controller ignores are
+# dropped before anything is allocated. Ryu's packet.Packet is only needed
+# when the payload itself has to be parsed.
+
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_LLDP = 0x88cc
+
+# ethertypes dropped by the packet-in handlers
+IGNORED_ETHERTYPES = frozenset([ETH_TYPE_LLDP])
+
+_ethertype = struct.Struct('!H')
+
+
+# returns the ethertype of an Ethernet frame (the inner one if it's 802.1Q
+# tagged), or None if the frame is too short to have one
+def ethertype(data):
+    if len(data) < 14:
+        return None
+    eth_type = _ethertype.unpack_from(data, 12)[0]
+    if eth_type == ETH_TYPE_8021Q:
+        if len(data) < 18:
+            return None
+        eth_type = _ethertype.unpack_from(data, 16)[0]
+    return eth_type
+
+
+# returns (dst, src) MAC addresses of an Ethernet frame,
+# in the same 'xx:xx:xx:xx:xx:xx' format as ryu's ethernet.ethernet
+def eth_addresses(data):
+    view = memoryview(data)
+    return view[0:6].hex(':'), view[6:12].hex(':')
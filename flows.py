@@ -0,0 +1,364 @@
+import time
+
+import metrics
+
+# Flow entry cookies.
+# Every entry the controllers install carries a structured 64 bit cookie:
+#   bits 56-63  kind of entry (COOKIE_PATH, COOKIE_DEST, ...)
+#   bits 32-55  topology epoch the entry was computed at
+#   bits 0-31   id of the path
+# so all the entries of a path, or all the entries of a kind, can be
+# deleted at once with a cookie mask.
+COOKIE_KIND_SHIFT = 56
+COOKIE_EPOCH_SHIFT = 32
+COOKIE_KIND_MASK = 0xff << COOKIE_KIND_SHIFT
+COOKIE_EPOCH_MASK = 0xffffff << COOKIE_EPOCH_SHIFT
+COOKIE_ID_MASK = 0xffffffff
+COOKIE_MASK = 0xffffffffffffffff
+
+# kinds of entries
+COOKIE_TABLE_MISS = 0x01
+COOKIE_PATH = 0x02
+COOKIE_FLOOD = 0x03
+COOKIE_DEST = 0x04
+COOKIE_ECMP = 0x05
+
+
+def make_cookie(kind, epoch=0, path_id=0):
+    return ((kind << COOKIE_KIND_SHIFT)
+            | ((epoch << COOKIE_EPOCH_SHIFT) & COOKIE_EPOCH_MASK)
+            | (path_id & COOKIE_ID_MASK))
+
+
+def cookie_kind(cookie):
+    return (cookie & COOKIE_KIND_MASK) >> COOKIE_KIND_SHIFT
+
+
+def cookie_epoch(cookie):
+    return (cookie & COOKIE_EPOCH_MASK) >> COOKIE_EPOCH_SHIFT
+
+
+# A future-like object representing the installation of a path.
+# It's done once every switch on the path has answered the barrier request
+# sent after its FlowMods (or has left, in which case 'ok' is False).
+class PathInstall(object):
+
+    def __init__(self):
+        self.start = time.time()
+        # (dpid, barrier xid) of the switches not confirmed yet
+        self.pending = set()
+        self.callbacks = []
+        self.done = False
+        self.ok = True
+        # seconds from sending the first FlowMod to the last barrier reply
+        self.latency = None
+
+    # calls fn(install) once the path is installed, right away if it already is
+    def add_done_callback(self, fn):
+        if self.done:
+            fn(self)
+        else:
+            self.callbacks.append(fn)
+
+    def _confirm(self, key, ok=True):
+        self.pending.discard(key)
+        self.ok = self.ok and ok
+        if not self.pending and not self.done:
+            self._finish()
+
+    def _finish(self):
+        self.done = True
+        self.latency = time.time() - self.start
+        callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+# Sends the FlowMods of a path in batches, one batch per switch, starting
+# from the egress switch, and follows each batch with an OFPBarrierRequest.
+# The returned PathInstall is done when all the barrier replies have been
+# received, which must be passed to 'barrier_reply' by the controller.
+class PathInstaller(object):
+
+    # the number of messages and the latency of each install are observed in
+    # 'metrics' (a metrics.Metrics) if it's given
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        # waiting[(dpid, xid)] -> PathInstall
+        self.waiting = {}
+        self.installs = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    # 'batches' is a list of (datapath, [messages]) in path order (ingress first)
+    def install(self, batches):
+        install = PathInstall()
+        install.add_done_callback(self._record)
+        if self.metrics is not None:
+            self.metrics.observe('flowmods_per_install', sum(len(msgs) for _, msgs in batches),
+                                 metrics.COUNTS)
+        for datapath, msgs in reversed(batches):
+            for msg in msgs:
+                datapath.send_msg(msg)
+            barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+            datapath.set_xid(barrier)
+            key = (datapath.id, barrier.xid)
+            install.pending.add(key)
+            self.waiting[key] = install
+            datapath.send_msg(barrier)
+        if not install.pending:
+            install._finish()
+        return install
+
+    # to be called with every OFPBarrierReply message
+    def barrier_reply(self, msg):
+        key = (msg.datapath.id, msg.xid)
+        install = self.waiting.pop(key, None)
+        if install is not None:
+            install._confirm(key)
+
+    # to be called when a switch leaves, so installs waiting for it don't hang
+    def abandon(self, dpid):
+        for key in [key for key in self.waiting if key[0] == dpid]:
+            self.waiting.pop(key)._confirm(key, ok=False)
+
+    def _record(self, install):
+        self.installs += 1
+        self.total_latency += install.latency
+        self.max_latency = max(self.max_latency, install.latency)
+        if self.metrics is not None:
+            self.metrics.observe('install_seconds', install.latency)
+
+    def stats(self):
+        return {
+            'installs': self.installs,
+            'pending': len(self.waiting),
+            'avg_latency': self.total_latency / self.installs if self.installs else 0.0,
+            'max_latency': self.max_latency,
+        }
+
+
+# Allocates group ids, one per key (e.g. a destination host), shared by all
+# the switches, and remembers on which switches each group has been added.
+class GroupIds(object):
+
+    def __init__(self, first=1):
+        self.next_id = first
+        # ids[key] -> group id
+        self.ids = {}
+        self.free = []
+        # (dpid, group id) of the groups added to the switches
+        self.added = set()
+
+    def get(self, key):
+        group_id = self.ids.get(key)
+        if group_id is None:
+            if self.free:
+                group_id = self.free.pop()
+            else:
+                group_id = self.next_id
+                self.next_id += 1
+            self.ids[key] = group_id
+        return group_id
+
+    # frees the id of key, its groups must have been deleted from the switches
+    def release(self, key):
+        group_id = self.ids.pop(key, None)
+        if group_id is not None:
+            self.added = set(k for k in self.added if k[1] != group_id)
+            self.free.append(group_id)
+
+    # dpids of the switches the group of key has been added to
+    def switches(self, key):
+        group_id = self.ids.get(key)
+        return [dpid for dpid, added_id in self.added if added_id == group_id]
+
+    # to be called once the group of key has been deleted from the switch
+    def remove(self, dpid, key):
+        self.added.discard((dpid, self.ids.get(key)))
+
+    # to be called when a switch leaves, its groups are gone with it
+    def remove_switch(self, dpid):
+        self.added = set(k for k in self.added if k[0] != dpid)
+
+
+# actions forwarding a packet out of the given ports: a plain output for a
+# single port, otherwise the select group of 'key' spreading flows over them.
+# With a backup port, the fast-failover group of 'key' is used instead.
+def forward_actions(parser, ports, groups, key, backup=None):
+    if backup is not None:
+        return [parser.OFPActionGroup(groups.get(('failover', key)))]
+    if len(ports) == 1:
+        return [parser.OFPActionOutput(ports[0])]
+    return [parser.OFPActionGroup(groups.get(key))]
+
+
+# a GroupMod adding the group to the switch, or modifying it if it's already there
+def group_mod(datapath, groups, group_id, group_type, buckets):
+    ofproto = datapath.ofproto
+    command = ofproto.OFPGC_ADD
+    if (datapath.id, group_id) in groups.added:
+        command = ofproto.OFPGC_MODIFY
+    groups.added.add((datapath.id, group_id))
+    return datapath.ofproto_parser.OFPGroupMod(datapath, command, group_type, group_id, buckets)
+
+
+# messages installing a rule which forwards 'match' out of 'ports'.
+# With several ports, an OFPGT_SELECT group with one bucket per port is
+# added (or modified) first; the switch picks a bucket by hashing the packet
+# header fields, so each flow sticks to one port. A 'shared' group only
+# depends on its ports (its key is shared by all the rules using the same
+# ports), so it's only added once per switch. With no ports, the rule is
+# deleted.
+# With a backup port, the rule points to an OFPGT_FF group instead, whose
+# first live bucket is used: the ports (or their select group) first, then
+# the backup port. The switch fails over by itself as soon as the ports go
+# down, without waiting for the controller.
+def forward_mods(datapath, match, ports, groups, key, cookie, priority=1, idle_timeout=0,
+                 backup=None, shared=False):
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+    if not ports:
+        return [parser.OFPFlowMod(
+            datapath=datapath, cookie=cookie, match=match, priority=priority,
+            command=ofproto.OFPFC_DELETE_STRICT,
+            out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)]
+    mods = []
+    if len(ports) > 1 and not (shared and (datapath.id, groups.get(key)) in groups.added):
+        # buckets whose port is down are skipped by the switch
+        buckets = [parser.OFPBucket(weight=1, watch_port=port,
+                                    actions=[parser.OFPActionOutput(port)])
+                   for port in ports]
+        mods.append(group_mod(datapath, groups, groups.get(key), ofproto.OFPGT_SELECT, buckets))
+    if backup is not None:
+        if len(ports) > 1:
+            primary = parser.OFPBucket(watch_group=groups.get(key),
+                                       actions=[parser.OFPActionGroup(groups.get(key))])
+        else:
+            primary = parser.OFPBucket(watch_port=ports[0],
+                                       actions=[parser.OFPActionOutput(ports[0])])
+        buckets = [primary, parser.OFPBucket(watch_port=backup,
+                                             actions=[parser.OFPActionOutput(backup)])]
+        mods.append(group_mod(datapath, groups, groups.get(('failover', key)),
+                              ofproto.OFPGT_FF, buckets))
+    inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                         forward_actions(parser, ports, groups, key, backup))]
+    # expiring entries are reported (OFPFF_SEND_FLOW_REM) so the caller can forget them
+    flags = ofproto.OFPFF_SEND_FLOW_REM if idle_timeout else 0
+    mods.append(parser.OFPFlowMod(
+        datapath=datapath, cookie=cookie, match=match, priority=priority,
+        idle_timeout=idle_timeout, hard_timeout=0, flags=flags, instructions=inst))
+    return mods
+
+
+# a FlowMod deleting all the entries of the given kind from a switch
+def delete_kind(datapath, kind):
+    return delete_by_cookie(datapath, make_cookie(kind), COOKIE_KIND_MASK)
+
+
+# a GroupMod deleting one group from a switch (and the entries using it)
+def delete_group(datapath, group_id):
+    ofproto = datapath.ofproto
+    return datapath.ofproto_parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, 0, group_id)
+
+
+# a GroupMod deleting all the groups of a switch (and the entries using them)
+def delete_groups(datapath):
+    ofproto = datapath.ofproto
+    return datapath.ofproto_parser.OFPGroupMod(
+        datapath, ofproto.OFPGC_DELETE, 0, ofproto.OFPG_ALL)
+
+
+# a FlowMod deleting all the flow entries of a switch whose cookie matches
+# 'cookie' on the bits set in 'mask'
+def delete_by_cookie(datapath, cookie, mask=COOKIE_MASK):
+    ofproto = datapath.ofproto
+    return datapath.ofproto_parser.OFPFlowMod(
+        datapath=datapath, cookie=cookie, cookie_mask=mask,
+        table_id=ofproto.OFPTT_ALL, command=ofproto.OFPFC_DELETE,
+        out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)
+
+
+# Registry of the installed (src mac, dst mac) paths.
+# Every path is installed with its own cookie and indexed by the links it
+# uses, so when a link goes down (or its weight changes) only the flows
+# using it have to be moved. Moving is make-before-break: the new path is
+# installed first, and the old path's entries are deleted by cookie once the
+# new ones are confirmed.
+# The entries expire when idle; the switches report it with OFPT_FLOW_REMOVED
+# and flow_removed() forgets the path, so the registry only holds what is
+# actually installed.
+class FlowRegistry(object):
+
+    # path ids are first_id, first_id + step, ... so that several controller
+    # instances (see sharding.py) never use the same cookies
+    def __init__(self, first_id=1, step=1):
+        # flows[(src, dst)] -> (cookie, list of switches on the path)
+        self.flows = {}
+        # by_cookie[cookie] -> (src, dst)
+        self.by_cookie = {}
+        # by_link[(s1, s2)] -> set of (src, dst) whose path goes from s1 to s2
+        self.by_link = {}
+        self.next_id = first_id
+        self.step = step
+
+    # a COOKIE_PATH cookie for a new path computed at the given topology epoch
+    def new_cookie(self, epoch=0):
+        path_id = self.next_id
+        self.next_id = (self.next_id + self.step - 1) % COOKIE_ID_MASK + 1
+        return make_cookie(COOKIE_PATH, epoch, path_id)
+
+    def get(self, src, dst):
+        return self.flows.get((src, dst))
+
+    # records the path of (src, dst), returns the previous (cookie, path) or None
+    def add(self, src, dst, path, cookie):
+        old = self.remove(src, dst)
+        self.flows[(src, dst)] = (cookie, path)
+        self.by_cookie[cookie] = (src, dst)
+        for link in zip(path[:-1], path[1:]):
+            self.by_link.setdefault(link, set()).add((src, dst))
+        return old
+
+    # forgets the path of (src, dst), returns its (cookie, path) or None
+    def remove(self, src, dst):
+        old = self.flows.pop((src, dst), None)
+        if old is not None:
+            del self.by_cookie[old[0]]
+            for link in zip(old[1][:-1], old[1][1:]):
+                flows = self.by_link.get(link)
+                if flows is not None:
+                    flows.discard((src, dst))
+                    if not flows:
+                        del self.by_link[link]
+        return old
+
+    # (src, dst) of the flows from or to the host
+    def of_host(self, mac):
+        return [key for key in self.flows if mac in key]
+
+    # to be called when an entry installed with 'cookie' has been removed from a
+    # switch, forgets its path and returns (src, dst, path), or None if the
+    # cookie isn't the current one of any path (it was replaced or deleted)
+    def flow_removed(self, cookie):
+        key = self.by_cookie.get(cookie)
+        if key is None:
+            return None
+        _, path = self.remove(*key)
+        return key[0], key[1], path
+
+    # forgets the paths going through the switch, returns their (cookie, path)
+    def remove_switch(self, dpid):
+        return [self.remove(src, dst) for (src, dst), (_, path) in list(self.flows.items())
+                if dpid in path]
+
+    # (src, dst) of the flows going through the link s1-s2, in either direction
+    def using(self, s1, s2):
+        return list(self.by_link.get((s1, s2), set()) | self.by_link.get((s2, s1), set()))
+
+    # deletes the entries of a path (installed with 'cookie') from its switches
+    def delete_rules(self, datapaths, path, cookie):
+        for sw in path:
+            datapath = datapaths.get(sw)
+            if datapath is not None:
+                datapath.send_msg(delete_by_cookie(datapath, cookie))
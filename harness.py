@@ -0,0 +1,155 @@
+import importlib
+import struct
+
+
+# Drives a controller app without switches nor ryu-manager, by calling its
+# event handlers directly with fake datapaths: used by the tests, e.g.
+#   harness = AppHarness('new_controller', fabric)
+#   harness.connect()
+#   harness.learn_hosts()
+#   harness.packet(src, dst)
+# 'fabric' has the switches, the links as (dpid 1, port 1, dpid 2, port 2),
+# the hosts as (mac, ip, dpid, port) and ports(), see topogen.py.
+
+
+# A generic object with the given attributes, standing for ryu events and messages
+class Obj(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+# A datapath which doesn't send anything: it counts the messages by type and
+# keeps the barrier requests, to be answered by reply_barriers(). The
+# messages themselves are kept in 'msgs' if it's set to a list.
+class FakeDatapath(object):
+
+    def __init__(self, dpid, ofproto, parser, sent):
+        self.id = dpid
+        self.ofproto = ofproto
+        self.ofproto_parser = parser
+        self.sent = sent
+        self.barriers = []
+        self.xid = 0
+        self.msgs = None
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.xid = self.xid
+
+    def send_msg(self, msg):
+        name = type(msg).__name__
+        self.sent[name] = self.sent.get(name, 0) + 1
+        if name == 'OFPBarrierRequest':
+            self.barriers.append(msg.xid)
+        if self.msgs is not None:
+            self.msgs.append(msg)
+
+
+# class and handler names of the controller apps
+APPS = {
+    'new_controller': ('ProjectController', {
+        'features': 'switch_features_handler', 'enter': 'switch_enter_handler',
+        'reconnected': 'switch_reconnected_handler', 'leave': 'switch_leave_handler',
+        'link_add': 'link_add_handler',
+        'link_delete': 'link_delete_handler', 'packet_in': '_packet_in_handler',
+        'barrier_reply': 'barrier_reply_handler', 'flow_removed': 'flow_removed_handler',
+        'port_delete': 'port_delete_handler'}),
+    'controller': ('Controller', {
+        'features': '_switch_features_handler', 'enter': '_switch_enter_handler',
+        'reconnected': '_switch_reconnected_handler', 'leave': '_switch_leave_handler',
+        'link_add': '_link_add_handler',
+        'link_delete': '_link_delete_handler', 'packet_in': '_packet_in_handler',
+        'barrier_reply': '_barrier_reply_handler', 'flow_removed': '_flow_removed_handler',
+        'port_delete': '_port_delete_handler'}),
+}
+
+
+def mac_bytes(mac):
+    return bytes(bytearray(int(b, 16) for b in mac.split(':')))
+
+
+# an IPv4 ethernet frame (the payload doesn't matter to the controllers)
+def frame(src, dst):
+    return mac_bytes(dst) + mac_bytes(src) + struct.pack('!H', 0x0800) + bytes(46)
+
+
+# A controller app (a fresh instance of its module, so the topology and host
+# tables of a previous run are gone) driven through the fake datapaths of
+# the switches of a fabric, with 'workers' ROUTE_WORKERS and in the given
+# ROUTING_MODE if any. 'sent' counts the messages the app has sent, by type.
+class AppHarness(object):
+
+    def __init__(self, name, fabric, workers=0, mode=None):
+        from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+        class_name, self.handlers = APPS[name]
+        self.module = importlib.reload(importlib.import_module(name))
+        self.module.ROUTE_WORKERS = workers
+        if mode is not None:
+            self.module.ROUTING_MODE = mode
+        self.app = getattr(self.module, class_name)(wsgi=Obj(register=lambda *args: None))
+        self.ofproto = ofproto_v1_3
+        self.fabric = fabric
+        self.sent = {}
+        self.datapaths = dict((dpid, FakeDatapath(dpid, ofproto_v1_3, ofproto_v1_3_parser, self.sent))
+                              for dpid in fabric.switches)
+
+    def handle(self, handler, **kwargs):
+        getattr(self.app, self.handlers[handler])(Obj(**kwargs))
+
+    # connects the switches, then adds the links, with an event per direction
+    # like ryu's
+    def connect(self):
+        for dpid in self.datapaths:
+            self.handle('features', msg=Obj(datapath=self.datapaths[dpid]))
+            self.handle('enter', switch=self.switch(dpid))
+        for s1, p1, s2, p2 in self.fabric.links:
+            self.handle('link_add', link=self.link(s1, p1, s2, p2))
+            self.handle('link_add', link=self.link(s2, p2, s1, p1))
+
+    def switch(self, dpid):
+        return Obj(dp=self.datapaths[dpid],
+                   ports=[Obj(port_no=port, dpid=dpid) for port in self.fabric.ports()[dpid]])
+
+    def link(self, s1, p1, s2, p2):
+        return Obj(src=Obj(dpid=s1, port_no=p1), dst=Obj(dpid=s2, port_no=p2))
+
+    def reply_barriers(self):
+        for datapath in self.datapaths.values():
+            barriers, datapath.barriers = datapath.barriers, []
+            for xid in barriers:
+                self.handle('barrier_reply', msg=Obj(datapath=datapath, xid=xid))
+
+    # a packet-in from host src (a fabric.hosts tuple) to the mac of dst,
+    # on the switch of src
+    def packet(self, src, dst):
+        datapath = self.datapaths[src[2]]
+        data = frame(src[0], dst[0])
+        msg = Obj(datapath=datapath, match={'in_port': src[3]}, data=data,
+                  buffer_id=self.ofproto.OFP_NO_BUFFER, msg_len=len(data), total_len=len(data))
+        self.handle('packet_in', msg=msg)
+
+    # an ARP request from host src for the ip of dst
+    def arp_request(self, src, dst):
+        from ryu.lib.packet import arp, ethernet, ether_types, packet
+
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(ethertype=ether_types.ETH_TYPE_ARP,
+                                           dst='ff:ff:ff:ff:ff:ff', src=src[0]))
+        pkt.add_protocol(arp.arp(opcode=arp.ARP_REQUEST, src_mac=src[0], src_ip=src[1],
+                                 dst_mac='00:00:00:00:00:00', dst_ip=dst[1]))
+        pkt.serialize()
+        msg = Obj(datapath=self.datapaths[src[2]], match={'in_port': src[3]}, data=pkt.data,
+                  buffer_id=self.ofproto.OFP_NO_BUFFER, msg_len=len(pkt.data),
+                  total_len=len(pkt.data))
+        self.handle('packet_in', msg=msg)
+
+    # every host talks once so it's learned, which floods
+    def learn_hosts(self):
+        for host in self.fabric.hosts:
+            self.packet(host, ('ff:ff:ff:ff:ff:ff',))
+            self.reply_barriers()
+
+    def close(self):
+        self.app.close()
@@ -0,0 +1,102 @@
+import time
+
+
+# Locations of the hosts, by mac address.
+# A host is only learned on an edge port, i.e. a switch port which is not
+# part of an inter-switch link ('is_link_port(dpid, port)' tells), since
+# packets coming from another switch say nothing about where their source
+# is. Seeing a known host on another edge port is a move: its location is
+# updated and on_move(mac, old (dpid, port), new (dpid, port)) is called, so
+# the paths towards it can be installed again. Hosts not seen for 'max_age'
+# seconds are forgotten, and a reverse index of the hosts behind each port
+# lets all of them be forgotten at once when the port goes down. Every host
+# forgotten, whichever the reason, is passed to on_forget(mac), so the
+# entries towards it can be deleted.
+class HostTracker(object):
+
+    def __init__(self, is_link_port, max_age=300.0, on_move=None, on_forget=None):
+        self.is_link_port = is_link_port
+        self.max_age = max_age
+        self.on_move = on_move
+        self.on_forget = on_forget
+        # hosts[mac] -> [dpid, port, time last seen]
+        self.hosts = {}
+        # by_port[(dpid, port)] -> set of the macs behind the port
+        self.by_port = {}
+        self.moves = 0
+
+    # records that mac was seen on the given switch port, returns True if the
+    # host is new or has moved
+    def learn(self, mac, dpid, port):
+        if self.is_link_port(dpid, port):
+            return False
+        now = time.time()
+        host = self.hosts.get(mac)
+        if host is not None and host[0] == dpid and host[1] == port:
+            host[2] = now
+            return False
+        old = None
+        if host is not None:
+            old = (host[0], host[1])
+            self._unindex(mac, old)
+        self.hosts[mac] = [dpid, port, now]
+        self.by_port.setdefault((dpid, port), set()).add(mac)
+        if old is not None:
+            self.moves += 1
+            if self.on_move is not None:
+                self.on_move(mac, old, (dpid, port))
+        return True
+
+    # (dpid, port) of the host, or None if it's unknown (or too old)
+    def get(self, mac):
+        host = self.hosts.get(mac)
+        if host is None:
+            return None
+        if time.time() - host[2] > self.max_age:
+            self.forget(mac)
+            return None
+        return host[0], host[1]
+
+    def __contains__(self, mac):
+        return self.get(mac) is not None
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def forget(self, mac):
+        host = self.hosts.pop(mac, None)
+        if host is not None:
+            self._unindex(mac, (host[0], host[1]))
+            if self.on_forget is not None:
+                self.on_forget(mac)
+
+    # forgets the hosts behind the port, returns their macs
+    def remove_port(self, dpid, port):
+        macs = self.by_port.pop((dpid, port), set())
+        for mac in macs:
+            del self.hosts[mac]
+            if self.on_forget is not None:
+                self.on_forget(mac)
+        return list(macs)
+
+    # forgets the hosts behind the switch, returns their macs
+    def remove_switch(self, dpid):
+        macs = []
+        for key in [key for key in self.by_port if key[0] == dpid]:
+            macs.extend(self.remove_port(*key))
+        return macs
+
+    # forgets the hosts not seen for max_age seconds, returns their macs
+    def expire(self):
+        now = time.time()
+        macs = [mac for mac, host in self.hosts.items() if now - host[2] > self.max_age]
+        for mac in macs:
+            self.forget(mac)
+        return macs
+
+    def _unindex(self, mac, location):
+        macs = self.by_port.get(location)
+        if macs is not None:
+            macs.discard(mac)
+            if not macs:
+                del self.by_port[location]
@@ -0,0 +1,126 @@
+import bisect
+import cProfile
+import io
+import pstats
+import random
+
+
+# upper bounds of the histogram buckets, for durations (10us to ~10s)
+SECONDS = [1e-5 * 2 ** i for i in range(21)]
+# and for counts (1 to 4096)
+COUNTS = [2 ** i for i in range(13)]
+
+
+# A histogram with fixed buckets: observing a value is a bisect and an
+# increment, and the quantiles are read from the bucket counts (they're
+# the upper bound of the bucket holding the quantile).
+class Histogram(object):
+
+    def __init__(self, bounds=SECONDS):
+        self.bounds = bounds
+        # counts[i] -> values <= bounds[i] (and > bounds[i - 1]), the last one is the overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+# Counters and histograms of the controller, by name.
+# Components which keep their own counters (the path cache, the installer...)
+# are added as sources, functions returning a dict which is included as is
+# in the snapshot.
+class Metrics(object):
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.sources = {}
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value, bounds=SECONDS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        histogram.observe(value)
+
+    def add_source(self, name, fn):
+        self.sources[name] = fn
+
+    # everything as a dict, ready to be encoded as JSON
+    def snapshot(self):
+        snapshot = {
+            'counters': dict(self.counters),
+            'histograms': dict((name, histogram.snapshot())
+                               for name, histogram in self.histograms.items()),
+        }
+        for name, fn in self.sources.items():
+            snapshot[name] = fn()
+        return snapshot
+
+
+# Runs a 'rate' fraction of the calls given to run() under cProfile and
+# accumulates their stats, so the hot spots of e.g. the packet-in handler
+# can be found on a live controller at a small cost. Disabled with rate 0.
+class Profiler(object):
+
+    def __init__(self, rate=0.0):
+        self.rate = rate
+        self.samples = 0
+        self.stats = None
+
+    def run(self, fn, *args):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return fn(*args)
+        self.samples += 1
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    # the 'limit' functions with the highest cumulative time, as text
+    def report(self, limit=30):
+        if self.stats is None:
+            return 'no samples\n'
+        out = io.StringIO()
+        self.stats.stream = out
+        self.stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def reset(self):
+        self.samples = 0
+        self.stats = None
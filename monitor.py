@@ -0,0 +1,129 @@
+import json
+import time
+
+
+# Link utilization monitor.
+# It polls OFPPortStatsRequest from the switches every 'interval' seconds,
+# 'batch_size' switches at a time (yielding in between, so the event loop
+# isn't stalled), and turns the tx byte counters of each inter-switch port
+# into the utilization and available capacity of the link going out of it.
+# Link weights are derived from the available capacity the same way OSPF
+# costs are derived from bandwidth: weight = reference / available, so an
+# idle link with the default capacity weighs 1 and congested or slow links
+# are avoided by new paths.
+# The capacity of each link has to be set with set_capacity (the controllers
+# take it from their REST API, which scenario.py feeds with the bandwidth it
+# gives the links), the links whose capacity is unknown get 'capacity'.
+# Weight changes are also appended to the file 'weight_log' (opened here and
+# closed by close()), one JSON object per line, so they can be compared with
+# what really happened to the links (see scenario.py).
+class PortMonitor(object):
+
+    def __init__(self, topology, on_weight, interval=2.0, batch_size=32,
+                 capacity=5.0, threshold=0.2, weight_log=None):
+        self.topology = topology
+        # on_weight(src dpid, dst dpid, weight) is called when a link weight changes
+        self.on_weight = on_weight
+        self.interval = interval
+        self.batch_size = batch_size
+        # capacity of the links in Mbps unless set with set_capacity, which is
+        # also the reference bandwidth of the weights
+        self.capacity = capacity
+        # weights are only updated if they change by more than this ratio,
+        # so paths aren't recomputed on every small fluctuation
+        self.threshold = threshold
+        # capacities[(src dpid, dst dpid)] -> Mbps of the link src->dst
+        self.capacities = {}
+        # counters[(dpid, port)] -> (tx bytes, duration in seconds)
+        self.counters = {}
+        # utilization[(dpid, port)] -> Mbps sent out of the port
+        self.utilization = {}
+        # weights[(dpid, port)] -> last weight reported
+        self.weights = {}
+        self.polls = 0
+        self.weight_log = open(weight_log, 'a') if weight_log else None
+
+    def close(self):
+        if self.weight_log is not None:
+            self.weight_log.close()
+            self.weight_log = None
+
+    # sets the capacity of the link src->dst, whose weight is updated right
+    # away if the link is known (even idle links follow their capacity)
+    def set_capacity(self, src, dst, mbps):
+        self.capacities[(src, dst)] = mbps
+        port = self.topology.port(src, dst)
+        if port is not None:
+            self.update_weight(src, dst, port)
+
+    def get_capacity(self, src, dst):
+        return self.capacities.get((src, dst), self.capacity)
+
+    # available capacity of the link src->dst going out of the port, in Mbps
+    def available(self, src, dst, port):
+        return max(0.0, self.get_capacity(src, dst) - self.utilization.get((src, port), 0.0))
+
+    # weight of the link src->dst going out of the port
+    def weight(self, src, dst, port):
+        capacity = self.get_capacity(src, dst)
+        # never dividing by zero, a saturated link is just very expensive
+        return self.capacity / max(self.available(src, dst, port), 0.01 * capacity)
+
+    # reports the weight of the link if it has changed enough
+    def update_weight(self, src, dst, port):
+        key = (src, port)
+        weight = self.weight(src, dst, port)
+        old = self.weights.get(key, 1.0)
+        if abs(weight - old) > self.threshold * old:
+            self.weights[key] = weight
+            if self.weight_log is not None:
+                self.log_weight(src, dst, port, weight)
+            self.on_weight(src, dst, weight)
+
+    # sends the stats requests, generator yielding after each batch of switches
+    def poll(self, datapaths):
+        self.polls += 1
+        batch = 0
+        for datapath in datapaths:
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            datapath.send_msg(parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY))
+            batch += 1
+            if batch == self.batch_size:
+                batch = 0
+                yield
+
+    # to be called with the body of every OFPPortStatsReply
+    def port_stats(self, dpid, body):
+        # ports of the links going out of this switch
+        links = dict((self.topology.port(dpid, v), v) for v, _ in self.topology.neighbors(dpid))
+        for stat in body:
+            key = (dpid, stat.port_no)
+            duration = stat.duration_sec + stat.duration_nsec * 1e-9
+            last = self.counters.get(key)
+            self.counters[key] = (stat.tx_bytes, duration)
+            if last is None or duration <= last[1] or stat.tx_bytes < last[0]:
+                continue
+            self.utilization[key] = (stat.tx_bytes - last[0]) * 8 / (duration - last[1]) / 1e6
+            if stat.port_no in links:
+                self.update_weight(dpid, links[stat.port_no], stat.port_no)
+
+    def log_weight(self, src, dst, port, weight):
+        self.weight_log.write(json.dumps({
+            'time': time.time(), 'src': src, 'dst': dst, 'weight': weight,
+            'capacity': self.get_capacity(src, dst),
+            'utilization': self.utilization.get((src, port), 0.0),
+            'available': self.available(src, dst, port),
+        }) + '\n')
+        self.weight_log.flush()
+
+    # to be called when the link going out of the port is added again (or
+    # removed): it starts over at weight 1, so the last weight reported is stale
+    def reset_port(self, dpid, port):
+        self.weights.pop((dpid, port), None)
+
+    # to be called when a switch leaves
+    def remove_switch(self, dpid):
+        for table in (self.counters, self.utilization, self.weights):
+            for key in [key for key in table if key[0] == dpid]:
+                del table[key]
@@ -0,0 +1,209 @@
+import flows
+from flows import GroupIds
+from broadcast import BroadcastTree
+from destination import DestinationRouting
+from ecmp import EcmpRouting
+
+
+# The event handling controller.py and new_controller.py have in common.
+# Each controller keeps its topology, path table and path cache as module
+# globals and its handlers call this one with the change carried by their
+# event: the change is applied to the topology, the path table repairs are
+# queued (and applied on the next path lookup, with 'flush', the
+# controller's flush_paths), and the flood tree and the 'destination' and
+# 'ecmp' routing modes follow it.
+# The 'path' routing mode is left to the controllers, which record and
+# reroute their paths differently (new_controller shares them with its
+# other instances).
+class Network(object):
+
+    def __init__(self, topology, path_table, path_cache, flush, hosts, datapaths, installer,
+                 pending, limiter, monitor, metrics, mode='path', idle_timeout=0,
+                 fast_failover=False):
+        self.topology = topology
+        self.path_table = path_table
+        self.path_cache = path_cache
+        self.flush = flush
+        self.hosts = hosts
+        self.datapaths = datapaths
+        self.installer = installer
+        self.pending = pending
+        self.limiter = limiter
+        self.monitor = monitor
+        self.metrics = metrics
+        # ROUTING_MODE of the controller
+        self.mode = mode
+        self.flood = BroadcastTree(topology) # floods over a spanning tree
+        self.groups = GroupIds() # group ids used by the routing modes
+        self.dest = DestinationRouting(topology, path_table, installer, self.groups,
+                                       idle_timeout, fast_failover) # for mode 'destination'
+        self.ecmp = EcmpRouting(topology, path_table, installer, self.groups,
+                                idle_timeout) # for mode 'ecmp'
+
+    # A connecting switch may still have entries and groups the controller
+    # has forgotten about: the entries are deleted by kind with a cookie
+    # mask, the groups all at once (they have to be added again rather than
+    # modified), and what the flood tree and routing modes remember of them
+    # is forgotten. Then the switch gets its table-miss entry.
+    def reset_switch(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        for kind in (flows.COOKIE_PATH, flows.COOKIE_FLOOD, flows.COOKIE_DEST, flows.COOKIE_ECMP):
+            datapath.send_msg(flows.delete_kind(datapath, kind))
+        datapath.send_msg(flows.delete_groups(datapath))
+        self.flood.reset_switch(datapath.id)
+        self.dest.remove_switch(datapath.id)
+        self.ecmp.remove_switch(datapath.id)
+        self.groups.remove_switch(datapath.id)
+        # packets matching no other entry are sent to the controller, unbuffered
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        datapath.send_msg(parser.OFPFlowMod(
+            datapath=datapath, match=parser.OFPMatch(), cookie=flows.make_cookie(flows.COOKIE_TABLE_MISS),
+            command=ofproto.OFPFC_ADD, idle_timeout=0, hard_timeout=0, priority=0, instructions=inst))
+
+    # a switch has entered, with the given port numbers
+    def add_switch(self, dpid, ports):
+        self.flood.set_ports(dpid, ports)
+        self.topology.add_switch(dpid)
+        self.path_table.defer('node_added', dpid)
+        self.path_cache.bump_epoch()
+
+    # a switch has left: it's removed with all of its links, and everything
+    # known about it is forgotten
+    def remove_switch(self, dpid):
+        # paths waiting for this switch's barrier reply won't get it
+        self.installer.abandon(dpid)
+        self.flood.remove_switch(dpid)
+        self.dest.remove_switch(dpid)
+        self.ecmp.remove_switch(dpid)
+        self.groups.remove_switch(dpid)
+        self.monitor.remove_switch(dpid)
+        self.hosts.remove_switch(dpid)
+        self.topology.remove_switch(dpid)
+        self.path_table.defer('node_removed', dpid)
+        self.path_cache.bump_epoch()
+
+    # The link s1->s2 has been discovered, from port1 of s1 to port2 of s2.
+    # Each direction has its own event (sent again whenever the link is seen
+    # again), so only this one is added, and a link already known keeps its
+    # weight. A new link starts with weight = 1, then the monitor updates it
+    # from its capacity and port stats.
+    def add_link(self, s1, s2, port1, port2):
+        # hosts learned on these ports before the link was discovered were wrong
+        self.hosts.remove_port(s1, port1)
+        self.hosts.remove_port(s2, port2)
+        link = self.topology.get_link(s1, s2)
+        if link is not None and link[0] == port1:
+            return
+        self.topology.add_link(s1, s2, port1)
+        self.defer_link(s1, s2, link[1] if link is not None else None, 1)
+        self.monitor.reset_port(s1, port1)
+        self.monitor.update_weight(s1, s2, port1)
+
+    # The link s1-s2 is gone: a link that is down in one direction is not
+    # usable in the other one either. The ecmp pairs and destination trees
+    # using it would be black-holed, so they're moved right away.
+    def remove_link(self, s1, s2):
+        for u, v in ((s1, s2), (s2, s1)):
+            link = self.topology.get_link(u, v)
+            if link is not None:
+                self.monitor.reset_port(u, link[0])
+        self.topology.remove_link(s1, s2)
+        self.topology.remove_link(s2, s1)
+        self.path_table.defer('link_removed', s1, s2)
+        self.path_table.defer('link_removed', s2, s1)
+        self.path_cache.bump_epoch()
+        if self.mode == 'ecmp':
+            self.flush()
+            self.ecmp.reroute(s1, s2, self.datapaths)
+        elif self.mode == 'destination':
+            self.flush()
+            self.dest.refresh(self.datapaths, self.path_cache.epoch)
+
+    # the weight of the link s1->s2 has changed: the ecmp pairs using it (or
+    # which would now be shorter through it) are recomputed
+    def set_weight(self, s1, s2, weight):
+        link = self.topology.get_link(s1, s2)
+        if link is None:
+            return
+        self.topology.set_weight(s1, s2, weight)
+        self.defer_link(s1, s2, link[1], weight)
+        if self.mode == 'ecmp':
+            self.flush()
+            self.ecmp.reroute(s1, s2, self.datapaths)
+
+    # Queues the path table repair of the link s1->s2, whose weight goes from
+    # 'old' (None for a new link) to 'weight'. Only the trees which would be
+    # shorter through the link are repaired after a link_added, so a link
+    # getting more expensive has to be removed from the trees using it first.
+    def defer_link(self, s1, s2, old, weight):
+        if old is not None and weight > old:
+            self.path_table.defer('link_removed', s1, s2)
+        self.path_table.defer('link_added', s1, s2, weight)
+        self.path_cache.bump_epoch()
+
+    # the destination tree or the ecmp pairs of a host which has moved are
+    # installed again towards its new location (switch, port), the old tree
+    # is deleted first so its groups don't stay on the switches it leaves
+    def host_moved(self, mac, new):
+        if self.mode == 'destination' and mac in self.dest.trees:
+            self.dest.remove(mac, self.datapaths)
+            self.dest.install(mac, new[0], new[1], self.datapaths, self.path_cache.epoch)
+        elif self.mode == 'ecmp':
+            for src, dst in self.ecmp.pairs(mac):
+                src_loc, dst_loc = self.hosts.get(src), self.hosts.get(dst)
+                if src_loc is not None and dst_loc is not None:
+                    self.ecmp.install(src, dst, src_loc[0], dst_loc[0], dst_loc[1], self.datapaths)
+
+    # the destination tree and the ecmp pairs of a forgotten host are deleted,
+    # with their groups
+    def host_forgotten(self, mac):
+        self.dest.remove(mac, self.datapaths)
+        self.ecmp.remove_host(mac, self.datapaths)
+
+    # forgets the destination and ecmp entries reported by a FlowRemoved
+    # message, which will be installed again on the next packet-in
+    def flow_removed(self, msg):
+        kind = flows.cookie_kind(msg.cookie)
+        if kind == flows.COOKIE_DEST:
+            self.dest.flow_removed(msg.datapath.id, msg.match['eth_dst'])
+        elif kind == flows.COOKIE_ECMP:
+            self.ecmp.flow_removed(msg.datapath.id, msg.match['eth_src'], msg.match['eth_dst'],
+                                   self.datapaths)
+
+    # Routes a packet-in from host src to host dst in the 'destination' or
+    # 'ecmp' mode, given their locations (switch, port): returns the install
+    # to wait for (None if there's nothing new) and the actions of the
+    # PacketOut, or None if the packet is dropped by the rate limiter.
+    def route(self, datapath, src, dst, src_loc, dst_loc):
+        install = None
+        epoch = self.path_cache.epoch
+        if self.mode == 'destination':
+            # the tree towards dst is installed once (and again after topology changes),
+            # then dst is reachable from every switch without more packet-ins
+            if not self.dest.is_installed(dst, dst_loc[0], dst_loc[1], epoch):
+                if not self.limiter.allow(src):
+                    return None
+                self.flush()
+                install = self.dest.install(dst, dst_loc[0], dst_loc[1], self.datapaths, epoch)
+            return install, self.dest.actions(datapath, dst)
+        # the flows are spread over all the equal-cost paths, installed once per
+        # pair, and duplicate packet-ins coming meanwhile wait for the same install
+        pending = self.pending.get(src, dst, epoch)
+        if pending is not None:
+            _, install = pending
+        else:
+            if not self.limiter.allow(src):
+                return None
+            self.flush()
+            install = self.ecmp.install(src, dst, src_loc[0], dst_loc[0], dst_loc[1], self.datapaths)
+            self.pending.add(src, dst, epoch, None, install)
+        return install, self.ecmp.actions(datapath, src, dst)
+
+    # actions flooding a packet from the switch of 'datapath' over the
+    # spanning tree, whose groups are brought up to date first
+    def flood_actions(self, datapath):
+        self.metrics.inc('floods')
+        self.flood.sync(self.datapaths, self.path_cache.epoch)
+        return self.flood.actions(datapath)
@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+import logging
+
 from ryu.base import app_manager
 from ryu.controller import mac_to_port
 from ryu.controller import ofp_event
@@ -24,105 +27,100 @@ from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
 from ryu.lib.packet import ether_types
 from ryu.lib import mac
+from ryu.lib import hub
 
-from ryu.topology.api import get_switch, get_link
-from ryu.app.wsgi import ControllerBase
+from ryu.app.wsgi import ControllerBase, WSGIApplication
 from ryu.topology import event, switches
-from collections import defaultdict
-
-#switches
-switches = []
-
-#mymac[srcmac]->(switch, port)
-mymac={}
-
-#adjacency map [sw1][sw2]->port from sw1 to sw2
-adjacency=defaultdict(lambda:defaultdict(lambda:None))
-
-# a function that finds and returns the Q element which
-# has the minimum distance value in distance list
-def minimum_distance(distance, Q):
-    min = float('Inf') # initializing min
-    tmp = list(Q)
-    node = tmp[0] # # initializing node
-    for v in Q:
-        if distance[v] <= min:
-            min = distance[v]
-            node = v
-    return node
-
- 
- # Dijkstra's algorithm,
+import routing
+import fastpath
+from topology import Topology
+from datapaths import DatapathRegistry
+from flows import PathInstaller, FlowRegistry
+import flows
+from pending import PendingInstalls, RateLimiter
+from arp import ArpProxy
+from monitor import PortMonitor
+from network import Network
+from workers import RouteWorkers
+from sharding import Shard, PeerBus
+from hosts import HostTracker
+from metrics import Metrics, Profiler
+from rest import MetricsController, LinkController
+from utils import ADAPTIVE_WEIGHTS, LINK_CAPACITY, WEIGHT_LOG, SHARD_INDEX, SHARD_COUNT
+
+
+# 'path' installs exact-match rules along the path of each (src, dst) pair,
+# 'ecmp' installs (src, dst) rules spreading flows over all the equal-cost paths,
+# 'destination' installs one rule per destination host on every switch
+ROUTING_MODE = 'path'
+
+# seconds after which unused path/destination/ecmp flow entries expire, 0 for never
+IDLE_TIMEOUT = 30
+
+# in 'destination' mode, also install backup next hops in fast-failover groups,
+# so the switches themselves reroute around a failed link
+FAST_FAILOVER = True
+
+# worker processes computing the path table's trees off the event loop, 0 for none
+ROUTE_WORKERS = 2
+
+# Several instances of the controller can share the switches: instance
+# SHARD_INDEX (of SHARD_COUNT) is the master of the switches whose
+# dpid % SHARD_COUNT == SHARD_INDEX, handles their packet-ins and installs
+# their part of every path. The instances share the links, link weights,
+# hosts and paths through a PeerBus (see sharding.py). All the switches
+# must be connected to all the instances.
+# SHARD_INDEX and SHARD_COUNT, like ADAPTIVE_WEIGHTS, WEIGHT_LOG and
+# LINK_CAPACITY, are taken from the environment by utils.py.
+
+#switches graph, topology.port(sw1, sw2) -> port from sw1 to sw2
+topology=Topology()
+
+# hosts.get(mac) -> (switch, port), learned on the switches edge ports
+hosts = HostTracker(topology.is_link_port)
+
+# all-pairs shortest path table, rebuilt on topology events
+path_table = routing.PathTable(topology.neighbors)
+
+# cache of paths between hot switch pairs, invalidated on topology events
+path_cache = routing.PathCache(1024)
+
+# counters and histograms of the controller, served at /metrics (see rest.py)
+metrics = Metrics()
+
+# fraction of the packet-ins run under the profiler, served at /metrics/profile
+PROFILE_RATE = 0.0
+
+LOG = logging.getLogger(__name__)
+
+# applies the topology changes queued since the last path lookup,
+# timing the dijkstra runs they need
+def flush_paths():
+    start = time.time()
+    if path_table.flush(topology.switches):
+        metrics.observe('dijkstra_seconds', time.time() - start)
+
+ # Looks the path up in the all-pairs shortest path table (see routing.py),
  # given the source and destination switches and input ports 
  # to them from host, it will find you a dijkstra minimal path 
  # which has the following return format:
  # List of (switch dpid, switch in-port, switch out-port)
+ # An empty list is returned if dst is not reachable from src.
 def get_path (src,dst,first_port,final_port):
-    #Dijkstra's algorithm
-    print( "get_path is called, src=",src," dst=",dst, " first_port=", first_port, " final_port=", final_port)
-    distance = {}
-    previous = {}
-
-    for dpid in switches:
-        # initialize all distances to Inf
-        distance[dpid] = float('Inf')
-        # initialize all previous nodes to None
-        previous[dpid] = None
-
-    # source node distance should be 0
-    distance[src]=0
-    Q=set(switches)
-    # print( "Q=", Q)
-
-    while len(Q)>0: # untill Q is empty
-        # removing an element from Q which has minimum distance
-        u = minimum_distance(distance, Q)
-        Q.remove(u)   
-        for p in switches:
-            # check whether p and u are connected or not
-            if adjacency[u][p]!=None:
-                # assuming all nodes have same weight = 1
-                w = 1
-                # if the path from source to p and then from p to u is 
-                # cheaper than from source to u, then it gets updated
-                if distance[u] + w < distance[p]:
-                    distance[p] = distance[u] + w
-                    previous[p] = u
-
-    r=[] # a list for path's switches
-    p=dst
-    r.append(p)
-    q=previous[p]
-    # starting form the end and adding previous nodes of the path to it
-    while q is not None:
-        if q == src:
-            r.append(q)
-            break
-        p=q
-        r.append(p)
-        # current node goes one step back
-        q=previous[p]
-
-    # while the path is reversed, we need to reverse it again to get it right
-    r.reverse()
-    if src==dst:
-        path=[src]
-    else:
-        path=r
-
-    # Now add the ports
-    r = []
-    in_port = first_port
-    # getting paths switched in 2 by 2 tuples
-    for s1,s2 in zip(path[:-1],path[1:]):
-        out_port = adjacency[s1][s2]
-        r.append((s1,in_port,out_port))
-        # updating out_port for the next iteration
-        in_port = adjacency[s2][s1]
-    # while the last route which leads to the dst host is
-    # not included in the loop above, we add it separately
-    r.append((dst,in_port,final_port))
-    return r
+    LOG.debug("get_path: src=%s dst=%s first_port=%s final_port=%s", src, dst, first_port, final_port)
+    # cached paths have no host ports, they're added at the end
+    r = path_cache.get(src, dst)
+    if r is None:
+        # applying the topology changes queued since the last lookup
+        flush_paths()
+        path = path_table.path(src, dst)
+        r = []
+        if path is not None:
+            r = routing.add_ports(path, topology.port, None, None)
+        path_cache.put(src, dst, r)
+    if not r:
+        return []
+    return routing.set_host_ports(r, first_port, final_port)
 
 # The controller class. 
 # Must be inherited from the base Ryu app class 'app_manager.RyuApp'
@@ -130,12 +128,74 @@ def get_path (src,dst,first_port,final_port):
 class ProjectController(app_manager.RyuApp):
     # OpenFlow protocol for this app is set to v1.3
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    # the WSGI server of the REST endpoints
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(ProjectController, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
         self.topology_api_app = self # not really necessary
-        self.datapath_list=[] # a list for storing all switches datapath pbjects
+        self.datapaths = DatapathRegistry() # all switches datapath objects, by dpid
+        self.installer = PathInstaller(metrics) # sends paths and waits for their barrier replies
+        self.pending = PendingInstalls() # paths being installed, by (src, dst)
+        self.limiter = RateLimiter() # packet-ins each host can make the controller work on
+        self.arp = ArpProxy() # answers ARP requests for known hosts
+        self.flows = FlowRegistry(SHARD_INDEX + 1, SHARD_COUNT) # installed paths, by (src, dst)
+        # link weights from port stats
+        self.monitor = PortMonitor(topology, self.set_link_weight, capacity=LINK_CAPACITY,
+                                   weight_log=WEIGHT_LOG)
+        # topology updates, flood tree and ROUTING_MODE 'destination' and 'ecmp' (see network.py)
+        self.network = Network(topology, path_table, path_cache, flush_paths, hosts,
+                               self.datapaths, self.installer, self.pending, self.limiter,
+                               self.monitor, metrics, ROUTING_MODE, IDLE_TIMEOUT, FAST_FAILOVER)
+        self.monitor_thread = hub.spawn(self._monitor)
+        hosts.on_move = self.host_moved
+        hosts.on_forget = self.network.host_forgotten
+        self.profiler = Profiler(PROFILE_RATE) # profiles a sample of the packet-ins
+        metrics.add_source('path_cache', path_cache.stats)
+        metrics.add_source('installer', self.installer.stats)
+        metrics.add_source('controller', lambda: {
+            'switches': len(topology),
+            'links': topology.num_links(),
+            'hosts': len(hosts),
+            'flows': len(self.flows.flows),
+            'coalesced': self.pending.coalesced,
+            'rate_limited': self.limiter.dropped,
+            'profiled': self.profiler.samples,
+        })
+        kwargs['wsgi'].register(MetricsController, {'metrics': metrics, 'profiler': self.profiler})
+        kwargs['wsgi'].register(LinkController, {'set_capacity': self.set_link_capacity})
+        # path computations run in worker processes, hub.sleep lets the other
+        # greenthreads run until they're done
+        path_table.workers = RouteWorkers(topology, ROUTE_WORKERS, hub.sleep)
+        self.shard = Shard(SHARD_INDEX, SHARD_COUNT) # switches this instance is the master of
+        self.bus = None # messages from/to the other instances
+        if SHARD_COUNT > 1:
+            self.bus = PeerBus(self.shard)
+            self.bus.subscribe('add_link', self.add_link)
+            self.bus.subscribe('delete_link', self.delete_link)
+            self.bus.subscribe('link_weight', self.change_link_weight)
+            self.bus.subscribe('capacity', self.monitor.set_capacity)
+            self.bus.subscribe('host', self.add_host)
+            self.bus.subscribe('install_path', self.add_remote_path)
+            self.bus.subscribe('delete_path', self.delete_remote_path)
+            self.bus_thread = hub.spawn(self._bus)
+
+    # stops the route workers and closes the weight log when the app is stopped
+    def close(self):
+        path_table.workers.close()
+        self.monitor.close()
+        if self.bus is not None:
+            self.bus.close()
+
+    # handles the messages of the other instances
+    def _bus(self):
+        while True:
+            self.bus.handle(self.bus.recv())
+
+    # sends a message to the other instances, if there are
+    def publish(self, topic, *args):
+        if self.bus is not None:
+            self.bus.publish(topic, *args)
 
 
     # Handy function that lists all attributes in the given object
@@ -160,47 +220,174 @@ class ProjectController(app_manager.RyuApp):
 
 
     # installs the the entire path which is generated by get_path function
-    # on each switch included on the path
-    def install_path(self, p, ev, src_mac, dst_mac):
-        print( "\n\ninstall_path is called")
-        print( "p=", p, " src_mac=", src_mac, " dst_mac=", dst_mac)
-        msg = ev.msg # The OpenFlow message included in the event object
-        datapath = msg.datapath # datapath representing the switch currently
-                                # connected to the controller
-        ofproto = datapath.ofproto # Referencing  the library for the chosen 
-                                # version of the OpenFlow protocol used in 
-                                # communicating between the OpenFlow elements
-        parser = datapath.ofproto_parser # Referencing the message parsing library
-                                        # used in our OpenFlow protocol version
-        
+    # on each switch included on the path. The FlowMods are sent egress switch
+    # first, each switch's batch followed by a barrier request, and the returned
+    # PathInstall is done once all the switches have confirmed them.
+    def install_path(self, p, src_mac, dst_mac, cookie=0):
+        self.logger.debug("install_path: p=%s src_mac=%s dst_mac=%s", p, src_mac, dst_mac)
+
+        batches = [] # list of (datapath, FlowMods) for each switch on the path
         # iterating through all tuples contained in the path list, and installing them
         for sw, in_port, out_port in p:
             #print( src_mac,"->", dst_mac, "via ", sw, " in_port=", in_port, " out_port=", out_port)
+            # finding datapath object for the switch with dpid = sw
+            datapath = self.datapaths.get(sw)
+            # the switch has left, so there's nothing to install on it
+            if datapath is None:
+                continue
+            ofproto = datapath.ofproto # Referencing  the library for the chosen 
+                                    # version of the OpenFlow protocol used in 
+                                    # communicating between the OpenFlow elements
+            parser = datapath.ofproto_parser # Referencing the message parsing library
+                                            # used in our OpenFlow protocol version
             # A match object for the corresponding switch to be applied on its flow-table entry
             match=parser.OFPMatch(in_port=in_port, eth_src=src_mac, eth_dst=dst_mac)
             # an action object to tell the flow-table what to do next, when entry is matched.
             actions=[parser.OFPActionOutput(out_port)]
-            # finding datapath object for the switch with dpid = sw
-            for item in self.datapath_list:
-                if item.id == sw:
-                    datapath = item
-            # datapath=self.datapath_list[int(sw)-1] # wrong !
             # creating an instruction object which consists of an action + a mode. here we use apply mode.
             inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS , actions)]
             # creating a FlowMod object to make the switch modify its flow table. Since the given path 
             # is a one leading to dst, we use priority = 1, which is higher than table miss priority.
+            # The cookie identifies the path's entries, so they can be deleted all together.
+            # Unused entries expire after IDLE_TIMEOUT, and the switch sends a FlowRemoved then.
+            flags = ofproto.OFPFF_SEND_FLOW_REM if IDLE_TIMEOUT else 0
             mod = datapath.ofproto_parser.OFPFlowMod(
-            datapath=datapath, match=match, idle_timeout=0, hard_timeout=0,
-            priority=1, instructions=inst)
-            # Finally sending the FLowMod object to the switch
-            datapath.send_msg(mod)
+            datapath=datapath, match=match, cookie=cookie, idle_timeout=IDLE_TIMEOUT, hard_timeout=0,
+            flags=flags, priority=1, instructions=inst)
+            batches.append((datapath, [mod]))
+        # Finally sending the FLowMod objects to the switches
+        return self.installer.install(batches)
+
+    # installs the path p of (src_mac, dst_mac) with a new cookie and records it in
+    # the flow registry. If the pair already had a path, its entries are deleted once
+    # the new ones are confirmed (make-before-break).
+    def install_flow(self, p, src_mac, dst_mac):
+        cookie = self.flows.new_cookie(path_cache.epoch)
+        install = self.install_path(p, src_mac, dst_mac, cookie)
+        # the other instances install the hops on their switches
+        self.publish('install_path', p, src_mac, dst_mac, cookie)
+        old = self.flows.add(src_mac, dst_mac, [hop[0] for hop in p], cookie)
+        if old is not None:
+            old_cookie, old_path = old
+            install.add_done_callback(lambda install: self.delete_path(old_path, old_cookie))
+        return install
+
+    # deletes the entries of a path, installed with 'cookie', from all its switches
+    def delete_path(self, path, cookie):
+        self.flows.delete_rules(self.datapaths, path, cookie)
+        self.publish('delete_path', path, cookie)
+
+    # installs the hops of a path published by another instance on this instance's
+    # switches, and records it like the local ones: every instance knows all the paths
+    def add_remote_path(self, p, src_mac, dst_mac, cookie):
+        p = [tuple(hop) for hop in p]
+        self.install_path(p, src_mac, dst_mac, cookie)
+        self.flows.add(src_mac, dst_mac, [hop[0] for hop in p], cookie)
+
+    # deletes the entries of a path deleted by another instance, and forgets
+    # it if it's still the pair's current path
+    def delete_remote_path(self, p, cookie):
+        self.flows.delete_rules(self.datapaths, p, cookie)
+        self.flows.flow_removed(cookie)
+
+    # with several instances, the paths are moved by the master of their first switch
+    # (the others get the new path from it)
+    def owns_flow(self, src, dst):
+        return self.shard.owns(self.flows.get(src, dst)[1][0])
+
+    # records the switch and port of a host learned by another instance
+    def add_host(self, mac, dpid, port):
+        hosts.learn(mac, dpid, port)
+
+    # path from host src to host dst, empty if one of them is unknown or unreachable
+    def host_path(self, src, dst):
+        src_loc, dst_loc = hosts.get(src), hosts.get(dst)
+        if src_loc is None or dst_loc is None:
+            return []
+        return get_path(src_loc[0], dst_loc[0], src_loc[1], dst_loc[1])
+
+    # the paths from and to a host which has moved are installed again towards its new port
+    def host_moved(self, mac, old, new):
+        self.logger.info("host moved: %s %s -> %s", mac, old, new)
+        metrics.inc('host_moves')
+        self.network.host_moved(mac, new)
+        for src, dst in self.flows.of_host(mac):
+            if not self.owns_flow(src, dst):
+                continue
+            self.pending.remove(src, dst)
+            p = self.host_path(src, dst)
+            if p:
+                self.install_flow(p, src, dst)
+            else:
+                cookie, old_path = self.flows.remove(src, dst)
+                self.delete_path(old_path, cookie)
+
+    # forgets the hosts behind a port, and deletes the paths towards them
+    def remove_hosts(self, dpid, port):
+        for mac in hosts.remove_port(dpid, port):
+            for src, dst in self.flows.of_host(mac):
+                cookie, old_path = self.flows.remove(src, dst)
+                self.delete_path(old_path, cookie)
+
+    # moves the flows going through the link s1-s2 to their new shortest paths
+    def reroute(self, s1, s2):
+        flush_paths()
+        for src, dst in self.flows.using(s1, s2):
+            if not self.owns_flow(src, dst):
+                continue
+            cookie, old_path = self.flows.get(src, dst)
+            p = self.host_path(src, dst)
+            if not p:
+                # no path anymore, the old entries would only black-hole the traffic
+                self.flows.remove(src, dst)
+                self.delete_path(old_path, cookie)
+            elif [hop[0] for hop in p] != old_path:
+                self.install_flow(p, src, dst)
 
     
+    # polls the switches port stats periodically, yielding to the other
+    # greenthreads after each batch of switches
+    def _monitor(self):
+        while True:
+            for _ in self.monitor.poll(self.datapaths):
+                hub.sleep(0)
+            # the hosts which haven't been seen for a while are forgotten too
+            hosts.expire()
+            # the other instances ask for the messages they've missed
+            if self.bus is not None:
+                self.bus.heartbeat()
+            hub.sleep(self.monitor.interval)
+
+    # port stats replies update the links utilization and weights
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def port_stats_reply_handler(self, ev):
+        self.monitor.port_stats(ev.msg.datapath.id, ev.msg.body)
+
+    # sets the capacity of the link s1->s2, from the REST API. Every instance
+    # monitors the links of its own switches, so they all get it.
+    def set_link_capacity(self, s1, s2, mbps):
+        self.monitor.set_capacity(s1, s2, mbps)
+        self.publish('capacity', s1, s2, mbps)
+
+    # called by the monitor when the weight of the link s1->s2 changes
+    def set_link_weight(self, s1, s2, weight):
+        if not ADAPTIVE_WEIGHTS:
+            return
+        self.change_link_weight(s1, s2, weight)
+        self.publish('link_weight', s1, s2, weight)
+
+    # the paths using the link s1->s2 (or which would now be shorter through it) are recomputed
+    def change_link_weight(self, s1, s2, weight):
+        self.network.set_weight(s1, s2, weight)
+        # the flows on the link are moved if it's not on their shortest path anymore
+        if ROUTING_MODE == 'path':
+            self.reroute(s1, s2)
+
     # A handler for SwitchFeatures event, which is called only in CONFIG_DISPATCHER phase
     # Handler's main responsibility is to add a table-miss entry to all newly connected switches
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures , CONFIG_DISPATCHER)
     def switch_features_handler(self , ev):
-        print( "switch_features_handler is called")
+        self.logger.debug("switch_features_handler: dpid=%s", ev.msg.datapath.id)
         datapath = ev.msg.datapath # datapath representing the switch currently
                                 # connected to the controller
         ofproto = datapath.ofproto # Referencing  the library for the chosen 
@@ -208,26 +395,28 @@ class ProjectController(app_manager.RyuApp):
                                 # communicating between the OpenFlow elements
         parser = datapath.ofproto_parser # Referencing the message parsing library
                                         # used in our OpenFlow protocol version
-        # creating a match object with no input argument. This means that it will match all packets
-        match = parser.OFPMatch()
-        # An action object which forwards all the matched packets to the controller, with a NO_BUFFER option set.
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
-        # creating an instruction object which consists of an action + a mode. here we use apply mode.
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        # creating a FlowMod object to make the switch modify its flow table. since the given path 
-        # is a one leading to controller(if all entries didnt match), we use priority = 0, to be checked at last.
-        mod = datapath.ofproto_parser.OFPFlowMod(
-        datapath=datapath, match=match, cookie=0,
-        command=ofproto.OFPFC_ADD, idle_timeout=0, hard_timeout=0,
-        priority=0, instructions=inst)
-        # Finally sending the FLowMod object to the switch
-        datapath.send_msg(mod)
+        # with several instances, only the switch's master manages its flow table
+        if SHARD_COUNT > 1:
+            datapath.send_msg(parser.OFPRoleRequest(datapath, self.shard.role(ofproto, datapath.id),
+                                                    self.shard.generation_id()))
+            if not self.shard.owns(datapath.id):
+                return
+        # a reconnecting switch may still have entries and groups the controller has
+        # forgotten about, they're deleted, then the table-miss entry is added
+        # (packets matching no other entry are sent to the controller)
+        self.network.reset_switch(datapath)
 
     # A handler for SwitchFeatures event, which is called only in NORMAL_DISPATCHER phase (Normal status)
     # Handler's main responsibility is to check whether a Dijkstra path could be installed for the packet dst,
-    # (if dst host exists in mymac) or not.
+    # (if dst host is known) or not.
+    # Its latency is observed, and a sample of the packet-ins are profiled.
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        start = time.time()
+        self.profiler.run(self.handle_packet_in, ev)
+        metrics.observe('packet_in_seconds', time.time() - start)
+
+    def handle_packet_in(self, ev):
         msg = ev.msg # The OpenFlow message included in the event object
         datapath = msg.datapath # datapath representing the switch currently
                                 # connected to the controller
@@ -237,40 +426,82 @@ class ProjectController(app_manager.RyuApp):
         parser = datapath.ofproto_parser # Referencing the message parsing library
                                         # used in our OpenFlow protocol version
         in_port = msg.match['in_port'] # getting packet input port
-        pkt = packet.Packet(msg.data) 
-        eth = pkt.get_protocol(ethernet.ethernet) # getting packet protocol header
-        #print( "eth.ethertype=", eth.ethertype)
+        # reading the ethernet header directly from the packet data (see fastpath.py)
+        eth_type = fastpath.ethertype(msg.data)
+        #print( "eth_type=", eth_type)
 
-        #avoid broadcast from LLDP 
-        if eth.ethertype==35020:
+        #avoid broadcast from LLDP, and drop frames too short to be parsed
+        if eth_type is None or eth_type in fastpath.IGNORED_ETHERTYPES:
             return
 
-        dst = eth.dst # destination host mac address
-        src = eth.src # source host mac address
+        dst, src = fastpath.eth_addresses(msg.data) # destination and source host mac addresses
         dpid = datapath.id 
-        self.mac_to_port.setdefault(dpid, {}) # creating mac_to_port if not created yet. which is not used also.
 
-        # add src mac address (with corresponding in-port) to mymac dict if it's not yet added.
-        if src not in mymac.keys():
-            mymac[src]=( dpid,  in_port)
-            #print( "mymac=", mymac)
+        # learning (or refreshing) the location of src, if in_port is an edge port.
+        # A host seen on another edge port has moved, and its paths are installed again.
+        if hosts.learn(src, dpid, in_port):
+            self.publish('host', src, dpid, in_port)
+        src_loc, dst_loc = hosts.get(src), hosts.get(dst)
+
+        # ARP requests for known hosts are answered by the controller itself, instead of being flooded
+        if eth_type == fastpath.ETH_TYPE_ARP:
+            reply = self.arp.handle(msg.data, lambda mac: mac in hosts)
+            if reply is not None:
+                out = parser.OFPPacketOut(
+                    datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER, in_port=ofproto.OFPP_CONTROLLER,
+                    actions=[parser.OFPActionOutput(in_port)], data=reply)
+                datapath.send_msg(out)
+                return
 
+        install = None
+        actions = None
+        # the tree towards dst is installed once (and again after topology changes),
+        # then dst is reachable from every switch without more packet-ins
+        # (see network.py), with the ecmp mode the flows are spread over all
+        # the equal-cost paths
+        if dst_loc is not None and (ROUTING_MODE == 'destination' or
+                                    (src_loc is not None and ROUTING_MODE == 'ecmp')):
+            routed = self.network.route(datapath, src, dst, src_loc, dst_loc)
+            if routed is None:
+                return
+            install, actions = routed
+            out_port = ofproto.OFPP_FLOOD
         # if the destination host is already discovered, we find a dijkstra path for it.
-        if dst in mymac.keys():
-            p = get_path(mymac[src][0], mymac[dst][0], mymac[src][1], mymac[dst][1])
-            # print( p)
-            # intalling the path 'p' to avoid packetIn event for the same (src and dst) packets next time
-            self.install_path(p, ev, src, dst)
+        elif dst_loc is not None and src_loc is not None:
+            # packets coming while the same path is being installed (from any switch on it)
+            # are duplicates, they're forwarded along that path instead of installing it again
+            pending = self.pending.get(src, dst, path_cache.epoch)
+            if pending is not None:
+                p, install = pending
+            else:
+                # limiting the path computations a single host can trigger
+                if not self.limiter.allow(src):
+                    return
+                p = get_path(src_loc[0], dst_loc[0], src_loc[1], dst_loc[1])
+                # print( p)
+                # intalling the path 'p' to avoid packetIn event for the same (src and dst) packets next time,
+                # unless dst is unreachable (empty path), in which case the packet is flooded
+                if p:
+                    install = self.install_flow(p, src, dst)
+                    self.pending.add(src, dst, path_cache.epoch, p, install)
             # out_port = p[0][2] # output port for the very beginning switch of the path, which is wrong
-            # finding the actual outport 
+            # finding the actual outport, flooding if there's no path to dst
+            out_port = ofproto.OFPP_FLOOD
             for i in range (len(p)):
                 if p[i][0] == dpid:
                     out_port = p[i][2]
         # if the destination host is not yet discovered, we FLOOD the packet.
         else:
+            if not self.limiter.allow(src):
+                return
             out_port = ofproto.OFPP_FLOOD
         # And the recieved packet should be forwarded too. So we need an ActionOutput object.
-        actions = [parser.OFPActionOutput(out_port)]
+        # Flooding is done over a spanning tree of the topology (see broadcast.py) to avoid loops.
+        # (the destination tree, if there is one, has already given the actions)
+        if actions is None and out_port == ofproto.OFPP_FLOOD:
+            actions = self.network.flood_actions(datapath)
+        elif actions is None:
+            actions = [parser.OFPActionOutput(out_port)]
 
         # install a flow to avoid packet_in next time
         # Since we've already implemeneted and called install_path, so this part is useless
@@ -286,33 +517,125 @@ class ProjectController(app_manager.RyuApp):
         out = parser.OFPPacketOut(
             datapath=datapath, buffer_id=msg.buffer_id, in_port=in_port,
             actions=actions, data=data)
-        # Sending the PacketOut object to the switch so that it will forward the packet to the specified port
-        datapath.send_msg(out)
-
-    events = [event.EventSwitchEnter,
-            event.EventSwitchLeave, event.EventPortAdd,
-            event.EventPortDelete, event.EventPortModify,
-            event.EventLinkAdd, event.EventLinkDelete
-    ]
-    # A handler for retrieving mininet topology (switches and links)
-    # it will be called once one of the 'events' items triggers
-    @set_ev_cls(events)
-    def get_topology_data(self, ev):
-        global switches
-        # getting all connected switches. The first input argument could just be simply 'self'
-        switch_list = get_switch(self.topology_api_app, None)  
-        # saving switches dpid instead of switch objects, into 'switches'
-        switches=[switch.dp.id for switch in switch_list]
-        # There's a datapath list needed for install_path, since we just keep switches dpids.
-        self.datapath_list=[switch.dp for switch in switch_list]
-        #print( "self.datapath_list=", self.datapath_list)
-        print( "switches=", switches)
-        # retrieving all links between switches. Similarly, the first input argument could just be simply 'self'
-        links_list = get_link(self.topology_api_app, None)
-        # saving link endpoints dpids and port numbers into 'mylink'
-        mylinks=[(link.src.dpid,link.dst.dpid,link.src.port_no,link.dst.port_no) for link in links_list]
-        for s1,s2,port1,port2 in mylinks:
-            # Filling switches adjacency matrix using 'mylinks'
-            adjacency[s1][s2]=port1
-            adjacency[s2][s1]=port2
-            #print( s1,s2,port1,port2)
\ No newline at end of file
+        # Sending the PacketOut object to the switch so that it will forward the packet to the specified port.
+        # If a path is being installed, it's sent once the switches have confirmed the rules, so the
+        # packet won't reach a switch before its rule and come back as another packet-in.
+        if install is None:
+            datapath.send_msg(out)
+        else:
+            install.add_done_callback(lambda install: datapath.send_msg(out))
+
+    # barrier replies confirm the FlowMods sent by install_path
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        self.installer.barrier_reply(ev.msg)
+
+    # FlowRemoved messages report the entries which expired, so the controller
+    # forgets them and installs them again on the next packet-in. Deletions are
+    # the controller's own doing, its state is already up to date for those.
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        if msg.reason not in (ofproto.OFPRR_IDLE_TIMEOUT, ofproto.OFPRR_HARD_TIMEOUT):
+            return
+        if flows.cookie_kind(msg.cookie) == flows.COOKIE_PATH:
+            removed = self.flows.flow_removed(msg.cookie)
+            if removed is not None:
+                # the rest of the path is useless without this entry
+                src, dst, p = removed
+                self.flows.delete_rules(self.datapaths, p, msg.cookie)
+        else:
+            self.network.flow_removed(msg)
+
+    # Handlers for keeping the topology (switches and links) up to date.
+    # Each one applies only the change carried by its event, and the
+    # path table repairs are queued and applied on the next path lookup,
+    # so a storm of link events costs a single update.
+    @set_ev_cls(event.EventSwitchEnter)
+    def switch_enter_handler(self, ev):
+        dp = ev.switch.dp
+        self.logger.info("switch entered: %s", dp.id)
+        metrics.inc('switch_enter')
+        # There's a datapath registry needed for install_path, since we just keep switches dpids.
+        # It only holds the switches this instance is the master of, the only ones it sends FlowMods to.
+        if self.shard.owns(dp.id):
+            self.datapaths.register(dp)
+        self.network.add_switch(dp.id, [port.port_no for port in ev.switch.ports])
+
+    # A switch which connects again while ryu still has its old connection is
+    # reported with this event, without a leave for the old one, so the stale
+    # datapath is replaced here.
+    @set_ev_cls(event.EventSwitchReconnected)
+    def switch_reconnected_handler(self, ev):
+        dp = ev.switch.dp
+        self.logger.info("switch reconnected: %s", dp.id)
+        metrics.inc('switch_reconnect')
+        # the barrier replies of the old connection will never come
+        self.installer.abandon(dp.id)
+        if self.shard.owns(dp.id):
+            self.datapaths.register(dp)
+        self.network.flood.set_ports(dp.id, [port.port_no for port in ev.switch.ports])
+        # its entries were deleted when it connected again, so the destination
+        # trees have to be installed again
+        path_cache.bump_epoch()
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def switch_leave_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self.logger.info("switch left: %s", dpid)
+        metrics.inc('switch_leave')
+        self.datapaths.unregister(ev.switch.dp)
+        # a stale leave event must not remove a reconnected switch
+        if dpid in self.datapaths:
+            return
+        # the paths through the switch are broken, the rest of their entries go too
+        for cookie, p in self.flows.remove_switch(dpid):
+            self.delete_path(p, cookie)
+        # removes the switch with all of its links
+        self.network.remove_switch(dpid)
+
+    # switch ports are only needed for flooding
+    @set_ev_cls(event.EventPortAdd)
+    def port_add_handler(self, ev):
+        metrics.inc('port_events')
+        self.network.flood.add_port(ev.port.dpid, ev.port.port_no)
+
+    @set_ev_cls(event.EventPortDelete)
+    def port_delete_handler(self, ev):
+        metrics.inc('port_events')
+        self.network.flood.remove_port(ev.port.dpid, ev.port.port_no)
+        self.remove_hosts(ev.port.dpid, ev.port.port_no)
+
+    # the hosts behind a port which goes down are gone
+    @set_ev_cls(event.EventPortModify)
+    def port_modify_handler(self, ev):
+        metrics.inc('port_events')
+        if ev.port.is_down():
+            self.remove_hosts(ev.port.dpid, ev.port.port_no)
+
+    # A link is discovered by the master of its destination switch,
+    # which shares it with the other instances.
+    @set_ev_cls(event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        link = ev.link
+        metrics.inc('link_add')
+        self.add_link(link.src.dpid, link.dst.dpid, link.src.port_no, link.dst.port_no)
+        self.publish('add_link', link.src.dpid, link.dst.dpid, link.src.port_no, link.dst.port_no)
+
+    def add_link(self, s1, s2, port1, port2):
+        self.network.add_link(s1, s2, port1, port2)
+
+    @set_ev_cls(event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        link = ev.link
+        metrics.inc('link_delete')
+        self.delete_link(link.src.dpid, link.dst.dpid)
+        self.publish('delete_link', link.src.dpid, link.dst.dpid)
+
+    def delete_link(self, s1, s2):
+        # the ecmp pairs and destination trees using the link are moved by network.py
+        self.network.remove_link(s1, s2)
+        # the flows using the link would be black-holed, so they're moved right away
+        if ROUTING_MODE == 'path':
+            self.reroute(s1, s2)
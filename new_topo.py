@@ -4,81 +4,32 @@ from mininet.node import Controller, RemoteController, OVSKernelSwitch, \
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 from mininet.link import Link, TCLink
-import threading, random, time
+import threading, random, time, os, sys
 from utils import *
+import topogen
+
+# default fabric, see topogen.from_spec for the other ones (fat-tree:4, ...)
+FABRIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topologies', 'new_topo.fab')
 
 link = None
 
-def create_topo():
+def create_topo(fabric):
     global link
     net = Mininet(controller=RemoteController, link=TCLink, switch=OVSSwitch)
 
-    # Creating hosts
-    host = {}
-    for i in range(1, 4):
-        host[i] = net.addHost(
-            name='h%s'%(i), 
-            mac='00:00:00:00:00:0%s'%(i),
-            ip='10.0.0.%s'%(i)
-        )
-    
-    server = {}
-    for i in range(0, 12):
-        server[i + 1] = net.addHost(
-            name='s%s'%(i + 1), 
-            mac='00:00:00:00:0%s:0%s'%(int(i/4) + 1, i%4 + 1),
-            ip='10.0.%s.%s'%(int(i/4) + 1, i%4 + 1)
-        )
+    # Creating the switches, hosts and links of the fabric
+    switch, links = topogen.build_mininet(net, fabric, BANDWIDTH[0], TCLink)
 
-    # Creating Switches    
-    switch = {}
-    for i in range(1, 17):
-        switch[i] = net.addSwitch( name='sw%s'%(i))
-
-    controller = net.addController(
-        name='controller',
-        controller=RemoteController,
-        ip=IP_CONTROLLER,
-        port=PORT_CONTROLLER,
-    )
+    # every switch connects to all the controller instances (see SHARD_COUNT in new_controller.py)
+    for i in range(CONTROLLERS):
+        net.addController(
+            name='controller%s'%(i) if i else 'controller',
+            controller=RemoteController,
+            ip=IP_CONTROLLER,
+            port=PORT_CONTROLLER + i,
+        )
 
-    # Establishing connection via links
-    # connections = [
-    #     (server[1], switch[1]), (server[2], switch[1]), (server[3], switch[2]),
-    #     (server[4], switch[2]), (switch[1], switch[3]), (switch[2], switch[4]),
-    #     (switch[2], switch[3]), (switch[1], switch[4]), (server[5], switch[5]),
-    #     (server[6], switch[5]), (server[7], switch[6]), (server[8], switch[6]),
-    #     (switch[5], switch[7]), (switch[6], switch[8]), (switch[6], switch[7]),
-    #     (switch[5], switch[8]), (server[9], switch[9]), (server[10], switch[9]),
-    #     (server[11], switch[10]), (server[12], switch[10]), (switch[9], switch[11]),
-    #     (switch[10], switch[12]), (switch[10], switch[11]), (switch[9], switch[12]),
-    #     (host[1], switch[13]), (host[2], switch[14]), (host[3], switch[16]),
-    #     (switch[3], switch[13]), (switch[3], switch[14]), (switch[4], switch[14]),
-    #     (switch[7], switch[13]), (switch[7], switch[14]), (switch[7], switch[15]),
-    #     (switch[8], switch[15]), (switch[8], switch[16]), (switch[11], switch[14]),
-    #     (switch[12], switch[15]), (switch[12], switch[16])
-    # ]
-    
-    connections = [
-        (server[1], switch[1]), (server[2], switch[1]), (server[3], switch[2]),
-        (server[4], switch[2]), (switch[1], switch[3]), (switch[2], switch[4]),
-        (server[5], switch[5]),
-        (server[6], switch[5]), (server[7], switch[6]), (server[8], switch[6]),
-        (switch[5], switch[7]), (switch[6], switch[8]),
-        (server[9], switch[9]), (server[10], switch[9]),
-        (server[11], switch[10]), (server[12], switch[10]), (switch[9], switch[11]),
-        (switch[10], switch[12]),
-        (host[1], switch[13]), (host[2], switch[14]), (host[3], switch[16]),
-        (switch[3], switch[14]), (switch[4], switch[14]),
-        (switch[7], switch[13]), (switch[7], switch[14]), (switch[7], switch[15]),
-        (switch[8], switch[15]), (switch[11], switch[14]),
-        (switch[12], switch[15]), (switch[12], switch[16])
-    ]
-    
-    
-    link = {}
-    for i, item in enumerate(connections):
-        link[i] = net.addLink(item[0], item[1], cls=TCLink, bw=BANDWIDTH[0], loss=0)
+    link = dict(enumerate(links))
 
 
     net.build()
@@ -86,13 +37,13 @@ def create_topo():
     for controller in net.controllers:
         controller.start()
     for _, item in switch.items():
-        item.start([controller])
+        item.start(net.controllers)
     # net.start()
     CLI(net)
-    print "net is done..."
+    print("net is done...")
     net.stop()
 
 
 if __name__ == '__main__':
     setLogLevel('info')
-    create_topo()
\ No newline at end of file
+    create_topo(topogen.from_spec(sys.argv[1] if len(sys.argv) > 1 else FABRIC))
\ No newline at end of file
@@ -0,0 +1,88 @@
+import time
+
+
+# Paths being installed (or just installed), by (src mac, dst mac).
+# Packets of a new flow keep reaching the controller, from every switch on the
+# path, until the path's FlowMods are in place. Those duplicates are forwarded
+# along the already computed path instead of computing and installing it again.
+# An entry is kept 'grace' seconds after its install is confirmed, to catch the
+# packets that were already on their way, and entries from an older topology
+# epoch are ignored.
+class PendingInstalls(object):
+
+    def __init__(self, grace=1.0, max_entries=4096):
+        self.grace = grace
+        self.max_entries = max_entries
+        # entries[(src, dst)] -> (epoch, path, PathInstall)
+        self.entries = {}
+        self.coalesced = 0
+
+    def add(self, src, dst, epoch, path, install):
+        if len(self.entries) >= self.max_entries:
+            self._sweep()
+        self.entries[(src, dst)] = (epoch, path, install)
+
+    # returns (path, install) for a duplicate packet-in, or None
+    def get(self, src, dst, epoch):
+        key = (src, dst)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != epoch or self._expired(entry[2], time.time()):
+            del self.entries[key]
+            return None
+        self.coalesced += 1
+        return entry[1], entry[2]
+
+    def remove(self, src, dst):
+        self.entries.pop((src, dst), None)
+
+    def clear(self):
+        self.entries = {}
+
+    def _expired(self, install, now):
+        if not install.done:
+            return False
+        return not install.ok or now - (install.start + install.latency) > self.grace
+
+    def _sweep(self):
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if self._expired(entry[2], now)]:
+            del self.entries[key]
+
+
+# Per-key token bucket rate limiter.
+# Each key (e.g. a source mac) may do 'rate' operations per second on
+# average, with bursts of up to 'burst' operations.
+class RateLimiter(object):
+
+    def __init__(self, rate=100.0, burst=200.0, max_keys=65536):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # buckets[key] -> [tokens, time of last update]
+        self.buckets = {}
+        self.dropped = 0
+
+    # takes a token from key's bucket, returns False if it's empty
+    def allow(self, key):
+        now = time.time()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._sweep(now)
+            bucket = self.buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.dropped += 1
+            return False
+        bucket[0] -= 1
+        return True
+
+    # forgets the buckets which would be full by now anyway
+    def _sweep(self, now):
+        idle = self.burst / self.rate
+        for key in [key for key, bucket in self.buckets.items() if now - bucket[1] > idle]:
+            del self.buckets[key]
@@ -0,0 +1,49 @@
+import json
+
+from ryu.app.wsgi import ControllerBase, Response, route
+
+
+# REST endpoints of the controllers' metrics (see metrics.py), registered with
+# wsgi.register(MetricsController, {'metrics': metrics, 'profiler': profiler}):
+#   GET /metrics          counters, histograms and components stats, as JSON
+#   GET /metrics/profile  cumulative profile of the sampled packet-ins, as text
+class MetricsController(ControllerBase):
+
+    def __init__(self, req, link, data, **config):
+        super(MetricsController, self).__init__(req, link, data, **config)
+        self.metrics = data['metrics']
+        self.profiler = data['profiler']
+
+    @route('metrics', '/metrics', methods=['GET'])
+    def get_metrics(self, req, **kwargs):
+        return Response(content_type='application/json', charset='utf-8',
+                        text=json.dumps(self.metrics.snapshot()))
+
+    @route('metrics', '/metrics/profile', methods=['GET'])
+    def get_profile(self, req, **kwargs):
+        return Response(content_type='text/plain', charset='utf-8',
+                        text=self.profiler.report())
+
+
+# REST endpoint setting the capacity of the links (see PortMonitor.set_capacity),
+# registered with wsgi.register(LinkController, {'set_capacity': fn}), where
+# fn(src dpid, dst dpid, mbps) sets the capacity of the link src->dst:
+#   PUT /links/capacity   [{"src": 1, "dst": 2, "mbps": 5.0}, ...]
+class LinkController(ControllerBase):
+
+    def __init__(self, req, link, data, **config):
+        super(LinkController, self).__init__(req, link, data, **config)
+        self.set_capacity = data['set_capacity']
+
+    @route('links', '/links/capacity', methods=['PUT'])
+    def put_capacity(self, req, **kwargs):
+        try:
+            links = [(int(link['src']), int(link['dst']), float(link['mbps']))
+                     for link in json.loads(req.body.decode('utf-8'))]
+        except (ValueError, KeyError, TypeError) as e:
+            return Response(status=400, content_type='text/plain', charset='utf-8',
+                            text='bad capacities: %s' % e)
+        for src, dst, mbps in links:
+            self.set_capacity(src, dst, mbps)
+        return Response(content_type='application/json', charset='utf-8',
+                        text=json.dumps({'links': len(links)}))
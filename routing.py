@@ -0,0 +1,298 @@
+import heapq
+from collections import OrderedDict
+
+
+# Dijkstra's algorithm using a binary heap,
+# 'neighbors' is a function which, given a switch dpid, returns an iterable
+# of (neighbor dpid, link weight) tuples. If 'dst' is given, the search stops
+# as soon as dst is settled. It returns two dicts: distance[dpid] and
+# previous[dpid], holding only the reachable switches.
+def dijkstra(src, neighbors, dst=None):
+    distance = {src: 0}
+    previous = {src: None}
+    visited = set()
+    heap = [(0, src)]
+
+    while heap:
+        d, u = heapq.heappop(heap)
+        # stale heap entry, u has already been settled with a smaller distance
+        if u in visited:
+            continue
+        visited.add(u)
+        if u == dst:
+            break
+        for v, w in neighbors(u):
+            if v in visited:
+                continue
+            # relaxing the edge (u, v)
+            nd = d + w
+            if v not in distance or nd < distance[v]:
+                distance[v] = nd
+                previous[v] = u
+                heapq.heappush(heap, (nd, v))
+    return distance, previous
+
+
+# walks 'previous' back from dst to src and returns the list of switches on
+# the path (src first). Returns None if dst is not reachable from src.
+def build_path(previous, src, dst):
+    if dst not in previous:
+        return None
+    path = [dst]
+    while path[-1] != src:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
+
+
+# shortest path trees of the given sources on a topology snapshot, as a dict
+# mapping each source to its dijkstra (distance, previous) dicts.
+# It's a module level function so it can be run by worker processes.
+def shortest_path_trees(snapshot, sources):
+    return dict((src, dijkstra(src, snapshot.neighbors)) for src in sources)
+
+
+# adds ports to a list of switches,
+# 'port' is a function which returns the port from s1 to s2.
+# the return format is: List of (switch dpid, switch in-port, switch out-port)
+def add_ports(path, port, first_port, final_port):
+    r = []
+    in_port = first_port
+    for s1, s2 in zip(path[:-1], path[1:]):
+        r.append((s1, in_port, port(s1, s2)))
+        in_port = port(s2, s1)
+    r.append((path[-1], in_port, final_port))
+    return r
+
+
+# replaces the host ports (in-port of the first switch and out-port of the
+# last one) of a path in the add_ports format, returning a new list
+def set_host_ports(path, first_port, final_port):
+    r = list(path)
+    sw, _, out_port = r[0]
+    r[0] = (sw, first_port, out_port)
+    sw, in_port, _ = r[-1]
+    r[-1] = (sw, in_port, final_port)
+    return r
+
+
+# All-pairs shortest-path table.
+# It keeps one dijkstra predecessor tree per source switch, so looking a path
+# up is just walking back from dst to src, i.e. O(path length).
+# The table is rebuilt once per topology change with 'rebuild', or repaired
+# with 'node_added', 'link_added', 'link_removed' and 'node_removed' when a
+# single link or switch changes. In that case, only the source switches whose
+# tree is affected by the change are recomputed.
+# Changes can also be queued with 'defer' and applied together by 'flush',
+# which falls back to a single rebuild when more than 'max_repairs' changes
+# are pending (e.g. a storm of links discovered at bring-up).
+# If 'workers' is set (see workers.RouteWorkers), the trees are computed by
+# workers.trees(sources) instead, which may yield to other greenthreads
+# while they're computed; a flush started meanwhile waits for the first one.
+class PathTable(object):
+
+    def __init__(self, neighbors, max_repairs=8, workers=None):
+        self.neighbors = neighbors
+        self.max_repairs = max_repairs
+        self.workers = workers
+        self.flushing = False
+        # distance[src][dst] -> shortest distance from src to dst
+        self.distance = {}
+        # previous[src][dst] -> switch before dst on the path from src to dst
+        self.previous = {}
+        # queued changes as (method name, args) tuples
+        self.pending = []
+
+    # recomputes the whole table for the given switches
+    def rebuild(self, nodes):
+        self.pending = []
+        trees = self._trees(nodes)
+        self.distance = dict((src, tree[0]) for src, tree in trees.items())
+        self.previous = dict((src, tree[1]) for src, tree in trees.items())
+
+    # recomputes the shortest path tree of one source switch
+    def update_source(self, src):
+        self.update_sources([src])
+
+    # recomputes the shortest path trees of several source switches
+    def update_sources(self, sources):
+        for src, (distance, previous) in self._trees(sources).items():
+            self.distance[src] = distance
+            self.previous[src] = previous
+
+    def _trees(self, sources):
+        if self.workers is not None:
+            return self.workers.trees(sources)
+        return dict((src, dijkstra(src, self.neighbors)) for src in sources)
+
+    # queues a change, e.g. defer('link_added', u, v, w).
+    # The graph must already contain the change when 'flush' is called.
+    def defer(self, change, *args):
+        self.pending.append((change, args))
+
+    # applies the queued changes, 'nodes' is a function returning all the
+    # switches, only called if the table needs to be rebuilt.
+    # returns False if there was nothing to apply
+    def flush(self, nodes):
+        while self.flushing:
+            self.workers.idle()
+        if not self.pending:
+            return False
+        pending, self.pending = self.pending, []
+        self.flushing = True
+        try:
+            if len(pending) > self.max_repairs:
+                self.rebuild(nodes())
+            else:
+                for change, args in pending:
+                    getattr(self, change)(*args)
+        finally:
+            self.flushing = False
+        return True
+
+    # list of switches on the shortest path from src to dst, or None
+    def path(self, src, dst):
+        if src not in self.previous:
+            return None
+        return build_path(self.previous[src], src, dst)
+
+    # shortest distance from src to dst, Inf if it's not reachable
+    def get_distance(self, src, dst):
+        return self.distance.get(src, {}).get(dst, float('Inf'))
+
+    # all the neighbors of src which are on a shortest path from src to dst
+    # (more than one if there are equal-cost paths)
+    def next_hops(self, src, dst):
+        d = self.get_distance(src, dst)
+        if src == dst or d == float('Inf'):
+            return []
+        return [v for v, w in self.neighbors(src)
+                if w + self.get_distance(v, dst) <= d + 1e-9]
+
+    # neighbor of src to fail over to when the links to its next hops towards
+    # dst go down: the closest other neighbor whose own shortest path to dst
+    # doesn't come back through src, so it can't use the failed links either
+    # (a loop-free alternate, RFC 5286). None if there's no such neighbor.
+    def backup_next_hop(self, src, dst):
+        primary = self.next_hops(src, dst)
+        if not primary:
+            return None
+        d = self.get_distance(src, dst)
+        best, best_cost = None, float('Inf')
+        for v, w in self.neighbors(src):
+            if v in primary:
+                continue
+            dv = self.get_distance(v, dst)
+            if dv < self.get_distance(v, src) + d - 1e-9 and w + dv < best_cost:
+                best, best_cost = v, w + dv
+        return best
+
+    # all the equal-cost shortest paths from src to dst, as a dict mapping
+    # each switch on them (but dst) to its next hops towards dst
+    def dag(self, src, dst):
+        dag = {}
+        stack = [src]
+        while stack:
+            u = stack.pop()
+            if u in dag or u == dst:
+                continue
+            dag[u] = self.next_hops(u, dst)
+            stack.extend(dag[u])
+        return dag
+
+    # must be called after a new switch is added to the graph
+    def node_added(self, node):
+        self.update_source(node)
+
+    # must be called after the link u->v with weight w is added to the graph
+    # (or after its weight is decreased). A source tree changes only if the
+    # new link makes the way to v shorter.
+    def link_added(self, u, v, w):
+        sources = [src for src in self.distance
+                   if self.get_distance(src, u) + w < self.get_distance(src, v)]
+        if u not in self.distance:
+            sources.append(u)
+        self.update_sources(sources)
+
+    # must be called after the link u->v is removed from the graph
+    # (or after its weight is increased). Only trees using that link change.
+    def link_removed(self, u, v):
+        self.update_sources([src for src in self.previous
+                             if v != src and self.previous[src].get(v) == u])
+
+    # must be called after the switch and its links are removed from the graph
+    def node_removed(self, node):
+        self.distance.pop(node, None)
+        self.previous.pop(node, None)
+        self.update_sources([src for src in self.previous if node in self.previous[src]])
+
+
+# A bounded LRU cache of paths keyed by (src switch, dst switch).
+# Every entry remembers the topology epoch it was computed in, and
+# 'bump_epoch' (to be called on each topology change) makes all the older
+# entries stale, so they are dropped when they're looked up next time.
+# Hits, misses and evictions are counted for monitoring.
+class PathCache(object):
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.epoch = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # invalidates all cached paths
+    def bump_epoch(self):
+        self.epoch += 1
+
+    # returns the cached value for (src, dst), or None if not (or no longer) cached
+    def get(self, src, dst):
+        key = (src, dst)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != self.epoch:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, src, dst, value):
+        key = (src, dst)
+        self.entries[key] = (self.epoch, value)
+        self.entries.move_to_end(key)
+        # evicting the least recently used entries
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'epoch': self.epoch,
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# spanning tree (forest, if the graph isn't connected) of the given switches,
+# made by a breadth first search from the smallest dpid of each component.
+# returns the list of tree links as (parent, child) tuples
+def spanning_tree(nodes, neighbors):
+    visited = set()
+    tree = []
+    for root in sorted(nodes):
+        if root in visited:
+            continue
+        visited.add(root)
+        queue = [root]
+        for u in queue:
+            for v, _ in neighbors(u):
+                if v not in visited:
+                    visited.add(v)
+                    tree.append((u, v))
+                    queue.append(v)
+    return tree
@@ -0,0 +1,426 @@
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+
+import topogen
+
+
+# Link capacity and traffic load scenarios, for the weighted routing
+# experiments in Mininet (see Topo.py).
+# A scenario is a list of timed events, which can be generated from per-link
+# schedules or loaded from a file, so a run can be replayed exactly:
+#   TIME bw LINK MBPS                  sets the bandwidth of a link
+#   TIME load SRC DST MBPS SECONDS     UDP traffic from host SRC to host DST
+# Links are named as in topogen.link_names ('S1-S2' between switches, the
+# host's name for the link of a host) and hosts by their fabric names (h1, h2, ...)
+# Events are kept as (time, 'bw', (link, mbps)) and
+# (time, 'load', (src, dst, mbps, seconds)) tuples, sorted by time.
+#
+# The ScenarioPlayer applies the events on time, the bandwidth changes of a
+# same instant concurrently, and records what was really applied (and the
+# throughput the loads got) as the ground truth. It can then be compared
+# with the link weights logged by the controller (WEIGHT_LOG), and the runs
+# with and without adaptive weights (ADAPTIVE_WEIGHTS=0) with each other:
+#   python scenario.py generate new_topo.fab --loads 50 > trace
+#   python scenario.py lag truth.jsonl weights.jsonl
+#   python scenario.py compare truth-adaptive.jsonl truth-static.jsonl
+
+
+# schedules
+
+# every 'period' seconds, each of the links gets one of 'values' at random
+def random_flips(links, values, period, duration, rand):
+    events = []
+    k = 1
+    while k * period < duration:
+        for link in links:
+            events.append((k * period, 'bw', (link, rand.choice(values))))
+        k += 1
+    return events
+
+
+# the link alternates between 'high' and 'low' every half period
+def square(link, low, high, period, duration, phase=0.0):
+    events = []
+    k = 0
+    while phase + k * period / 2.0 < duration:
+        events.append((phase + k * period / 2.0, 'bw', (link, high if k % 2 else low)))
+        k += 1
+    return events
+
+
+# the bandwidth moves by up to 'step' Mbps every period, within [low, high]
+def random_walk(link, low, high, step, period, duration, rand):
+    events = []
+    bw = rand.uniform(low, high)
+    k = 1
+    while k * period < duration:
+        bw = min(high, max(low, bw + rand.uniform(-step, step)))
+        events.append((k * period, 'bw', (link, round(bw, 2))))
+        k += 1
+    return events
+
+
+# the link drops to 'low' Mbps for 'length' seconds, then gets 'bw' back
+def outage(link, start, length, bw, low=0.1):
+    return [(start, 'bw', (link, low)), (start + length, 'bw', (link, bw))]
+
+
+# 'count' loads between random pairs of hosts, starting at random times
+def random_loads(hosts, count, mbps, seconds, duration, rand):
+    events = []
+    for _ in range(count):
+        src, dst = rand.sample(hosts, 2)
+        events.append((round(rand.uniform(0, max(duration - seconds, 0)), 3), 'load',
+                       (src, dst, mbps, seconds)))
+    return events
+
+
+# trace files
+
+def parse(text):
+    events = []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        try:
+            t, kind = float(words[0]), words[1]
+            if kind == 'bw':
+                events.append((t, kind, (words[2], float(words[3]))))
+            elif kind == 'load':
+                events.append((t, kind, (words[2], words[3], float(words[4]), float(words[5]))))
+            else:
+                raise ValueError('unknown event %s' % kind)
+        except (ValueError, IndexError) as e:
+            raise ValueError('line %d: %s' % (number, e))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def dumps(events):
+    lines = []
+    for t, kind, args in sorted(events, key=lambda event: event[0]):
+        words = ['%g' % arg if isinstance(arg, float) else str(arg) for arg in args]
+        lines.append('%s %s %s\n' % (('%.3f' % t).rstrip('0').rstrip('.'), kind, ' '.join(words)))
+    return ''.join(lines)
+
+
+def load(path):
+    with open(path) as f:
+        return parse(f.read())
+
+
+def save(events, path):
+    with open(path, 'w') as f:
+        f.write(dumps(events))
+
+
+# The ground truth of a run: one JSON object per line, with the time it
+# was recorded at. Records can come from several threads. The log of a
+# previous run at the same path is overwritten, so it can't be mixed up
+# with this one.
+class GroundTruth(object):
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.lock = threading.Lock()
+
+    def record(self, kind, **fields):
+        fields['time'] = time.time()
+        fields['kind'] = kind
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Plays the events of a scenario, in a thread.
+# set_bandwidth(link, mbps) is called from up to 'workers' threads at once
+# for the changes due at the same time (never twice at once for the same
+# link), start_load(src, dst, mbps, seconds) must not block.
+class ScenarioPlayer(object):
+
+    def __init__(self, events, set_bandwidth, start_load=None, truth=None, workers=8):
+        self.events = sorted(events, key=lambda event: event[0])
+        self.set_bandwidth = set_bandwidth
+        self.start_load = start_load
+        self.truth = truth
+        self.workers = workers
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start_time = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        self.start_time = time.time()
+        if self.truth is not None:
+            self.truth.record('start', events=len(self.events))
+        i = 0
+        while i < len(self.events) and not self.stopped.is_set():
+            t = self.events[i][0]
+            j = i
+            while j < len(self.events) and self.events[j][0] == t:
+                j += 1
+            delay = self.start_time + t - time.time()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+            self.apply(t, self.events[i:j])
+            i = j
+        if self.truth is not None:
+            self.truth.record('end')
+
+    def apply(self, t, events):
+        # the last change of each link wins
+        changes = dict(args for _, kind, args in events if kind == 'bw')
+        links = sorted(changes)
+        threads = []
+        for k in range(min(self.workers, len(links))):
+            thread = threading.Thread(target=self.change, args=(t, [(link, changes[link])
+                                                                    for link in links[k::self.workers]]))
+            thread.start()
+            threads.append(thread)
+        for _, kind, args in events:
+            if kind == 'load' and self.start_load is not None:
+                self.start_load(*args)
+                if self.truth is not None:
+                    self.truth.record('load', src=args[0], dst=args[1], mbps=args[2],
+                                      seconds=args[3], scheduled=t)
+        for thread in threads:
+            thread.join()
+
+    def change(self, t, changes):
+        for link, mbps in changes:
+            self.set_bandwidth(link, mbps)
+            if self.truth is not None:
+                self.truth.record('bw', link=link, mbps=mbps, scheduled=t,
+                                  late=time.time() - self.start_time - t)
+
+
+# Tells the controller the capacity of the switch links (PUT /links/capacity,
+# see rest.py), so its link weights are computed from the bandwidth really
+# given to the links rather than from an assumed one. Host links are skipped,
+# the controller doesn't weigh them. A controller which can't be reached
+# doesn't stop the scenario, the failures are counted.
+class CapacityFeed(object):
+
+    def __init__(self, url, timeout=2.0):
+        self.url = url.rstrip('/') + '/links/capacity'
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+
+    # 'changes' is a list of (link name, mbps)
+    def send(self, changes):
+        links = []
+        for name, mbps in changes:
+            if '-' in name:
+                s1, s2 = [int(s) for s in name.split('-')]
+                links += [{'src': s1, 'dst': s2, 'mbps': mbps}, {'src': s2, 'dst': s1, 'mbps': mbps}]
+        if not links:
+            return
+        request = urllib.request.Request(self.url, data=json.dumps(links).encode(), method='PUT',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+            self.sent += 1
+        except (IOError, OSError):
+            self.failed += 1
+
+
+# Applies the scenario to a Mininet network built with topogen.build_mininet.
+# tc commands run in the shell of the node of each interface, so there's a
+# lock per node: changes to links of different nodes run concurrently, and
+# the net itself is never locked. Loads are iperf UDP clients started with
+# popen (not through the node's shell), whose server reports give the
+# throughput they really got.
+# With a CapacityFeed, the controller is told every new bandwidth.
+class MininetDriver(object):
+
+    def __init__(self, net, fabric, links, truth=None, feed=None):
+        self.net = net
+        self.truth = truth
+        self.feed = feed
+        self.links = dict(zip(topogen.link_names(fabric), links))
+        self.locks = dict((node.name, threading.Lock()) for node in net.hosts + net.switches)
+        self.servers = []
+        self.clients = []
+
+    def set_bandwidth(self, name, mbps):
+        link = self.links[name]
+        for intf in (link.intf1, link.intf2):
+            with self.locks[intf.node.name]:
+                intf.config(bw=mbps)
+        if self.feed is not None:
+            self.feed.send([(name, mbps)])
+
+    def start_servers(self):
+        for host in self.net.hosts:
+            self.servers.append(host.popen(['iperf', '-s', '-u']))
+
+    def start_load(self, src, dst, mbps, seconds):
+        thread = threading.Thread(target=self.load, args=(src, dst, mbps, seconds))
+        thread.daemon = True
+        thread.start()
+        self.clients.append(thread)
+
+    def load(self, src, dst, mbps, seconds):
+        process = self.net.get(src).popen(['iperf', '-c', self.net.get(dst).IP(), '-u',
+                                           '-b', '%gM' % mbps, '-t', '%d' % max(1, int(seconds)),
+                                           '-f', 'm'])
+        output = process.communicate()[0]
+        if not isinstance(output, str):
+            output = output.decode('utf-8', 'replace')
+        rates = re.findall(r'([\d.]+) Mbits/sec', output)
+        if self.truth is not None:
+            # the last rate is the server report's, i.e. what got through
+            self.truth.record('throughput', src=src, dst=dst, offered=mbps,
+                              mbps=float(rates[-1]) if rates else 0.0)
+
+    def stop(self):
+        for thread in self.clients:
+            thread.join(1.0)
+        for process in self.servers:
+            process.terminate()
+
+
+# analysis
+
+def read_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# how long after each bandwidth change of a switch link the controller
+# changed the weight of the link (before the next change of that link)
+def tracking(truth, weights):
+    changes = {}
+    for row in truth:
+        if row['kind'] == 'bw' and '-' in row['link']:
+            s1, s2 = [int(s) for s in row['link'].split('-')]
+            changes.setdefault((min(s1, s2), max(s1, s2)), []).append(row['time'])
+    updates = {}
+    for row in weights:
+        key = (min(row['src'], row['dst']), max(row['src'], row['dst']))
+        updates.setdefault(key, []).append(row['time'])
+    lags = []
+    missed = 0
+    for key, times in changes.items():
+        times.sort()
+        seen = sorted(updates.get(key, []))
+        for k, t in enumerate(times):
+            end = times[k + 1] if k + 1 < len(times) else float('inf')
+            lag = next((u - t for u in seen if t <= u < end), None)
+            if lag is None:
+                missed += 1
+            else:
+                lags.append(lag)
+    return {
+        'changes': len(lags) + missed,
+        'tracked': len(lags),
+        'missed': missed,
+        'lag_p50_s': percentile(lags, 0.5),
+        'lag_p90_s': percentile(lags, 0.9),
+        'lag_max_s': max(lags) if lags else 0.0,
+    }
+
+
+def throughput(truth):
+    rows = [row for row in truth if row['kind'] == 'throughput']
+    offered = sum(row['offered'] for row in rows)
+    got = sum(row['mbps'] for row in rows)
+    return {
+        'loads': len(rows),
+        'offered_mbps': offered,
+        'mbps': got,
+        'delivered': got / offered if offered else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='link bandwidth and traffic load scenarios')
+    commands = parser.add_subparsers(dest='command')
+    generate = commands.add_parser('generate', help='writes a scenario trace')
+    generate.add_argument('fabric', help='topology spec or file, see topogen.from_spec')
+    generate.add_argument('--schedule', choices=['flips', 'square', 'walk', 'outage'],
+                          default='flips')
+    generate.add_argument('--duration', type=float, default=600.0)
+    generate.add_argument('--period', type=float, default=10.0)
+    generate.add_argument('--low', type=float, default=1.0)
+    generate.add_argument('--high', type=float, default=5.0)
+    generate.add_argument('--loads', type=int, default=0, help='number of iperf loads')
+    generate.add_argument('--load-mbps', type=float, default=2.0)
+    generate.add_argument('--load-seconds', type=float, default=30.0)
+    generate.add_argument('--seed', type=int, default=0)
+    lag = commands.add_parser('lag', help='how fast the controller weights track the links')
+    lag.add_argument('truth')
+    lag.add_argument('weights')
+    compare = commands.add_parser('compare', help='throughput of two runs of a scenario')
+    compare.add_argument('truth', nargs=2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        rand = random.Random(args.seed)
+        fabric = topogen.from_spec(args.fabric)
+        links = ['%d-%d' % (s1, s2) for s1, _, s2, _ in fabric.links]
+        if args.schedule == 'flips':
+            events = random_flips(links, [args.high, args.low], args.period, args.duration, rand)
+        elif args.schedule == 'outage':
+            # every period, a random link is down to 'low' for half of it
+            events = []
+            k = 1
+            while k * args.period < args.duration:
+                events += outage(rand.choice(links), k * args.period, args.period / 2.0,
+                                 args.high, args.low)
+                k += 1
+        else:
+            events = []
+            for link in links:
+                if args.schedule == 'square':
+                    events += square(link, args.low, args.high, args.period, args.duration,
+                                     rand.uniform(0, args.period))
+                else:
+                    events += random_walk(link, args.low, args.high, (args.high - args.low) / 4.0,
+                                          args.period, args.duration, rand)
+        hosts = list(fabric.host_names)
+        if len(hosts) > 1:
+            events += random_loads(hosts, args.loads, args.load_mbps, args.load_seconds,
+                                   args.duration, rand)
+        sys.stdout.write(dumps(events))
+    elif args.command == 'lag':
+        sys.stdout.write(json.dumps(tracking(read_log(args.truth), read_log(args.weights)),
+                                    indent=2, sort_keys=True) + '\n')
+    elif args.command == 'compare':
+        a, b = [throughput(read_log(path)) for path in args.truth]
+        a['gain'] = a['mbps'] / b['mbps'] - 1 if b['mbps'] else 0.0
+        sys.stdout.write(json.dumps({'a': a, 'b': b}, indent=2, sort_keys=True) + '\n')
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
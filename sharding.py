@@ -0,0 +1,151 @@
+import json
+import socket
+import time
+
+
+# Partition of the switches among several controller instances.
+# Every switch connects to all the instances; the one owning its dpid asks
+# to be its OpenFlow MASTER (and gets its packet-ins and FlowMods), the
+# others stay SLAVE and only follow its ports and links.
+class Shard(object):
+
+    def __init__(self, index=0, count=1):
+        self.index = index
+        self.count = count
+        # generation id of the last role request
+        self.generation = 0
+
+    def owns(self, dpid):
+        return dpid % self.count == self.index
+
+    # generation id of a new role request. They increase with every request,
+    # and across restarts of the instance since they start from the current
+    # time (in ms), so a switch rejects the requests of a stale master.
+    def generation_id(self):
+        self.generation = max(self.generation + 1, int(time.time() * 1000))
+        return self.generation
+
+    # OFPCR_ROLE_* the instance asks for on the given switch
+    def role(self, ofproto, dpid):
+        if self.count == 1:
+            return ofproto.OFPCR_ROLE_EQUAL
+        if self.owns(dpid):
+            return ofproto.OFPCR_ROLE_MASTER
+        return ofproto.OFPCR_ROLE_SLAVE
+
+
+# Publish/subscribe between the instances of a shard set on the same host.
+# Every instance listens on UDP port base_port + index of 'host' and
+# publishes its messages, (topic, args) encoded as JSON, to all the others.
+# The instance's receive loop must call handle() with every datagram read
+# from 'sock'; it calls the functions subscribed to the message topic.
+# UDP may drop datagrams, so the messages of each instance are numbered and
+# handled in order by the others. A receiver seeing a gap holds the later
+# messages and asks the sender for the missing ones ('nack'), which are
+# resent from the sender's last 'history' messages. heartbeat(), to be called
+# periodically, tells the others the last number sent, so a lost message that
+# isn't followed by another one is asked for too. A message too old to be
+# resent is counted in 'lost' and skipped. The numbers start again when an
+# instance restarts, which the others tell from its 'incarnation'.
+class PeerBus(object):
+
+    def __init__(self, shard, base_port=6700, host='127.0.0.1', history=4096):
+        self.shard = shard
+        self.host = host
+        self.base_port = base_port
+        # handlers[topic] -> list of functions called with the message args
+        self.handlers = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, base_port + shard.index))
+        # start time (in ms) of the instance, sent with its messages
+        self.incarnation = int(time.time() * 1000)
+        # number of the last message published
+        self.seq = 0
+        # messages[seq] -> datagram of the last 'history' messages published
+        self.messages = {}
+        self.history = history
+        # peers[index] -> [incarnation, next seq expected, {seq: held message}]
+        self.peers = {}
+        self.sent = 0
+        self.received = 0
+        self.resent = 0
+        self.lost = 0
+
+    def subscribe(self, topic, fn):
+        self.handlers.setdefault(topic, []).append(fn)
+
+    def publish(self, topic, *args):
+        self.seq += 1
+        data = self._encode('msg', self.seq, topic, args)
+        self.messages[self.seq] = data
+        self.messages.pop(self.seq - self.history, None)
+        for i in range(self.shard.count):
+            if i != self.shard.index:
+                self._send(i, data)
+                self.sent += 1
+
+    # tells the other instances the number of the last message published
+    def heartbeat(self):
+        data = self._encode('beat', self.seq)
+        for i in range(self.shard.count):
+            if i != self.shard.index:
+                self._send(i, data)
+
+    # reads one datagram, blocking (cooperatively, under eventlet)
+    def recv(self):
+        return self.sock.recv(65535)
+
+    def handle(self, data):
+        kind, index, incarnation, seq, topic, args = json.loads(data.decode())
+        if kind == 'nack':
+            self._resend(index, seq, args[0])
+            return
+        peer = self.peers.get(index)
+        if peer is None or peer[0] != incarnation:
+            # a restarted peer numbers its messages from 1 again, while a peer
+            # seen for the first time has published the earlier ones before
+            # this instance was listening
+            if peer is not None:
+                first = 1
+            else:
+                first = seq + 1 if kind == 'beat' else seq
+            peer = self.peers[index] = [incarnation, first, {}]
+        if kind == 'beat':
+            if seq >= peer[1]:
+                self._send(index, self._encode('nack', peer[1], None, [seq]))
+            return
+        if seq < peer[1]:
+            return
+        peer[2][seq] = (topic, args)
+        # the gap is asked for once, the next heartbeat asks for it again
+        if seq > peer[1] and len(peer[2]) == 1:
+            self._send(index, self._encode('nack', peer[1], None, [seq - 1]))
+        # the messages which are next in order are handled
+        while peer[1] in peer[2]:
+            topic, args = peer[2].pop(peer[1])
+            peer[1] += 1
+            if topic is None:
+                self.lost += 1
+                continue
+            self.received += 1
+            for fn in self.handlers.get(topic, []):
+                fn(*args)
+
+    # resends the messages first..last to the instance 'index', those which
+    # aren't in the history anymore are sent without a topic, to be skipped
+    def _resend(self, index, first, last):
+        for seq in range(first, min(last, self.seq) + 1):
+            data = self.messages.get(seq)
+            if data is None:
+                data = self._encode('msg', seq, None, [])
+            self._send(index, data)
+            self.resent += 1
+
+    def _encode(self, kind, seq, topic=None, args=()):
+        return json.dumps([kind, self.shard.index, self.incarnation, seq, topic, args]).encode()
+
+    def _send(self, index, data):
+        self.sock.sendto(data, (self.host, self.base_port + index))
+
+    def close(self):
+        self.sock.close()
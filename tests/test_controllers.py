@@ -0,0 +1,421 @@
+import pytest
+
+from topogen import leaf_spine
+from harness import AppHarness, Obj
+
+APPS = ['new_controller', 'controller']
+
+
+@pytest.fixture(params=APPS)
+def harness(request):
+    harness = AppHarness(request.param, leaf_spine(3, 2, 2))
+    harness.connect()
+    yield harness
+    harness.close()
+
+
+def path(harness, src, dst):
+    module = harness.module
+    module.path_table.flush(module.topology.switches)
+    return module.path_table.path(src, dst)
+
+
+def test_links_are_added_both_ways(harness):
+    topology = harness.module.topology
+    for s1, p1, s2, p2 in harness.fabric.links:
+        assert topology.port(s1, s2) == p1 and topology.port(s2, s1) == p2
+    assert len(path(harness, 3, 4)) == 3
+
+
+def test_deleted_links_are_routed_around(harness):
+    # leaf 3 is linked to spines 1 and 2, through ports 1 and 2
+    harness.handle('link_delete', link=harness.link(3, 1, 1, 1))
+    topology = harness.module.topology
+    assert topology.port(3, 1) is None and topology.port(1, 3) is None
+    assert path(harness, 3, 4) == [3, 2, 4]
+    assert path(harness, 4, 3) == [4, 2, 3]
+
+
+def test_switches_leave_with_their_links(harness):
+    harness.handle('leave', switch=harness.switch(2))
+    harness.handle('leave', switch=harness.switch(1))
+    topology = harness.module.topology
+    assert 1 not in topology and 2 not in topology
+    assert path(harness, 3, 4) is None
+
+
+def test_slow_links_are_avoided(harness):
+    # leaf 3 reaches spine 1 through port 1
+    harness.app.set_link_capacity(3, 1, 1.0)
+    assert path(harness, 3, 4) == [3, 2, 4]
+
+
+def test_capacity_is_kept_when_the_link_is_seen_again(harness):
+    topology = harness.module.topology
+    harness.app.set_link_capacity(3, 1, 1.0)
+    # ryu sends the events of both directions again, e.g. after a reconnection
+    harness.handle('link_add', link=harness.link(3, 1, 1, 1))
+    harness.handle('link_add', link=harness.link(1, 1, 3, 1))
+    assert topology.weight(3, 1) == 5.0 and topology.weight(1, 3) == 1.0
+    assert path(harness, 3, 4) == [3, 2, 4]
+    # a link added again after it was gone gets the weight of its capacity back
+    harness.handle('link_delete', link=harness.link(3, 1, 1, 1))
+    harness.handle('link_add', link=harness.link(3, 1, 1, 1))
+    harness.handle('link_add', link=harness.link(1, 1, 3, 1))
+    assert topology.weight(3, 1) == 5.0
+    assert path(harness, 3, 4) == [3, 2, 4]
+
+
+def test_packet_in_installs_a_path(harness):
+    harness.learn_hosts()
+    hosts = harness.fabric.hosts
+    harness.sent.clear()
+    harness.packet(hosts[0], hosts[-1])
+    # one rule on each of the 3 switches of the path
+    assert harness.sent['OFPFlowMod'] == 3
+    # the packet is only sent once the rules are confirmed
+    assert 'OFPPacketOut' not in harness.sent
+    harness.reply_barriers()
+    assert harness.sent['OFPPacketOut'] == 1
+
+
+def test_packet_in_of_a_pending_pair_is_coalesced(harness):
+    harness.learn_hosts()
+    hosts = harness.fabric.hosts
+    harness.packet(hosts[0], hosts[-1])
+    harness.sent.clear()
+    # a duplicate coming while the rules are being installed
+    harness.packet(hosts[0], hosts[-1])
+    harness.reply_barriers()
+    assert harness.sent.get('OFPFlowMod', 0) == 0
+    assert harness.sent['OFPPacketOut'] == 2
+
+
+def test_leaving_switch_releases_the_packet(harness):
+    harness.learn_hosts()
+    hosts = harness.fabric.hosts
+    harness.sent.clear()
+    harness.packet(hosts[0], hosts[-1])
+    # the egress switch leaves before answering its barrier
+    harness.datapaths[hosts[-1][2]].barriers = []
+    harness.reply_barriers()
+    assert 'OFPPacketOut' not in harness.sent
+    harness.handle('leave', switch=harness.switch(hosts[-1][2]))
+    assert harness.sent['OFPPacketOut'] == 1
+
+
+def test_reconnected_switch_replaces_its_datapath(harness):
+    old = harness.datapaths[3]
+    new = harness.datapaths[3] = type(old)(3, old.ofproto, old.ofproto_parser, harness.sent)
+    harness.handle('reconnected', switch=harness.switch(3))
+    assert harness.app.datapaths.get(3) is new
+    # a late leave of the old connection is ignored
+    harness.handle('leave', switch=Obj(dp=old, ports=[]))
+    assert harness.app.datapaths.get(3) is new and 3 in harness.module.topology
+    # and the paths are installed through the new connection
+    harness.learn_hosts()
+    new.sent = {}
+    harness.packet(harness.fabric.hosts[0], harness.fabric.hosts[-1])
+    assert new.sent['OFPFlowMod'] == 1
+
+
+def test_lldp_and_runt_frames_are_dropped(harness):
+    datapath = harness.datapaths[3]
+    harness.sent.clear()
+    for data in (bytes(12) + b'\x88\xcc' + bytes(46), bytes(10)):
+        harness.handle('packet_in', msg=Obj(datapath=datapath, match={'in_port': 1}, data=data,
+                                            buffer_id=harness.ofproto.OFP_NO_BUFFER,
+                                            msg_len=len(data), total_len=len(data)))
+    assert harness.sent == {}
+
+
+def test_floods_go_through_the_tree_groups(harness):
+    harness.sent.clear()
+    harness.learn_hosts()
+    # one flood group per switch, added by the first flood
+    assert harness.sent['OFPGroupMod'] == len(harness.datapaths)
+    harness.sent.clear()
+    datapath = harness.datapaths[3]
+    datapath.msgs = []
+    harness.packet(harness.fabric.hosts[0], ('ff:ff:ff:ff:ff:ff',))
+    assert 'OFPGroupMod' not in harness.sent
+    out, = [msg for msg in datapath.msgs if type(msg).__name__ == 'OFPPacketOut']
+    assert type(out.actions[0]).__name__ == 'OFPActionGroup'
+
+
+def test_floods_only_update_the_switches_which_changed(harness):
+    harness.learn_hosts()
+    flood = harness.app.network.flood
+    checked = []
+    flood_ports = flood.flood_ports
+    flood.flood_ports = lambda dpid: checked.append(dpid) or flood_ports(dpid)
+    harness.sent.clear()
+    harness.packet(harness.fabric.hosts[0], ('ff:ff:ff:ff:ff:ff',))
+    assert checked == [] and 'OFPGroupMod' not in harness.sent
+    # a new host port on leaf 4
+    flood.add_port(4, 9)
+    harness.packet(harness.fabric.hosts[0], ('ff:ff:ff:ff:ff:ff',))
+    assert checked == [4] and harness.sent['OFPGroupMod'] == 1
+
+
+def test_connecting_switch_gets_its_groups_again(harness):
+    harness.learn_hosts()
+    datapath = harness.datapaths[3]
+    datapath.msgs = []
+    harness.handle('features', msg=Obj(datapath=datapath))
+    harness.packet(harness.fabric.hosts[0], ('ff:ff:ff:ff:ff:ff',))
+    groups = [msg for msg in datapath.msgs if type(msg).__name__ == 'OFPGroupMod']
+    ofproto = harness.ofproto
+    assert [(msg.command, msg.group_id) for msg in groups] == [
+        (ofproto.OFPGC_DELETE, ofproto.OFPG_ALL), (ofproto.OFPGC_ADD, groups[1].group_id)]
+
+
+def test_arp_requests_for_known_hosts_are_answered(harness):
+    a, b = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    harness.learn_hosts()
+    # b's address is learned from its own request
+    harness.arp_request(b, a)
+    datapath = harness.datapaths[a[2]]
+    datapath.msgs = []
+    harness.sent.clear()
+    harness.arp_request(a, b)
+    out, = datapath.msgs
+    assert out.actions[0].port == a[3]
+    assert harness.sent == {'OFPPacketOut': 1}
+
+
+@pytest.fixture(params=APPS)
+def dest(request):
+    harness = AppHarness(request.param, leaf_spine(3, 2, 2), mode='destination')
+    harness.connect()
+    harness.learn_hosts()
+    yield harness
+    harness.close()
+
+
+def test_destination_tree_covers_every_switch(dest):
+    hosts = dest.fabric.hosts
+    dest.sent.clear()
+    dest.packet(hosts[0], hosts[-1])
+    # one eth_dst rule per switch, and a select group on the two other
+    # leaves, which reach the host through both spines
+    assert dest.sent['OFPFlowMod'] == len(dest.datapaths)
+    assert dest.sent['OFPGroupMod'] == 2
+    dest.reply_barriers()
+    assert dest.sent['OFPPacketOut'] == 1
+    # other sources use the same tree
+    dest.sent.clear()
+    dest.packet(hosts[2], hosts[-1])
+    assert dest.sent == {'OFPPacketOut': 1}
+
+
+def test_connecting_switch_gets_its_destination_rules_again(dest):
+    hosts = dest.fabric.hosts
+    dest.packet(hosts[0], hosts[-1])
+    dest.reply_barriers()
+    datapath = dest.datapaths[3]
+    dest.handle('features', msg=Obj(datapath=datapath))
+    datapath.msgs = []
+    # the topology changes elsewhere, so the tree is refreshed
+    dest.handle('link_delete', link=dest.link(4, 1, 1, 2))
+    dest.packet(hosts[0], hosts[-1])
+    ofproto = dest.ofproto
+    groups = [msg for msg in datapath.msgs if type(msg).__name__ == 'OFPGroupMod'
+              and msg.type == ofproto.OFPGT_SELECT]
+    assert [msg.command for msg in groups] == [ofproto.OFPGC_ADD]
+
+
+def test_forgotten_host_gets_its_tree_and_groups_deleted(dest):
+    hosts = dest.fabric.hosts
+    dst = hosts[-1]
+    dest.packet(hosts[0], dst)
+    dest.reply_barriers()
+    groups = dest.app.network.groups
+    group_id = groups.ids[('dst', dst[0])]
+    datapath = dest.datapaths[hosts[0][2]]
+    datapath.msgs = []
+    dest.handle('port_delete', port=Obj(dpid=dst[2], port_no=dst[3]))
+    ofproto = dest.ofproto
+    assert [(type(msg).__name__, msg.command) for msg in datapath.msgs] == [
+        ('OFPFlowMod', ofproto.OFPFC_DELETE_STRICT), ('OFPGroupMod', ofproto.OFPGC_DELETE)]
+    assert datapath.msgs[1].group_id == group_id
+    assert groups.ids == {} and groups.added == set() and groups.free == [group_id]
+    assert dest.app.network.dest.installed == {}
+
+
+def test_moving_host_gets_a_new_tree(dest):
+    hosts = dest.fabric.hosts
+    dst = hosts[-1]
+    dest.packet(hosts[0], dst)
+    dest.reply_barriers()
+    groups = dest.app.network.groups
+    group_id = groups.ids[('dst', dst[0])]
+    old, new = dest.datapaths[hosts[0][2]], dest.datapaths[dst[2]]
+    old.msgs, new.msgs = [], []
+    # dst shows up behind the first leaf, which doesn't need a group towards
+    # it anymore, while its old leaf now reaches it through both spines
+    dest.packet((dst[0], dst[1], old.id, 5), ('ff:ff:ff:ff:ff:ff',))
+    ofproto = dest.ofproto
+    assert [(msg.command, msg.group_id) for msg in old.msgs
+            if type(msg).__name__ == 'OFPGroupMod'] == [(ofproto.OFPGC_DELETE, group_id)]
+    assert [msg.command for msg in new.msgs
+            if type(msg).__name__ == 'OFPGroupMod'] == [ofproto.OFPGC_ADD]
+    assert (old.id, group_id) not in groups.added
+
+
+@pytest.fixture(params=APPS)
+def ecmp(request):
+    harness = AppHarness(request.param, leaf_spine(3, 2, 2), mode='ecmp')
+    harness.connect()
+    harness.learn_hosts()
+    yield harness
+    harness.close()
+
+
+def test_ecmp_groups_are_shared_by_the_pairs(ecmp):
+    hosts = ecmp.fabric.hosts
+    ecmp.sent.clear()
+    for src in hosts:
+        for dst in hosts:
+            if src is not dst:
+                ecmp.packet(src, dst)
+                ecmp.reply_barriers()
+    # every leaf reaches the others through its two spine ports: one select
+    # group for all the pairs, added once on each leaf
+    groups = ecmp.app.network.groups
+    assert len(groups.ids) == 1 and len(groups.added) == 3
+    assert ecmp.sent['OFPGroupMod'] == 3
+
+
+def test_ecmp_pairs_are_moved_off_a_deleted_link(ecmp):
+    hosts = ecmp.fabric.hosts
+    src, dst = hosts[0], hosts[-1]
+    ecmp.packet(src, dst)
+    ecmp.reply_barriers()
+    routing = ecmp.app.network.ecmp
+    assert routing.installed[(3, src[0], dst[0])] == (1, 2)
+    ecmp.sent.clear()
+    ecmp.handle('link_delete', link=ecmp.link(3, 1, 1, 1))
+    ecmp.reply_barriers()
+    assert routing.installed[(3, src[0], dst[0])] == (2,)
+    # spine 1 isn't on the path anymore, its rule is deleted
+    assert (1, src[0], dst[0]) not in routing.installed
+    assert ecmp.sent['OFPFlowMod'] == 2
+
+
+def test_ecmp_group_is_deleted_when_no_pair_uses_it(ecmp):
+    hosts = ecmp.fabric.hosts
+    a, b, c = hosts[0], hosts[-1], hosts[2]
+    ecmp.packet(a, b)
+    ecmp.packet(a, c)
+    ecmp.reply_barriers()
+    groups = ecmp.app.network.groups
+    group_id = groups.ids[('ecmp', (1, 2))]
+    datapath = ecmp.datapaths[a[2]]
+    # a's leaf still sends to c through the group
+    datapath.msgs = []
+    ecmp.handle('port_delete', port=Obj(dpid=b[2], port_no=b[3]))
+    assert [type(msg).__name__ for msg in datapath.msgs] == ['OFPFlowMod']
+    datapath.msgs = []
+    ecmp.handle('port_delete', port=Obj(dpid=c[2], port_no=c[3]))
+    ofproto = ecmp.ofproto
+    assert [(type(msg).__name__, msg.command) for msg in datapath.msgs] == [
+        ('OFPFlowMod', ofproto.OFPFC_DELETE_STRICT), ('OFPGroupMod', ofproto.OFPGC_DELETE)]
+    assert datapath.msgs[1].group_id == group_id
+    assert groups.ids == {} and groups.added == set()
+    assert ecmp.app.network.ecmp.users == {} and ecmp.app.network.ecmp.installed == {}
+
+
+def test_paths_are_moved_off_a_deleted_link_before_the_old_ones_go(harness):
+    harness.learn_hosts()
+    src, dst = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    harness.packet(src, dst)
+    harness.reply_barriers()
+    cookie, old = harness.app.flows.get(src[0], dst[0])
+    spine = old[1]
+    link = [l for l in harness.fabric.links if l[0] == old[0] and l[2] == spine][0]
+    datapath = harness.datapaths[spine]
+    datapath.msgs = []
+    harness.handle('link_delete', link=harness.link(*link))
+    new_cookie, new = harness.app.flows.get(src[0], dst[0])
+    assert spine not in new and new_cookie != cookie
+    # the old entries are only deleted once the new path is confirmed
+    assert datapath.msgs == []
+    harness.reply_barriers()
+    delete, = datapath.msgs
+    assert delete.cookie == cookie and delete.command == harness.ofproto.OFPFC_DELETE
+
+
+def test_idle_path_is_forgotten_and_deleted_from_its_switches(harness):
+    harness.learn_hosts()
+    src, dst = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    harness.packet(src, dst)
+    harness.reply_barriers()
+    cookie, path = harness.app.flows.get(src[0], dst[0])
+    harness.sent.clear()
+    # the entry expires on the ingress switch
+    harness.handle('flow_removed', msg=Obj(datapath=harness.datapaths[path[0]], cookie=cookie,
+                                           reason=harness.ofproto.OFPRR_IDLE_TIMEOUT))
+    assert harness.app.flows.get(src[0], dst[0]) is None
+    assert harness.sent == {'OFPFlowMod': len(path)}
+    # the next packet (long after the first one was coalesced) installs the path again
+    harness.app.pending.clear()
+    harness.packet(src, dst)
+    assert harness.app.flows.get(src[0], dst[0])[1] == path
+
+
+def test_unreachable_destination_registers_no_path(harness):
+    harness.learn_hosts()
+    src, dst = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    # the switch of dst loses all of its links
+    for s1, p1, s2, p2 in harness.fabric.links:
+        if dst[2] in (s1, s2):
+            harness.handle('link_delete', link=harness.link(s1, p1, s2, p2))
+    next_id = harness.app.flows.next_id
+    harness.sent.clear()
+    harness.packet(src, dst)
+    # no path, no cookie, and the packet is flooded
+    assert harness.app.flows.flows == {}
+    assert harness.app.flows.next_id == next_id
+    assert harness.sent['OFPPacketOut'] == 1
+
+
+def test_paths_of_other_instances_are_rerouted():
+    harness = AppHarness('new_controller', leaf_spine(3, 2, 2))
+    harness.connect()
+    harness.learn_hosts()
+    app = harness.app
+    src, dst = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    p = harness.module.get_path(src[2], dst[2], src[3], dst[3])
+    # as published over the PeerBus, in JSON
+    app.add_remote_path([list(hop) for hop in p], src[0], dst[0], 0x02000000ffffff00)
+    assert app.flows.get(src[0], dst[0])[0] == 0x02000000ffffff00
+    s1, s2 = p[0][0], p[1][0]
+    harness.handle('link_delete', link=harness.link(s1, p[0][2], s2, p[1][1]))
+    cookie, path = app.flows.get(src[0], dst[0])
+    assert cookie != 0x02000000ffffff00
+    assert (s1, s2) not in list(zip(path[:-1], path[1:]))
+    harness.close()
+
+
+def test_paths_follow_a_moving_host(harness):
+    harness.learn_hosts()
+    a, b = harness.fabric.hosts[0], harness.fabric.hosts[-1]
+    harness.packet(a, b)
+    harness.reply_barriers()
+    assert harness.app.flows.get(a[0], b[0])[1][-1] == b[2]
+    # b shows up behind another leaf
+    moved = (b[0], b[1], 4, 5)
+    harness.packet(moved, ('ff:ff:ff:ff:ff:ff',))
+    assert harness.app.flows.get(a[0], b[0])[1][-1] == 4
+
+
+def test_link_capacities_are_set_through_the_rest_api(harness):
+    from webob import Request
+    from rest import LinkController
+
+    rest = LinkController(None, None, {'set_capacity': harness.app.set_link_capacity})
+    req = Request.blank('/links/capacity', method='PUT', body=b'[{"src": 3, "dst": 1, "mbps": 1}]')
+    assert rest.put_capacity(req).status_int == 200
+    assert path(harness, 3, 4) == [3, 2, 4]
+    assert rest.put_capacity(Request.blank('/', method='PUT', body=b'[{}]')).status_int == 400
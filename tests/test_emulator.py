@@ -0,0 +1,77 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import emulator
+import topogen
+
+
+def make_emulator(rest=None):
+    # host 1 on port 1 of switch 1, which is linked to switch 2 through port 2
+    emu = emulator.Emulator(topogen.parse('switches 2\nhost 1\nlink 1-2\nhost 2\n'), [], rest=rest)
+    emu.loop = asyncio.new_event_loop()
+    return emu
+
+
+def frame(emu):
+    src, dst = emu.hosts
+    return emulator.udp_frame(src.mac, src.ip, dst.mac, dst.ip, 0, 0.0)
+
+
+def test_frames_are_not_sent_back_through_their_ingress_port():
+    emu = make_emulator()
+    switch = emu.switches[1]
+    switch.apply([('output', 2), ('output', 1)], 2, frame(emu), 0, emulator.OFPR_ACTION, 0)
+    assert switch.ports[2].tx_packets == 0 and switch.ports[1].tx_packets == 1
+    switch.apply([('output', emulator.OFPP_IN_PORT)], 2, frame(emu), 0, emulator.OFPR_ACTION, 0)
+    assert switch.ports[2].tx_packets == 1
+
+
+def test_group_buckets_skip_the_ingress_port():
+    emu = make_emulator()
+    switch = emu.switches[1]
+    switch.groups[1] = (emulator.OFPGT_ALL, [(emulator.OFPP_ANY, emulator.OFPG_ANY, [('output', 1)]),
+                                             (emulator.OFPP_ANY, emulator.OFPG_ANY, [('output', 2)])])
+    switch.apply([('group', 1)], 2, frame(emu), 0, emulator.OFPR_ACTION, 0)
+    assert switch.ports[2].tx_packets == 0 and switch.ports[1].tx_packets == 1
+
+
+def test_group_delete_all():
+    emu = make_emulator()
+    switch = emu.switches[1]
+    switch.groups = {1: (emulator.OFPGT_ALL, []), 2: (emulator.OFPGT_SELECT, [])}
+    switch.group_mod(emulator._group_mod.pack(emulator.OFPGC_DELETE, 0, 2))
+    assert list(switch.groups) == [1]
+    switch.group_mod(emulator._group_mod.pack(emulator.OFPGC_DELETE, 0, emulator.OFPG_ALL))
+    assert switch.groups == {}
+
+
+def metrics_server(link_add):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({'counters': {'link_add': link_add}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_controller_links_sums_the_controllers():
+    servers = [metrics_server(1), metrics_server(2)]
+    try:
+        emu = make_emulator(['http://127.0.0.1:%d' % server.server_port for server in servers])
+        assert emu.controller_links() == 3
+        # a controller without metrics: the links can't be counted
+        emu.rest.append('http://127.0.0.1:1')
+        assert emu.controller_links() is None
+    finally:
+        for server in servers:
+            server.shutdown()
@@ -0,0 +1,18 @@
+import struct
+
+import fastpath
+
+DST = b'\x01\x02\x03\x04\x05\x06'
+SRC = b'\x0a\x0b\x0c\x0d\x0e\x0f'
+
+
+def test_ethertype():
+    assert fastpath.ethertype(DST + SRC + struct.pack('!H', 0x0800)) == 0x0800
+    tagged = DST + SRC + struct.pack('!HHH', fastpath.ETH_TYPE_8021Q, 5, fastpath.ETH_TYPE_LLDP)
+    assert fastpath.ethertype(tagged) == fastpath.ETH_TYPE_LLDP
+    assert fastpath.ethertype(tagged[:16]) is None
+    assert fastpath.ethertype(DST) is None
+
+
+def test_eth_addresses():
+    assert fastpath.eth_addresses(DST + SRC + b'\x08\x00') == ('01:02:03:04:05:06', '0a:0b:0c:0d:0e:0f')
@@ -0,0 +1,84 @@
+import flows
+from flows import FlowRegistry, GroupIds, PathInstaller
+from harness import FakeDatapath, Obj
+
+
+def datapath(dpid, sent):
+    from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+    return FakeDatapath(dpid, ofproto_v1_3, ofproto_v1_3_parser, sent)
+
+
+def test_install_is_done_once_every_switch_confirms():
+    sent = {}
+    installer = PathInstaller()
+    dps = [datapath(dpid, sent) for dpid in (1, 2, 3)]
+    install = installer.install([(dp, ['mod']) for dp in dps])
+    done = []
+    install.add_done_callback(done.append)
+    # egress first
+    assert sent['OFPBarrierRequest'] == 3 and sent['str'] == 3
+    for dp in reversed(dps):
+        assert not done
+        installer.barrier_reply(Obj(datapath=dp, xid=dp.barriers.pop()))
+    assert done == [install] and install.ok
+    assert installer.stats()['installs'] == 1 and installer.stats()['pending'] == 0
+
+
+def test_abandoned_switch_completes_the_install():
+    installer = PathInstaller()
+    dps = [datapath(dpid, {}) for dpid in (1, 2)]
+    install = installer.install([(dp, []) for dp in dps])
+    installer.barrier_reply(Obj(datapath=dps[0], xid=dps[0].barriers[0]))
+    installer.abandon(2)
+    assert install.done and not install.ok
+    # an empty install is done right away
+    assert installer.install([]).done
+
+
+def test_cookie_round_trip():
+    for kind in (flows.COOKIE_TABLE_MISS, flows.COOKIE_PATH, flows.COOKIE_FLOOD,
+                 flows.COOKIE_DEST, flows.COOKIE_ECMP):
+        for epoch in (0, 1, 0xffffff):
+            for path_id in (0, 1, 0xffffffff):
+                cookie = flows.make_cookie(kind, epoch, path_id)
+                assert cookie < 2 ** 64
+                assert flows.cookie_kind(cookie) == kind
+                assert flows.cookie_epoch(cookie) == epoch
+                assert cookie & flows.COOKIE_ID_MASK == path_id
+
+
+def test_cookie_epoch_wraps_without_touching_the_kind():
+    cookie = flows.make_cookie(flows.COOKIE_PATH, 0x1000001, 5)
+    assert flows.cookie_kind(cookie) == flows.COOKIE_PATH
+    assert flows.cookie_epoch(cookie) == 1
+
+
+def test_registry_cookies_never_collide_between_instances():
+    registries = [FlowRegistry(i + 1, 3) for i in range(3)]
+    cookies = [registry.new_cookie() for registry in registries for _ in range(100)]
+    assert len(set(cookies)) == len(cookies)
+    assert all(cookie & flows.COOKIE_ID_MASK for cookie in cookies)
+
+
+def test_registry_indexes_paths_by_link():
+    registry = FlowRegistry()
+    c1, c2 = registry.new_cookie(), registry.new_cookie()
+    assert registry.add('a', 'b', [1, 2, 3], c1) is None
+    assert registry.using(2, 3) == [('a', 'b')]
+    assert registry.using(3, 2) == [('a', 'b')]
+    # a new path replaces the old one, which is returned
+    assert registry.add('a', 'b', [1, 4, 3], c2) == (c1, [1, 2, 3])
+    assert registry.using(2, 3) == []
+    assert registry.flow_removed(c1) is None
+    assert registry.flow_removed(c2) == ('a', 'b', [1, 4, 3])
+    assert registry.flows == {} and registry.by_link == {}
+
+
+def test_group_ids_are_reused_once_released():
+    groups = GroupIds()
+    a, b = groups.get('a'), groups.get('b')
+    assert a != b and groups.get('a') == a
+    groups.added.add((1, a))
+    groups.release('a')
+    assert (1, a) not in groups.added
+    assert groups.get('c') == a
@@ -0,0 +1,45 @@
+from hosts import HostTracker
+
+
+# port 1 of every switch is an inter-switch link
+def tracker(**kwargs):
+    return HostTracker(lambda dpid, port: port == 1, **kwargs)
+
+
+def test_hosts_are_only_learned_on_edge_ports():
+    hosts = tracker()
+    assert not hosts.learn('a', 1, 1)
+    assert hosts.learn('a', 1, 2)
+    assert not hosts.learn('a', 1, 2)
+    assert hosts.get('a') == (1, 2) and 'b' not in hosts
+
+
+def test_moves_are_reported_and_reindexed():
+    moves = []
+    hosts = tracker(on_move=lambda *move: moves.append(move))
+    hosts.learn('a', 1, 2)
+    assert hosts.learn('a', 3, 4)
+    assert moves == [('a', (1, 2), (3, 4))]
+    assert hosts.remove_port(1, 2) == []
+    assert hosts.remove_switch(3) == ['a'] and len(hosts) == 0
+
+
+def test_old_hosts_are_forgotten():
+    hosts = tracker(max_age=-1)
+    hosts.learn('a', 1, 2)
+    hosts.learn('b', 1, 3)
+    assert hosts.get('a') is None
+    assert hosts.expire() == ['b']
+    assert hosts.by_port == {}
+
+
+def test_forgotten_hosts_are_reported():
+    forgotten = []
+    hosts = tracker(max_age=-1, on_forget=forgotten.append)
+    hosts.learn('a', 1, 2)
+    hosts.learn('b', 1, 3)
+    hosts.learn('c', 2, 2)
+    hosts.get('a')
+    hosts.remove_port(1, 3)
+    hosts.expire()
+    assert forgotten == ['a', 'b', 'c']
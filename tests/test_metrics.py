@@ -0,0 +1,32 @@
+from metrics import COUNTS, Histogram, Metrics, Profiler
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = Histogram(COUNTS)
+    for value in range(1, 101):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100 and snapshot['max'] == 100
+    assert snapshot['p50'] == 64 and snapshot['p99'] == 100
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_snapshot_includes_the_sources():
+    metrics = Metrics()
+    metrics.inc('packet_in')
+    metrics.inc('packet_in', 2)
+    metrics.observe('packet_in_seconds', 0.001)
+    metrics.add_source('cache', lambda: {'hits': 7})
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'packet_in': 3}
+    assert snapshot['histograms']['packet_in_seconds']['count'] == 1
+    assert snapshot['cache'] == {'hits': 7}
+
+
+def test_profiler_only_samples_at_its_rate():
+    profiler = Profiler(0.0)
+    assert profiler.run(sum, [1, 2]) == 3
+    assert profiler.samples == 0 and profiler.report() == 'no samples\n'
+    profiler = Profiler(1.0)
+    assert profiler.run(sum, [1, 2]) == 3
+    assert profiler.samples == 1 and 'sum' in profiler.report()
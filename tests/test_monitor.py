@@ -0,0 +1,81 @@
+import json
+
+from monitor import PortMonitor
+from topology import Topology
+
+
+class Stat(object):
+
+    def __init__(self, port_no, tx_bytes, duration_sec):
+        self.port_no = port_no
+        self.tx_bytes = tx_bytes
+        self.duration_sec = duration_sec
+        self.duration_nsec = 0
+
+
+def monitor_of(links):
+    topology = Topology()
+    for s1, s2, port in links:
+        topology.add_link(s1, s2, port)
+    weights = {}
+    monitor = PortMonitor(topology, lambda s1, s2, w: weights.__setitem__((s1, s2), w))
+    return monitor, weights
+
+
+# two samples one second apart, 'mbps' sent out of the port in between
+def send(monitor, dpid, port, mbps):
+    monitor.port_stats(dpid, [Stat(port, 0, 1)])
+    monitor.port_stats(dpid, [Stat(port, int(mbps * 1e6 / 8), 2)])
+
+
+def test_weights_follow_the_capacity_of_the_links():
+    monitor, weights = monitor_of([(1, 2, 1), (1, 3, 2)])
+    monitor.set_capacity(1, 2, 1.0)
+    monitor.set_capacity(1, 3, 5.0)
+    send(monitor, 1, 1, 1.0)
+    send(monitor, 1, 2, 2.5)
+    # a saturated 1 Mbps link costs more than a half busy 5 Mbps one
+    assert weights[(1, 2)] > weights[(1, 3)]
+    assert weights[(1, 3)] == 2.0
+
+
+def test_capacity_change_updates_the_weight_of_an_idle_link():
+    monitor, weights = monitor_of([(1, 2, 1)])
+    monitor.set_capacity(1, 2, 1.0)
+    assert weights[(1, 2)] == 5.0
+    monitor.set_capacity(1, 2, 5.0)
+    assert weights[(1, 2)] == 1.0
+
+
+def test_capacity_of_an_undiscovered_link_is_kept():
+    monitor, weights = monitor_of([])
+    monitor.set_capacity(1, 2, 1.0)
+    assert weights == {}
+    monitor.topology.add_link(1, 2, 1)
+    send(monitor, 1, 1, 0.0)
+    assert weights[(1, 2)] == 5.0
+
+
+def test_reset_link_gets_its_weight_again():
+    monitor, weights = monitor_of([(1, 2, 1)])
+    monitor.set_capacity(1, 2, 1.0)
+    del weights[(1, 2)]
+    # the link was added again at weight 1
+    monitor.update_weight(1, 2, 1)
+    assert weights == {}
+    monitor.reset_port(1, 1)
+    monitor.update_weight(1, 2, 1)
+    assert weights[(1, 2)] == 5.0
+
+
+def test_weight_changes_are_logged(tmp_path):
+    log = str(tmp_path / 'weights.log')
+    topology = Topology()
+    topology.add_link(1, 2, 1)
+    monitor = PortMonitor(topology, lambda s1, s2, w: None, weight_log=log)
+    monitor.set_capacity(1, 2, 1.0)
+    monitor.close()
+    monitor.close()
+    with open(log) as f:
+        record, = [json.loads(line) for line in f]
+    assert (record['src'], record['dst'], record['weight'], record['capacity']) == (1, 2, 5.0, 1.0)
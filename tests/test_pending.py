@@ -0,0 +1,31 @@
+from flows import PathInstall
+from pending import PendingInstalls, RateLimiter
+
+
+def test_duplicates_get_the_pending_path():
+    pending = PendingInstalls(grace=60)
+    install = PathInstall()
+    pending.add('a', 'b', 1, ['path'], install)
+    assert pending.get('a', 'b', 1) == (['path'], install)
+    install._finish()
+    # still there during the grace period
+    assert pending.get('a', 'b', 1) == (['path'], install)
+    assert pending.coalesced == 2
+    # but not from another topology epoch
+    assert pending.get('a', 'b', 2) is None
+    assert pending.get('a', 'b', 1) is None
+
+
+def test_failed_installs_are_not_reused():
+    pending = PendingInstalls(grace=60)
+    install = PathInstall()
+    pending.add('a', 'b', 1, ['path'], install)
+    install._confirm(None, ok=False)
+    assert pending.get('a', 'b', 1) is None
+
+
+def test_rate_limiter_allows_bursts():
+    limiter = RateLimiter(rate=1e-6, burst=3)
+    assert [limiter.allow('a') for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('b')
+    assert limiter.dropped == 1
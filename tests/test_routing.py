@@ -0,0 +1,254 @@
+import random
+
+import pytest
+
+import routing
+import topogen
+from topology import Topology
+from workers import RouteWorkers
+
+
+def line(n):
+    # switches 1..n in a line, links are 1 to the right and 2 to the left
+    links = dict((s, []) for s in range(1, n + 1))
+    for s in range(1, n):
+        links[s].append((s + 1, 1))
+        links[s + 1].append((s, 2))
+    return lambda u: links.get(u, [])
+
+
+def test_dijkstra_on_a_line():
+    distance, previous = routing.dijkstra(1, line(5))
+    assert distance[5] == 4
+    assert routing.build_path(previous, 1, 5) == [1, 2, 3, 4, 5]
+    assert routing.build_path(previous, 1, 6) is None
+    assert routing.dijkstra(5, line(5))[0][1] == 8
+
+
+def test_dijkstra_stops_at_dst():
+    distance, previous = routing.dijkstra(1, line(5), dst=3)
+    assert routing.build_path(previous, 1, 3) == [1, 2, 3]
+    assert 5 not in distance
+
+
+def test_add_ports():
+    port = lambda s1, s2: 10 * s1 + s2
+    assert routing.add_ports([1, 2, 3], port, 7, 8) == [(1, 7, 12), (2, 21, 23), (3, 32, 8)]
+    assert routing.add_ports([1], port, 7, 8) == [(1, 7, 8)]
+
+
+# a mutable graph: links[u][v] -> weight of u->v
+class Graph(object):
+
+    def __init__(self):
+        self.links = {}
+
+    def add_link(self, u, v, w):
+        self.links.setdefault(u, {})[v] = w
+        self.links.setdefault(v, {})
+
+    def remove_link(self, u, v):
+        self.links[u].pop(v, None)
+
+    def remove_switch(self, node):
+        self.links.pop(node, None)
+        for links in self.links.values():
+            links.pop(node, None)
+
+    def neighbors(self, u):
+        return list(self.links.get(u, {}).items())
+
+    def switches(self):
+        return sorted(self.links)
+
+
+# n switches, each linked both ways to 'degree' random others
+def random_graph(n, degree, rand):
+    graph = Graph()
+    for u in range(1, n + 1):
+        for v in rand.sample(range(1, n + 1), degree):
+            if v != u:
+                w = rand.choice([1, 2, 5])
+                graph.add_link(u, v, w)
+                graph.add_link(v, u, w)
+    return graph
+
+
+def rebuilt(graph):
+    table = routing.PathTable(graph.neighbors)
+    table.rebuild(graph.switches())
+    return table
+
+
+# the repaired table must give the same distances as a full rebuild (paths
+# may differ between equal-cost ones, but they must be shortest and valid)
+def check(table, graph):
+    expected = rebuilt(graph)
+    assert set(table.distance) == set(expected.distance)
+    for src in expected.distance:
+        assert table.distance[src] == pytest.approx(expected.distance[src])
+        for dst in expected.distance[src]:
+            path = table.path(src, dst)
+            assert path[0] == src and path[-1] == dst
+            cost = sum(graph.links[u][v] for u, v in zip(path[:-1], path[1:]))
+            assert cost == pytest.approx(expected.get_distance(src, dst))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_link_repairs_match_a_rebuild(seed):
+    rand = random.Random(seed)
+    graph = random_graph(30, 3, rand)
+    table = rebuilt(graph)
+    links = [(u, v) for u in graph.links for v in graph.links[u] if u < v]
+    removed = []
+    for _ in range(40):
+        if removed and rand.random() < 0.4:
+            u, v, w = removed.pop(rand.randrange(len(removed)))
+            graph.add_link(u, v, w)
+            graph.add_link(v, u, w)
+            table.link_added(u, v, w)
+            table.link_added(v, u, w)
+        elif rand.random() < 0.5:
+            u, v = rand.choice(links)
+            if v not in graph.links[u]:
+                continue
+            removed.append((u, v, graph.links[u][v]))
+            graph.remove_link(u, v)
+            graph.remove_link(v, u)
+            table.link_removed(u, v)
+            table.link_removed(v, u)
+        else:
+            # a weight change is a removal and an addition
+            u, v = rand.choice(links)
+            if v not in graph.links[u]:
+                continue
+            w = rand.choice([1, 2, 5, 10])
+            graph.links[u][v] = w
+            table.link_removed(u, v)
+            table.link_added(u, v, w)
+        check(table, graph)
+
+
+def test_node_removal_matches_a_rebuild():
+    graph = random_graph(20, 3, random.Random(1))
+    table = rebuilt(graph)
+    for node in (3, 7):
+        graph.remove_switch(node)
+        table.node_removed(node)
+        check(table, graph)
+
+
+def test_path_cache_is_invalidated_by_epochs():
+    cache = routing.PathCache(2)
+    cache.put(1, 2, 'a')
+    assert cache.get(1, 2) == 'a'
+    cache.bump_epoch()
+    assert cache.get(1, 2) is None
+    for i in range(3):
+        cache.put(i, i, i)
+    assert cache.get(0, 0) is None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_set_host_ports_keeps_the_cached_path():
+    path = [(1, None, 12), (2, 21, None)]
+    assert routing.set_host_ports(path, 7, 8) == [(1, 7, 12), (2, 21, 8)]
+    assert path == [(1, None, 12), (2, 21, None)]
+
+
+@pytest.mark.parametrize('changes', [2, 20])
+def test_deferred_changes_are_flushed(changes):
+    graph = random_graph(30, 3, random.Random(2))
+    table = rebuilt(graph)
+    links = [(u, v) for u in graph.links for v in graph.links[u]]
+    for u, v in links[:changes]:
+        graph.remove_link(u, v)
+        table.defer('link_removed', u, v)
+    # below max_repairs they're repaired one by one, above it the table is rebuilt
+    assert table.flush(graph.switches)
+    assert not table.flush(graph.switches)
+    check(table, graph)
+
+
+def test_added_node_gets_its_tree():
+    graph = random_graph(10, 2, random.Random(3))
+    table = rebuilt(graph)
+    graph.add_link(99, 1, 1)
+    graph.add_link(1, 99, 1)
+    table.node_added(99)
+    table.link_added(99, 1, 1)
+    table.link_added(1, 99, 1)
+    check(table, graph)
+
+
+def test_spanning_tree_reaches_every_switch_once():
+    graph = random_graph(20, 3, random.Random(4))
+    graph.add_link(50, 51, 1)
+    graph.add_link(51, 50, 1)
+    tree = routing.spanning_tree(graph.switches(), graph.neighbors)
+    children = [v for _, v in tree]
+    assert len(children) == len(set(children)) == len(graph.switches()) - 2
+    # one root per component, the smallest dpid
+    assert set(graph.switches()) - set(children) == {1, 50}
+
+
+def test_next_hops_are_every_equal_cost_neighbor():
+    # a square 1-2-4-3-1, with a longer diagonal 1-4
+    graph = Graph()
+    for u, v, w in ((1, 2, 1), (2, 4, 1), (4, 3, 1), (3, 1, 1), (1, 4, 3)):
+        graph.add_link(u, v, w)
+        graph.add_link(v, u, w)
+    table = rebuilt(graph)
+    assert sorted(table.next_hops(1, 4)) == [2, 3]
+    assert table.next_hops(2, 4) == [4]
+    assert table.next_hops(4, 4) == []
+
+
+def test_next_hops_and_dag_on_a_fat_tree():
+    fabric = topogen.fat_tree(4)
+    graph = Graph()
+    for s1, _, s2, _ in fabric.links:
+        graph.add_link(s1, s2, 1)
+        graph.add_link(s2, s1, 1)
+    table = rebuilt(graph)
+    src, dst = fabric.hosts[0][2], fabric.hosts[-1][2]
+    # from an edge switch to another pod: both aggregation switches
+    assert len(table.next_hops(src, dst)) == 2
+    dag = table.dag(src, dst)
+    assert src in dag and dst not in dag
+    for u, next_hops in dag.items():
+        for v in next_hops:
+            assert table.get_distance(v, dst) < table.get_distance(u, dst)
+
+
+def test_backup_next_hop_is_loop_free():
+    graph = random_graph(30, 3, random.Random(5))
+    table = rebuilt(graph)
+    backups = 0
+    for src in graph.switches():
+        for dst in graph.switches():
+            v = table.backup_next_hop(src, dst)
+            if v is not None:
+                backups += 1
+                assert v not in table.next_hops(src, dst)
+                # v's own shortest path to dst doesn't go back through src
+                assert src not in table.path(v, dst)
+    assert backups > 0
+
+
+def test_worker_trees_match_a_rebuild():
+    graph = random_graph(40, 3, random.Random(6))
+    topology = Topology()
+    for u in graph.switches():
+        topology.add_switch(u)
+        for port, (v, w) in enumerate(graph.neighbors(u)):
+            topology.add_link(u, v, port + 1, w)
+    workers = RouteWorkers(topology, 2, min_sources=1)
+    try:
+        table = routing.PathTable(topology.neighbors, workers=workers)
+        table.rebuild(graph.switches())
+        assert workers.pooled == 1
+        check(table, graph)
+    finally:
+        workers.close()
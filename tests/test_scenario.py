@@ -0,0 +1,19 @@
+import scenario
+
+
+def test_outage_schedule_brings_the_links_back(capsys):
+    scenario.main(['generate', 'leaf-spine:4x2', '--schedule', 'outage', '--duration', '35',
+                   '--period', '10', '--low', '0.5', '--high', '5'])
+    events = scenario.parse(capsys.readouterr().out)
+    assert [(t, args[1]) for t, _, args in events] == [
+        (10, 0.5), (15, 5), (20, 0.5), (25, 5), (30, 0.5), (35, 5)]
+    assert events[0][2][0] == events[1][2][0]
+
+
+def test_ground_truth_of_a_previous_run_is_overwritten(tmp_path):
+    path = str(tmp_path / 'truth.jsonl')
+    for mbps in (1, 2):
+        truth = scenario.GroundTruth(path)
+        truth.record('bw', link='1-2', mbps=mbps)
+        truth.close()
+    assert [record['mbps'] for record in scenario.read_log(path)] == [2]
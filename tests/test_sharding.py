@@ -0,0 +1,72 @@
+from sharding import PeerBus, Shard
+
+
+def test_generation_ids_increase():
+    shard = Shard(0, 2)
+    ids = [shard.generation_id() for _ in range(1000)]
+    assert ids == sorted(set(ids))
+
+
+def test_generation_ids_increase_across_restarts():
+    last = Shard(1, 2).generation_id()
+    assert Shard(1, 2).generation_id() >= last
+
+
+def test_switches_are_partitioned():
+    shards = [Shard(i, 3) for i in range(3)]
+    for dpid in range(1, 100):
+        assert sum(shard.owns(dpid) for shard in shards) == 1
+
+
+def test_dropped_messages_are_resent_in_order():
+    shards = [Shard(0, 2), Shard(1, 2)]
+    a, b = [PeerBus(shard, base_port=47610) for shard in shards]
+    for bus in (a, b):
+        bus.sock.settimeout(1)
+    got = []
+    b.subscribe('host', lambda *args: got.append(args))
+    try:
+        for i in range(4):
+            a.publish('host', i)
+        datagrams = [b.recv() for _ in range(4)]
+        # the second message is dropped, b holds the next ones and asks for it
+        b.handle(datagrams[0])
+        b.handle(datagrams[2])
+        b.handle(datagrams[3])
+        assert got == [(0,)]
+        a.handle(a.recv())
+        b.handle(b.recv())
+        assert got == [(0,), (1,), (2,), (3,)] and a.resent == 1
+        # the last message is dropped, the heartbeat tells b it's missing
+        a.publish('host', 4)
+        b.recv()
+        a.heartbeat()
+        b.handle(b.recv())
+        a.handle(a.recv())
+        b.handle(b.recv())
+        assert got[-1] == (4,) and b.received == 5 and b.lost == 0
+    finally:
+        a.close()
+        b.close()
+
+
+def test_messages_too_old_to_be_resent_are_skipped():
+    shards = [Shard(0, 2), Shard(1, 2)]
+    a, b = [PeerBus(shard, base_port=47620, history=2) for shard in shards]
+    for bus in (a, b):
+        bus.sock.settimeout(1)
+    got = []
+    b.subscribe('host', lambda *args: got.append(args))
+    try:
+        for i in range(4):
+            a.publish('host', i)
+        datagrams = [b.recv() for _ in range(4)]
+        b.handle(datagrams[0])
+        b.handle(datagrams[3])
+        a.handle(a.recv())
+        b.handle(b.recv())
+        b.handle(b.recv())
+        assert got == [(0,), (2,), (3,)] and b.lost == 1
+    finally:
+        a.close()
+        b.close()
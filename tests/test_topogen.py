@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+import topogen
+
+TOPOLOGIES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'topologies')
+
+
+def test_fabrics_keep_the_names_and_addresses_of_the_scripts():
+    fabric = topogen.load(os.path.join(TOPOLOGIES, 'new_topo.fab'))
+    names = dict(zip(fabric.host_names, fabric.hosts))
+    assert sorted(names) == sorted(['s%d' % i for i in range(1, 13)] + ['h1', 'h2', 'h3'])
+    assert names['s6'][:3] == ('00:00:00:00:02:02', '10.0.2.2', 5)
+    assert names['h3'][:3] == ('00:00:00:00:00:03', '10.0.0.3', 16)
+    assert fabric.switch_prefix == 'sw'
+
+    fabric = topogen.load(os.path.join(TOPOLOGIES, 'topo.fab'))
+    assert fabric.host_names == ['h%d' % i for i in range(1, 8)]
+    assert fabric.hosts[6][:2] == ('00:00:00:00:00:07', '10.0.0.7')
+    assert fabric.switch_prefix == 's'
+    assert topogen.link_names(fabric)[-7:] == fabric.host_names
+
+
+@pytest.mark.parametrize('name', ['new_topo.fab', 'topo.fab'])
+def test_dumps_round_trips(name):
+    fabric = topogen.load(os.path.join(TOPOLOGIES, name))
+    again = topogen.parse(topogen.dumps(fabric))
+    assert again.links == fabric.links and again.hosts == fabric.hosts
+    assert again.host_names == fabric.host_names
+    assert again.switch_prefix == fabric.switch_prefix
+
+
+def test_bad_host_names():
+    with pytest.raises(ValueError):
+        topogen.parse('switches 1\nhost 1\nhostname 2 x 00:00:00:00:00:02 10.0.0.2\n')
+    with pytest.raises(ValueError):
+        topogen.parse('switches 1\nhost 1\nhostname 1 a-b 00:00:00:00:00:01 10.0.0.1\n')
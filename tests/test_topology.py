@@ -0,0 +1,91 @@
+import random
+
+from topology import Topology
+
+
+def test_links_and_ports():
+    topology = Topology()
+    topology.add_link(1, 2, 10, 3)
+    topology.add_link(2, 1, 20)
+    assert topology.switches() == [1, 2]
+    assert topology.port(1, 2) == 10 and topology.port(2, 1) == 20
+    assert topology.weight(1, 2) == 3
+    assert list(topology.neighbors(1)) == [(2, 3)]
+    assert topology.is_link_port(1, 10) and not topology.is_link_port(1, 20)
+    assert topology.port(1, 3) is None and topology.weight(3, 1) is None
+
+
+def test_remove_switch_removes_its_links():
+    topology = Topology()
+    for s in (1, 2, 3):
+        topology.add_link(s, s % 3 + 1, 1)
+        topology.add_link(s % 3 + 1, s, 2)
+    topology.remove_switch(2)
+    assert topology.switches() == [1, 3]
+    assert sorted(v for v, _ in topology.neighbors(1)) == [3]
+    assert topology.num_links() == 2
+    # and it can come back, without its links
+    topology.add_switch(2)
+    assert 2 in topology and list(topology.neighbors(2)) == []
+
+
+def test_weight_changes_are_buffered_with_the_other_changes():
+    topology = Topology()
+    topology.add_link(1, 2, 1)
+    topology.set_weight(1, 2, 5)
+    assert topology.weight(1, 2) == 5
+    topology.remove_link(1, 2)
+    topology.set_weight(1, 2, 7)
+    assert topology.weight(1, 2) is None
+    # the weight of an unknown link isn't set
+    topology.set_weight(3, 4, 1)
+    assert 3 not in topology
+
+
+def test_get_link_sees_the_buffered_changes():
+    topology = Topology()
+    topology.add_link(1, 2, 10, 3)
+    topology.add_link(2, 1, 20)
+    assert topology.get_link(1, 2) == (10, 3)
+    topology.weight(1, 2)
+    topology.set_weight(1, 2, 4)
+    assert topology.get_link(1, 2) == (10, 4)
+    topology.remove_link(1, 2)
+    assert topology.get_link(1, 2) is None
+    topology.remove_switch(1)
+    assert topology.get_link(2, 1) is None
+    assert topology.get_link(3, 1) is None
+
+
+def test_snapshots_are_not_affected_by_later_changes():
+    topology = Topology()
+    topology.add_link(1, 2, 1)
+    snapshot = topology.snapshot()
+    topology.add_link(2, 3, 1)
+    topology.remove_link(1, 2)
+    assert snapshot.port(1, 2) == 1 and 3 not in snapshot
+    assert topology.port(1, 2) is None and 3 in topology
+
+
+# random adds and removes, compared with a dict of the links
+def test_random_changes_match_a_dict():
+    rand = random.Random(1)
+    topology = Topology()
+    # large dpids, the indices are dense anyway
+    dpids = [rand.getrandbits(48) for _ in range(20)]
+    expected = {}
+    for step in range(500):
+        s1, s2 = rand.sample(dpids, 2)
+        if rand.random() < 0.6:
+            port, weight = rand.randrange(1, 48), rand.choice([1, 2.5, 10])
+            topology.add_link(s1, s2, port, weight)
+            expected[(s1, s2)] = (port, weight)
+        else:
+            topology.remove_link(s1, s2)
+            expected.pop((s1, s2), None)
+        if step % 7 == 0:
+            links = dict(((src, dst), (port, weight))
+                         for src, dst, port, weight in topology.links())
+            assert links == expected
+    for (s1, s2), (port, weight) in expected.items():
+        assert topology.port(s1, s2) == port and topology.weight(s1, s2) == weight
@@ -0,0 +1,360 @@
+import random
+
+
+# mac address of the i-th host, e.g. 00:00:00:00:01:0a for i = 266
+def host_mac(i):
+    return ':'.join('%02x' % ((i >> shift) & 0xff) for shift in (40, 32, 24, 16, 8, 0))
+
+
+# ip address of the i-th host, in 10.0.0.0/8
+def host_ip(i):
+    return '10.%d.%d.%d' % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)
+
+
+# A switch fabric as plain data, so the same topology can be built in
+# Mininet (see build_mininet) or fed to the controllers directly (see bench.py).
+# Switches are numbered from 1 (their dpid) and ports from 1 on each switch,
+# in the order the links and hosts are added.
+class Fabric(object):
+
+    def __init__(self, name=''):
+        self.name = name
+        # dpids of the switches
+        self.switches = []
+        # (dpid 1, port 1, dpid 2, port 2) of the links between switches
+        self.links = []
+        # (mac, ip, dpid, port) of the hosts
+        self.hosts = []
+        # Mininet names of the hosts, in the same order
+        self.host_names = []
+        # Mininet names of the switches are this prefix and their dpid
+        self.switch_prefix = 'sw'
+        # next free port of each switch
+        self.next_port = {}
+        # 'l' or 'h' for each link and host added, so save() keeps the ports
+        self.order = []
+
+    def add_switch(self):
+        dpid = len(self.switches) + 1
+        self.switches.append(dpid)
+        self.next_port[dpid] = 1
+        return dpid
+
+    def _port(self, dpid):
+        port = self.next_port[dpid]
+        self.next_port[dpid] = port + 1
+        return port
+
+    def add_link(self, s1, s2):
+        self.links.append((s1, self._port(s1), s2, self._port(s2)))
+        self.order.append('l')
+
+    def add_host(self, dpid):
+        i = len(self.hosts) + 1
+        self.hosts.append((host_mac(i), host_ip(i), dpid, self._port(dpid)))
+        self.host_names.append('h%d' % i)
+        self.order.append('h')
+
+    # renames the i-th host (from 1) and changes its addresses
+    def set_host(self, i, name, mac, ip):
+        _, _, dpid, port = self.hosts[i - 1]
+        self.hosts[i - 1] = (mac, ip, dpid, port)
+        self.host_names[i - 1] = name
+
+    # ports of each switch, as a dict dpid -> list of port numbers
+    def ports(self):
+        return dict((dpid, list(range(1, self.next_port[dpid]))) for dpid in self.switches)
+
+
+# k-ary fat-tree: k pods of k/2 aggregation and k/2 edge switches, (k/2)^2
+# core switches, and k/2 hosts per edge switch (5k^2/4 switches, k^3/4 hosts)
+def fat_tree(k, hosts_per_edge=None):
+    half = k // 2
+    if hosts_per_edge is None:
+        hosts_per_edge = half
+    fabric = Fabric('fat-tree-k%d' % k)
+    core = [fabric.add_switch() for _ in range(half * half)]
+    for pod in range(k):
+        aggregation = [fabric.add_switch() for _ in range(half)]
+        edge = [fabric.add_switch() for _ in range(half)]
+        for i, agg in enumerate(aggregation):
+            for j in range(half):
+                fabric.add_link(agg, core[i * half + j])
+            for sw in edge:
+                fabric.add_link(agg, sw)
+        for sw in edge:
+            for _ in range(hosts_per_edge):
+                fabric.add_host(sw)
+    return fabric
+
+
+# two-tier Clos: every leaf is linked to every spine
+def leaf_spine(leaves, spines, hosts_per_leaf=4):
+    fabric = Fabric('leaf-spine-%dx%d' % (leaves, spines))
+    spine = [fabric.add_switch() for _ in range(spines)]
+    for _ in range(leaves):
+        leaf = fabric.add_switch()
+        for sw in spine:
+            fabric.add_link(leaf, sw)
+        for _ in range(hosts_per_leaf):
+            fabric.add_host(leaf)
+    return fabric
+
+
+# connected random graph: a ring (so every switch is reachable) plus random
+# links until the switches have about 'degree' links each
+def random_graph(switches, degree=4, hosts_per_switch=1, seed=0):
+    rand = random.Random(seed)
+    fabric = Fabric('random-%d-d%d' % (switches, degree))
+    nodes = [fabric.add_switch() for _ in range(switches)]
+    linked = set()
+    for i in range(switches if switches > 2 else switches - 1):
+        s1, s2 = nodes[i], nodes[(i + 1) % switches]
+        linked.add((min(s1, s2), max(s1, s2)))
+        fabric.add_link(s1, s2)
+    extra = switches * max(degree - 2, 0) // 2
+    for _ in range(extra * 4):
+        if extra == 0:
+            break
+        s1, s2 = rand.sample(nodes, 2)
+        key = (min(s1, s2), max(s1, s2))
+        if key not in linked:
+            linked.add(key)
+            fabric.add_link(s1, s2)
+            extra -= 1
+    for sw in nodes:
+        for _ in range(hosts_per_switch):
+            fabric.add_host(sw)
+    return fabric
+
+
+# Jellyfish: a random regular graph of switches with 'ports' ports each,
+# 'hosts_per_switch' of them for hosts and the others linked to random
+# switches. When no two switches with free ports can be linked anymore, a
+# switch with two free ports takes the place of a random link (x, y) by
+# linking to both x and y.
+def jellyfish(switches, ports=8, hosts_per_switch=2, seed=0):
+    rand = random.Random(seed)
+    fabric = Fabric('jellyfish-%d-p%d' % (switches, ports))
+    nodes = [fabric.add_switch() for _ in range(switches)]
+    free = dict((sw, ports - hosts_per_switch) for sw in nodes)
+    linked = set()
+
+    # switches with free ports, and their index in the list
+    open_ports = [sw for sw in nodes if free[sw] > 0]
+    index = dict((sw, i) for i, sw in enumerate(open_ports))
+
+    def link(s1, s2):
+        linked.add((min(s1, s2), max(s1, s2)))
+        for sw in (s1, s2):
+            free[sw] -= 1
+            if free[sw] == 0 and sw in index:
+                last = open_ports.pop()
+                if last != sw:
+                    open_ports[index[sw]] = last
+                    index[last] = index[sw]
+                del index[sw]
+
+    def pick(open_ports):
+        # a few random tries, then all the pairs when they're getting rare
+        for _ in range(16):
+            s1, s2 = rand.sample(open_ports, 2)
+            if (min(s1, s2), max(s1, s2)) not in linked:
+                return s1, s2
+        candidates = [(s1, s2) for i, s1 in enumerate(open_ports) for s2 in open_ports[i + 1:]
+                      if (min(s1, s2), max(s1, s2)) not in linked]
+        return rand.choice(candidates) if candidates else None
+
+    while True:
+        pair = pick(open_ports) if len(open_ports) > 1 else None
+        if pair is None:
+            spare = [sw for sw in open_ports if free[sw] > 1]
+            if not spare:
+                break
+            sw = rand.choice(spare)
+            x, y = rand.choice([key for key in linked if sw not in key])
+            if (min(sw, x), max(sw, x)) in linked or (min(sw, y), max(sw, y)) in linked:
+                break
+            linked.remove((x, y))
+            free[x] += 1
+            free[y] += 1
+            link(sw, x)
+            link(sw, y)
+        else:
+            link(*pair)
+
+    for s1, s2 in sorted(linked):
+        fabric.add_link(s1, s2)
+    for sw in nodes:
+        for _ in range(hosts_per_switch):
+            fabric.add_host(sw)
+    return fabric
+
+
+# torus of the given dimensions, e.g. (8, 8) or (4, 4, 4): every switch is
+# linked to its next neighbour along each dimension, wrapping around
+def torus(dims, hosts_per_switch=1):
+    fabric = Fabric('torus-%s' % 'x'.join(str(d) for d in dims))
+    count = 1
+    for d in dims:
+        count *= d
+    nodes = [fabric.add_switch() for _ in range(count)]
+    stride = 1
+    for d in dims:
+        for i in range(count):
+            pos = (i // stride) % d
+            # no wrap-around link on dimensions of 2, it would be a duplicate
+            if pos + 1 < d or d > 2:
+                j = i + ((pos + 1) % d - pos) * stride
+                fabric.add_link(nodes[i], nodes[j])
+        stride *= d
+    for sw in nodes:
+        for _ in range(hosts_per_switch):
+            fabric.add_host(sw)
+    return fabric
+
+
+# Compact text format of a fabric, one statement per line, '#' comments:
+#   name NAME
+#   switches COUNT
+#   link S1-S2 [S1-S2 ...]
+#   host SW[xCOUNT] [SW[xCOUNT] ...]
+#   hostname N NAME MAC IP
+#   switchprefix PREFIX
+# Ports are given in the order the links and hosts appear, and hosts are
+# numbered in order too: the N-th host is named hN, with host_mac(N) and
+# host_ip(N), unless a 'hostname' statement gives it other ones (e.g. to
+# keep the names and addresses of an existing Mininet script).
+# Switches are named sw<dpid>, or with the prefix of 'switchprefix'.
+def parse(text, name=''):
+    fabric = Fabric(name)
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        keyword, args = words[0], words[1:]
+        try:
+            if keyword == 'name':
+                fabric.name = ' '.join(args)
+            elif keyword == 'switches':
+                for _ in range(int(args[0])):
+                    fabric.add_switch()
+            elif keyword == 'link':
+                for arg in args:
+                    s1, s2 = arg.split('-')
+                    fabric.add_link(_switch(fabric, s1), _switch(fabric, s2))
+            elif keyword == 'host':
+                for arg in args:
+                    sw, _, count = arg.partition('x')
+                    sw = _switch(fabric, sw)
+                    for _ in range(int(count or 1)):
+                        fabric.add_host(sw)
+            elif keyword == 'hostname':
+                i, name, mac, ip = args
+                i = int(i)
+                if not 1 <= i <= len(fabric.hosts):
+                    raise ValueError('unknown host %d' % i)
+                # '-' is kept for the names of the links between switches
+                if '-' in name:
+                    raise ValueError('bad host name %s' % name)
+                fabric.set_host(i, name, mac, ip)
+            elif keyword == 'switchprefix':
+                fabric.switch_prefix = args[0]
+            else:
+                raise ValueError('unknown statement %s' % keyword)
+        except (ValueError, IndexError) as e:
+            raise ValueError('line %d: %s' % (number, e))
+    return fabric
+
+
+def _switch(fabric, word):
+    dpid = int(word)
+    if dpid not in fabric.next_port:
+        raise ValueError('unknown switch %s' % word)
+    return dpid
+
+
+def dumps(fabric, per_line=8):
+    lines = ['name %s' % fabric.name, 'switches %d' % len(fabric.switches)]
+    links, hosts = iter(fabric.links), iter(fabric.hosts)
+    # consecutive runs of links or hosts, in the order they were added
+    runs = []
+    for kind in fabric.order:
+        if runs and runs[-1][0] == kind:
+            runs[-1][1].append(next(links) if kind == 'l' else next(hosts))
+        else:
+            runs.append((kind, [next(links) if kind == 'l' else next(hosts)]))
+    for kind, items in runs:
+        if kind == 'l':
+            words = ['%d-%d' % (s1, s2) for s1, _, s2, _ in items]
+        else:
+            words = []
+            for _, _, sw, _ in items:
+                if words and words[-1][0] == sw:
+                    words[-1][1] += 1
+                else:
+                    words.append([sw, 1])
+            words = ['%d' % sw if count == 1 else '%dx%d' % (sw, count) for sw, count in words]
+        for i in range(0, len(words), per_line):
+            lines.append('%s %s' % ('link' if kind == 'l' else 'host', ' '.join(words[i:i + per_line])))
+    for i, ((mac, ip, _, _), name) in enumerate(zip(fabric.hosts, fabric.host_names), 1):
+        if (name, mac, ip) != ('h%d' % i, host_mac(i), host_ip(i)):
+            lines.append('hostname %d %s %s %s' % (i, name, mac, ip))
+    if fabric.switch_prefix != 'sw':
+        lines.append('switchprefix %s' % fabric.switch_prefix)
+    return '\n'.join(lines) + '\n'
+
+
+def load(path):
+    with open(path) as f:
+        return parse(f.read(), path)
+
+
+def save(fabric, path):
+    with open(path, 'w') as f:
+        f.write(dumps(fabric))
+
+
+# Fabric from a short spec, or from a file in the format above:
+#   fat-tree:K, leaf-spine:LEAVESxSPINES, random:SWITCHES[xDEGREE],
+#   jellyfish:SWITCHES[xPORTS], torus:AxB[xC...], or the path of a file
+def from_spec(spec):
+    kind, _, args = spec.partition(':')
+    if kind == 'fat-tree':
+        return fat_tree(int(args))
+    if kind == 'leaf-spine':
+        leaves, spines = args.split('x')
+        return leaf_spine(int(leaves), int(spines))
+    if kind == 'random':
+        switches, _, degree = args.partition('x')
+        return random_graph(int(switches), int(degree or 4))
+    if kind == 'jellyfish':
+        switches, _, ports = args.partition('x')
+        return jellyfish(int(switches), int(ports or 8))
+    if kind == 'torus':
+        return torus([int(d) for d in args.split('x')])
+    return load(spec)
+
+
+# Builds the fabric in a Mininet network, with the fabric's switch and host
+# names (sw<dpid> and h<i> by default) and ports, every link being a TCLink of 'bw' Mbit/s.
+# Returns the switches, by dpid, and the links (switch links first, then
+# the host links).
+def build_mininet(net, fabric, bw, link_cls):
+    switches = {}
+    for dpid in fabric.switches:
+        switches[dpid] = net.addSwitch('%s%d' % (fabric.switch_prefix, dpid), dpid='%016x' % dpid)
+    links = []
+    for s1, p1, s2, p2 in fabric.links:
+        links.append(net.addLink(switches[s1], switches[s2], port1=p1, port2=p2,
+                                 cls=link_cls, bw=bw, loss=0))
+    for name, (mac, ip, dpid, port) in zip(fabric.host_names, fabric.hosts):
+        host = net.addHost(name, mac=mac, ip='%s/8' % ip)
+        links.append(net.addLink(host, switches[dpid], port2=port, cls=link_cls, bw=bw, loss=0))
+    return switches, links
+
+
+# names of the links, in the order build_mininet returns them: 'S1-S2' for
+# the link between switches S1 and S2, the host's name for the link of a host
+def link_names(fabric):
+    return ['%d-%d' % (s1, s2) for s1, _, s2, _ in fabric.links] + fabric.host_names
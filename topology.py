@@ -0,0 +1,201 @@
+from array import array
+from bisect import bisect_left
+
+
+# A read-only view of the topology graph.
+# Switches are mapped to dense indices 0..n-1 (so dpids can be sparse or
+# 64-bit) and links are stored in CSR form: the links going out of the switch
+# with index i are targets[offsets[i]:offsets[i+1]], sorted by target index,
+# with their output ports and weights in the same positions of ports and
+# weights. All the arrays are replaced (never modified) when the topology
+# changes, so a snapshot is just a reference to them.
+class TopologySnapshot(object):
+
+    def __init__(self, dpids=None, index=None, offsets=None, targets=None,
+                 ports=None, weights=None):
+        self.dpids = dpids if dpids is not None else array('Q')
+        self.index = index if index is not None else {}
+        self.offsets = offsets if offsets is not None else array('l', [0])
+        self.targets = targets if targets is not None else array('i')
+        self.ports = ports if ports is not None else array('L')
+        self.weights = weights if weights is not None else array('d')
+
+    # makes sure the arrays are up to date, nothing to do for a snapshot
+    def _sync(self):
+        pass
+
+    def __len__(self):
+        self._sync()
+        return len(self.dpids)
+
+    def __contains__(self, dpid):
+        self._sync()
+        return dpid in self.index
+
+    def num_links(self):
+        self._sync()
+        return len(self.targets)
+
+    # list of all switch dpids
+    def switches(self):
+        self._sync()
+        return list(self.dpids)
+
+    # iterates over (neighbor dpid, link weight) tuples of the given switch,
+    # this is the neighbors function used by routing.dijkstra
+    def neighbors(self, dpid):
+        self._sync()
+        i = self.index.get(dpid)
+        if i is None:
+            return
+        dpids, targets, weights = self.dpids, self.targets, self.weights
+        for k in range(self.offsets[i], self.offsets[i + 1]):
+            yield dpids[targets[k]], weights[k]
+
+    # position of the link src->dst in the link arrays, or None
+    def _find(self, src, dst):
+        i = self.index.get(src)
+        j = self.index.get(dst)
+        if i is None or j is None:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        k = bisect_left(self.targets, j, lo, hi)
+        if k < hi and self.targets[k] == j:
+            return k
+        return None
+
+    # output port on src towards dst, or None if they're not linked
+    def port(self, src, dst):
+        self._sync()
+        k = self._find(src, dst)
+        return None if k is None else self.ports[k]
+
+    # weight of the link src->dst, or None if they're not linked
+    def weight(self, src, dst):
+        self._sync()
+        k = self._find(src, dst)
+        return None if k is None else self.weights[k]
+
+    # whether the port of the switch is the source port of one of its links
+    def is_link_port(self, dpid, port):
+        self._sync()
+        i = self.index.get(dpid)
+        if i is None:
+            return False
+        return port in self.ports[self.offsets[i]:self.offsets[i + 1]]
+
+    # iterates over all links as (src dpid, dst dpid, src port, weight) tuples
+    def links(self):
+        self._sync()
+        dpids, offsets = self.dpids, self.offsets
+        for i in range(len(dpids)):
+            for k in range(offsets[i], offsets[i + 1]):
+                yield dpids[i], dpids[self.targets[k]], self.ports[k], self.weights[k]
+
+
+# The topology store used by the controllers.
+# Changes are buffered and the CSR arrays are rebuilt in one O(V + E) pass
+# the next time the topology is read, so a burst of link events costs a
+# single rebuild.
+class Topology(TopologySnapshot):
+
+    def __init__(self):
+        super(Topology, self).__init__()
+        # dpid -> True (added) or False (removed)
+        self._switch_changes = {}
+        # (src dpid, dst dpid) -> (port, weight), or None if removed
+        self._link_changes = {}
+
+    def add_switch(self, dpid):
+        self._switch_changes[dpid] = True
+
+    # removes the switch and all of its links
+    def remove_switch(self, dpid):
+        self._switch_changes[dpid] = False
+
+    # adds (or updates) the directed link src->dst going out of src on 'port',
+    # the switches are added too if they're new
+    def add_link(self, src, dst, port, weight=1):
+        self._switch_changes.setdefault(src, True)
+        self._switch_changes.setdefault(dst, True)
+        self._link_changes[(src, dst)] = (port, weight)
+
+    def remove_link(self, src, dst):
+        self._link_changes[(src, dst)] = None
+
+    # (port, weight) of the link src->dst, or None if they're not linked.
+    # Unlike port() and weight(), the buffered changes are looked at without
+    # rebuilding anything, so this can be called on every link event.
+    def get_link(self, src, dst):
+        if self._switch_changes.get(src) is False or self._switch_changes.get(dst) is False:
+            return None
+        if (src, dst) in self._link_changes:
+            return self._link_changes[(src, dst)]
+        k = self._find(src, dst)
+        return None if k is None else (self.ports[k], self.weights[k])
+
+    # changes the weight of an existing link, without rebuilding anything yet
+    def set_weight(self, src, dst, weight):
+        if (src, dst) in self._link_changes:
+            change = self._link_changes[(src, dst)]
+            if change is not None:
+                self._link_changes[(src, dst)] = (change[0], weight)
+            return
+        k = self._find(src, dst)
+        if k is not None:
+            self._link_changes[(src, dst)] = (self.ports[k], weight)
+
+    # removes all switches and links
+    def clear(self):
+        self._switch_changes = {}
+        self._link_changes = {}
+        TopologySnapshot.__init__(self)
+
+    # returns a read-only view of the current topology which is not affected
+    # by later changes
+    def snapshot(self):
+        self._sync()
+        return TopologySnapshot(self.dpids, self.index, self.offsets,
+                                self.targets, self.ports, self.weights)
+
+    def _sync(self):
+        if self._switch_changes or self._link_changes:
+            self._rebuild()
+
+    def _rebuild(self):
+        switch_changes, link_changes = self._switch_changes, self._link_changes
+        self._switch_changes, self._link_changes = {}, {}
+
+        alive = set(self.dpids)
+        for dpid, added in switch_changes.items():
+            if added:
+                alive.add(dpid)
+            else:
+                alive.discard(dpid)
+
+        # collecting the links that are still there, with the changes applied
+        rows = {}
+        for src, dst, port, weight in TopologySnapshot.links(self):
+            if (src, dst) not in link_changes:
+                rows.setdefault(src, {})[dst] = (port, weight)
+        for (src, dst), value in link_changes.items():
+            if value is not None:
+                rows.setdefault(src, {})[dst] = value
+
+        dpids = array('Q', sorted(alive))
+        index = dict((dpid, i) for i, dpid in enumerate(dpids))
+        offsets = array('l', [0])
+        targets = array('i')
+        ports = array('L')
+        weights = array('d')
+        for dpid in dpids:
+            row = rows.get(dpid, {})
+            for j, dst in sorted((index[dst], dst) for dst in row if dst in index):
+                port, weight = row[dst]
+                targets.append(j)
+                ports.append(port)
+                weights.append(weight)
+            offsets.append(len(targets))
+
+        self.dpids, self.index, self.offsets = dpids, index, offsets
+        self.targets, self.ports, self.weights = targets, ports, weights
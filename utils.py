@@ -1,5 +1,25 @@
+import os
+
 RATIO           = 2
 BANDWIDTH       = [5, 1]
 T_CHBW          = 10 / RATIO
 PORT_CONTROLLER = 6633
-IP_CONTROLLER   = '127.0.0.1'
\ No newline at end of file
+IP_CONTROLLER   = '127.0.0.1'
+# sharded controller instances, listening on PORT_CONTROLLER, PORT_CONTROLLER + 1, ...
+CONTROLLERS     = 1
+# port of the controllers' REST API (ryu-manager --wsapi-port), PORT_REST + i for instance i
+PORT_REST       = 8080
+
+# Settings of the controllers given in the environment of ryu-manager, read
+# here only (both controllers import them):
+# link weights follow the available bandwidth measured by the monitor; with
+# ADAPTIVE_WEIGHTS=0 they stay at 1 (to measure what adaptive routing wins)
+ADAPTIVE_WEIGHTS = os.environ.get('ADAPTIVE_WEIGHTS', '1') != '0'
+# file the monitor appends the link weight changes to (see scenario.py), if set
+WEIGHT_LOG      = os.environ.get('WEIGHT_LOG')
+# capacity of the links in Mbps (and reference bandwidth of the weights),
+# until their real one is set with PUT /links/capacity (see rest.py)
+LINK_CAPACITY   = float(os.environ.get('LINK_CAPACITY', 5))
+# instance SHARD_INDEX of SHARD_COUNT sharded instances (see new_controller.py)
+SHARD_INDEX     = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT     = int(os.environ.get('SHARD_COUNT', 1))
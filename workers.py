@@ -0,0 +1,58 @@
+import multiprocessing
+import time
+
+import routing
+
+
+# Computes shortest path trees in a pool of worker processes.
+# A path table rebuild (or a repair touching many sources) then uses
+# several cores, and the controller's event loop keeps running meanwhile
+# (echo replies, LLDP, the other switches' packet-ins): the sources are
+# split in one chunk per process, each worker computes its chunk's trees on
+# a snapshot of the topology, and 'sleep' is called while the results are
+# not ready (hub.sleep in the controllers, so other greenthreads run).
+# A few sources are not worth the round trip, their trees are computed inline.
+class RouteWorkers(object):
+
+    def __init__(self, topology, processes=2, sleep=time.sleep, min_sources=16,
+                 interval=0.001):
+        self.topology = topology
+        self.processes = processes
+        self.sleep = sleep
+        self.min_sources = min_sources
+        # seconds to sleep between two checks of the results
+        self.interval = interval
+        # the pool is started on first use
+        self.pool = None
+        # number of trees() calls computed by the pool and inline
+        self.pooled = 0
+        self.inline = 0
+
+    # dict mapping each source to its dijkstra (distance, previous) dicts
+    def trees(self, sources):
+        sources = list(sources)
+        snapshot = self.topology.snapshot()
+        if self.processes < 1 or len(sources) < self.min_sources:
+            self.inline += 1
+            return routing.shortest_path_trees(snapshot, sources)
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        self.pooled += 1
+        size = (len(sources) + self.processes - 1) // self.processes
+        chunks = [(snapshot, sources[i:i + size]) for i in range(0, len(sources), size)]
+        result = self.pool.starmap_async(routing.shortest_path_trees, chunks)
+        while not result.ready():
+            self.idle()
+        trees = {}
+        for chunk in result.get():
+            trees.update(chunk)
+        return trees
+
+    # lets the other greenthreads run for a while
+    def idle(self):
+        self.sleep(self.interval)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None